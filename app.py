@@ -1,8 +1,34 @@
+import time
+
+# Inicio del recorrido del script, para los tiempos de arranque (ver arranque.py)
+INICIO_SCRIPT = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
+import bisect
 import sqlite3
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-import plotly.express as px
+
+import aproximado
+import arranque
+import categorias
+import comparacion
+import ingesta
+import motores
+import paralelo
+import preparacion
+import procesamiento
+from procesamiento import validar_registros
+from esquema import reporte_rechazos
+from cache_compartido import ConjuntoDatos, RegistroDatasets, VistasClientes
+
+# plotly se importa al dibujar el primer gráfico, no al arrancar
+px = arranque.importar_diferido("plotly.express")
+FIN_IMPORTACIONES = time.perf_counter()
 
 # =====================================
 # Configuración de la Página
@@ -66,191 +92,252 @@ st.title("📊 Dashboard de Clientes y Unidades")
 # Funciones Auxiliares
 # =====================================
 
-def cargar_datos(db_file, costos_file):
-    """Carga y valida los datos desde la base de datos y el archivo de costos."""
-    datos = {}
+@st.cache_resource
+def obtener_registro():
+    """Registro de datos compartido por todas las sesiones del proceso."""
+    limite_mb = int(os.environ.get("LUC_CACHE_MEMORIA_MB", "1024"))
+    ttl_min = int(os.environ.get("LUC_CACHE_TTL_MIN", "30"))
+    return RegistroDatasets(limite_mb * 1024 * 1024, ttl_min * 60)
+
+@st.cache_resource
+def obtener_motor():
+    """Motor de análisis compartido (LUC_MOTOR: pandas o duckdb). Si no está disponible se usa pandas."""
+    try:
+        return motores.obtener_motor()
+    except ValueError:
+        return motores.MotorPandas()
+
+@st.cache_resource
+def obtener_tiempos_arranque():
+    """Tiempos del primer recorrido del script en este proceso."""
+    return arranque.TiemposArranque(INICIO_SCRIPT, arranque.directorio_arranque() / "tiempos.jsonl")
+
+@st.cache_resource
+def obtener_instantanea():
+    """Instantánea en disco del último conjunto usado (arranque en caliente)."""
+    return arranque.InstantaneaArranque(arranque.directorio_arranque())
+
+@st.cache_resource
+def iniciar_precarga():
+    """Al arrancar el proceso, precarga en segundo plano el último conjunto (LUC_ARRANQUE_EN_CALIENTE)."""
+    if not arranque.en_caliente_activado():
+        return None
+    instantanea = obtener_instantanea()
+    metadatos = instantanea.metadatos()
+    if metadatos is None:
+        return None
+    
+    registro = obtener_registro()
+    clave = metadatos['clave']
     
-    # Cargar base de datos
-    if db_file:
-        temp_path = Path("temp_db.db")
+    def precargar():
+        inicio = time.perf_counter()
         try:
-            with open(temp_path, "wb") as f:
-                f.write(db_file.read())  # Corregido: usar read() en lugar de getvalue()
-            conn = sqlite3.connect(temp_path)
-            datos['conn'] = conn
-            datos['temp_path'] = temp_path
-            st.success("✅ Base de datos cargada correctamente")
+            if registro.precargar(clave, lambda: instantanea.cargar(clave, ruta_copia_db(clave))):
+                arranque.logger.info("Último conjunto precargado en %.2fs", time.perf_counter() - inicio)
         except Exception as e:
-            st.error(f"❌ Error al cargar la base de datos: {str(e)}")
-            datos['conn'] = None
-            datos['temp_path'] = None
-    else:
-        datos['conn'] = None
-        datos['temp_path'] = None
+            arranque.logger.warning("No se pudo precargar el último conjunto: %s", e)
     
-    # Cargar archivo de costos
-    if costos_file:
-        try:
-            # Cargar el archivo Excel
-            df_costos = pd.read_excel(costos_file)
-            
-            # Limpiar nombres de columnas
-            df_costos.columns = [str(col).strip() for col in df_costos.columns]
-            
-            columnas_requeridas = ['Cuenta', 'Usuario', 'Nombre Comercial', 'Costo', 'Tipo', 'Observaciones']
-            if not all(col in df_costos.columns for col in columnas_requeridas):
-                st.error("❌ El archivo de costos no tiene el formato esperado. Debe contener las columnas: " + ", ".join(columnas_requeridas))
-                datos['df_costos'] = None
+    hilo = threading.Thread(target=precargar, name="precarga-arranque", daemon=True)
+    hilo.start()
+    return hilo
+
+def clave_contenido(db_file, costos_file):
+    """Hash del contenido de los archivos subidos (identifica el conjunto de datos).
+
+    Es la misma clave que calcula la ingesta; la base se lee por trozos.
+    """
+    h = ingesta.copiar_con_hash(db_file)
+    h.update(b"\0")
+    if costos_file is not None:
+        h.update(costos_file.getvalue())
+    return h.hexdigest()
+
+def directorio_copias():
+    """Directorio con las copias locales de las bases subidas."""
+    directorio = Path(tempfile.gettempdir()) / "luc_app"
+    directorio.mkdir(exist_ok=True)
+    return directorio
+
+def ruta_copia_db(clave):
+    """Copia local de la base subida, compartida por las sesiones mientras el conjunto esté en caché."""
+    return directorio_copias() / f"{clave}.db"
+
+def clave_recordada(db_file, costos_file):
+    """Clave de los archivos subidos si ya se calculó en esta sesión (None si no).
+
+    Se recuerda mientras no cambien los archivos (su file_id), así que los
+    recorridos siguientes del script no vuelven a leer la base.
+    """
+    subida = (getattr(db_file, 'file_id', None), getattr(costos_file, 'file_id', None))
+    anterior = st.session_state.get('clave_subida')
+    if subida[0] is not None and anterior is not None and anterior[0] == subida:
+        return anterior[1]
+    return None
+
+def recordar_clave(db_file, costos_file, clave):
+    """Guarda en la sesión la clave de los archivos subidos (ver clave_recordada)."""
+    subida = (getattr(db_file, 'file_id', None), getattr(costos_file, 'file_id', None))
+    st.session_state['clave_subida'] = (subida, clave)
+
+def ruta_base_trabajo(clave):
+    """Base de trabajo (índices y resúmenes) de un conjunto; se conserva entre reinicios."""
+    directorio = Path(os.environ.get("LUC_DIR_TRABAJO", Path(tempfile.gettempdir()) / "luc_app" / "trabajo"))
+    return directorio / f"{clave}.db"
+
+def ruta_resumen_snapshot(clave):
+    """Directorio con el resumen Parquet de un snapshot; se conserva entre reinicios."""
+    directorio = Path(os.environ.get("LUC_DIR_TRABAJO", Path(tempfile.gettempdir()) / "luc_app" / "trabajo"))
+    return directorio / "snapshots" / clave
+
+@st.cache_data(show_spinner=False)
+def leer_resumen_snapshot(directorio):
+    """Resumen de un snapshot ya procesado (cacheado por directorio)."""
+    return comparacion.leer_resumen(directorio)
+
+def usar_base_trabajo(conjunto, clave):
+    """Prepara (si hace falta) la base de trabajo y toma de ella los resúmenes materializados."""
+    if conjunto.base_trabajo is not None:
+        return
+    
+    ruta = ruta_base_trabajo(clave)
+    if not preparacion.esta_preparada(ruta, clave):
+        if conjunto.ruta_db is None:
+            # Conjunto abierto desde la instantánea de arranque, sin la base original
+            st.info("ℹ️ Para preparar la base de trabajo vuelva a subir la base de datos.")
+            return
+        with st.spinner("⚙️ Creando índices y resúmenes de la base de trabajo..."):
+            preparacion.preparar_base(conjunto.ruta_db, conjunto.tabla, ruta, clave, conjunto.df_validos)
+    
+    conjunto.sembrar(preparacion.leer_resumenes(ruta))
+    conjunto.base_trabajo = ruta
+
+def mostrar_costos_cargados(resultado):
+    """Muestra el resultado de la carga del archivo de costos."""
+    df_costos = resultado['df_costos']
+    costos_rechazados = resultado['rechazados']
+    st.success(f"✅ Archivo de costos cargado correctamente ({resultado['segundos']:.1f}s)")
+    
+    if not costos_rechazados.empty:
+        st.warning(f"⚠️ {len(costos_rechazados):,} filas del archivo de costos fueron rechazadas")
+        st.dataframe(reporte_rechazos(costos_rechazados), hide_index=True)
+    
+    # Historial de precios y monedas
+    versiones = df_costos.groupby('Cuenta').size()
+    if (versiones > 1).any():
+        st.info(f"🕒 {int((versiones > 1).sum()):,} cuentas con historial de precios: se aplica el costo vigente a la fecha de desactivación de cada unidad")
+    monedas = sorted(df_costos['Moneda'].dropna().unique()) if 'Moneda' in df_costos.columns else []
+    if len(monedas) > 1 or (monedas and monedas[0] != procesamiento.MONEDA_BASE):
+        st.info(f"💱 Monedas: {', '.join(monedas)}. Los costos se muestran convertidos a {procesamiento.MONEDA_BASE}")
+    
+    # Mostrar información de las columnas para depuración
+    st.write("Información de las columnas cargadas:")
+    for col in df_costos.columns:
+        st.write(f"- {col}: {df_costos[col].dtype}")
+        if col == 'Costo':
+            st.write(f"  Rango de valores: {df_costos[col].min()} a {df_costos[col].max()}")
+
+def cargar_datos(db_file, costos_file):
+    """Carga y valida los datos desde la base de datos y el archivo de costos.
+    
+    La base (copiar calculando la clave del conjunto, listar tablas y revisar
+    columnas) y el Excel de costos se procesan en paralelo; cada resultado se
+    informa apenas termina.
+    """
+    datos = {'conn': None, 'temp_path': None, 'tabla': None, 'df_costos': None, 'clave': None}
+    if not db_file:
+        return datos
+    
+    eventos = ingesta.ingerir(
+        db_file,
+        directorio_copias(),
+        costos_file.getvalue() if costos_file else None
+    )
+    for nombre, resultado, error in eventos:
+        if nombre == 'db':
+            if error is None:
+                datos['clave'] = resultado['clave']
+                datos['temp_path'] = Path(resultado['ruta_db'])
+                datos['conn'] = sqlite3.connect(datos['temp_path'])
+                datos['tabla'] = resultado['tabla']
+                st.success(f"✅ Base de datos cargada correctamente ({resultado['segundos']:.1f}s)")
+            elif isinstance(error, ValueError):
+                st.error(f"❌ {str(error)}")
             else:
-                # Asegurar que la columna Costo sea numérica
-                try:
-                    # Convertir la columna Costo a string primero para manejar cualquier tipo de dato
-                    df_costos['Costo'] = df_costos['Costo'].astype(str)
-                    
-                    # Limpiar la columna de caracteres especiales
-                    df_costos['Costo'] = df_costos['Costo'].str.replace('$', '', regex=False)
-                    df_costos['Costo'] = df_costos['Costo'].str.replace(',', '', regex=False)
-                    df_costos['Costo'] = df_costos['Costo'].str.strip()
-                    
-                    # Convertir a numérico
-                    df_costos['Costo'] = pd.to_numeric(df_costos['Costo'], errors='coerce')
-                    
-                    # Limpiar otros campos
-                    df_costos['Cuenta'] = df_costos['Cuenta'].astype(str).str.strip()
-                    df_costos['Tipo'] = df_costos['Tipo'].fillna('Mensual')
-                    
-                    # Eliminar filas donde el costo es nulo o negativo
-                    df_costos = df_costos[df_costos['Costo'].notna() & (df_costos['Costo'] >= 0)]
-                    
-                    datos['df_costos'] = df_costos
-                    st.success("✅ Archivo de costos cargado correctamente")
-                    
-                    # Mostrar información de las columnas para depuración
-                    st.write("Información de las columnas cargadas:")
-                    for col in df_costos.columns:
-                        st.write(f"- {col}: {df_costos[col].dtype}")
-                        if col == 'Costo':
-                            st.write(f"  Rango de valores: {df_costos[col].min()} a {df_costos[col].max()}")
-                    
-                except Exception as e:
-                    st.error(f"❌ Error al procesar la columna de costos: {str(e)}")
-                    st.write("Muestra de los datos problemáticos:")
-                    st.write(df_costos[['Cuenta', 'Costo']].head())
-                    datos['df_costos'] = None
-        except Exception as e:
-            st.error(f"❌ Error al cargar el archivo de costos: {str(e)}")
-            datos['df_costos'] = None
-    else:
-        datos['df_costos'] = None
+                st.error(f"❌ Error al cargar la base de datos: {str(error)}")
+        else:
+            if error is None:
+                datos['df_costos'] = resultado['df_costos']
+                mostrar_costos_cargados(resultado)
+            elif isinstance(error, ValueError):
+                st.error(f"❌ {str(error)}")
+            else:
+                st.error(f"❌ Error al cargar el archivo de costos: {str(error)}")
     
     return datos
 
-def obtener_tablas(conn):
-    """Obtiene la lista de tablas de la base de datos."""
-    tablas_query = "SELECT name FROM sqlite_master WHERE type='table'"
-    tablas = pd.read_sql_query(tablas_query, conn)['name'].tolist()
-    return tablas
-
 def cargar_datos_tabla(conn, tabla):
     """Carga los datos de una tabla específica y filtra filas vacías."""
-    columnas_query = f"PRAGMA table_info({tabla})"
-    columnas = pd.read_sql_query(columnas_query, conn)
-    columnas_disponibles = columnas['name'].tolist()
+    try:
+        df = procesamiento.leer_tabla(conn, tabla)
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
+        return None
+    except Exception as e:
+        st.error(f"❌ Error al cargar los datos de la tabla: {str(e)}")
+        return None
     
-    columnas_requeridas = ['Cliente_Cuenta', 'Nombre', 'Fecha_de_Desactivacion', 'Origen']
-    if all(col in columnas_disponibles for col in columnas_requeridas):
-        try:
-            df = pd.read_sql_query(f"""
-                SELECT Cliente_Cuenta, Nombre, Fecha_de_Desactivacion, Origen
-                FROM {tabla}
-                WHERE Cliente_Cuenta IS NOT NULL 
-                AND Cliente_Cuenta != ''
-                AND Nombre IS NOT NULL 
-                AND Nombre != ''
-            """, conn)
-            
-            # Asegurarse de que las columnas son de tipo string antes de aplicar str.strip()
-            df['Cliente_Cuenta'] = df['Cliente_Cuenta'].astype(str)
-            df['Nombre'] = df['Nombre'].astype(str)
-            
-            # Eliminar filas con valores vacíos o nulos en columnas críticas
-            df = df.dropna(subset=['Cliente_Cuenta', 'Nombre'])
-            
-            # Limpiar espacios en blanco
-            df['Cliente_Cuenta'] = df['Cliente_Cuenta'].str.strip()
-            df['Nombre'] = df['Nombre'].str.strip()
-            
-            # Verificar si hay datos después de la limpieza
-            if df.empty:
-                st.error("❌ No hay datos válidos después de filtrar filas vacías.")
-                return None
-                
-            return df
-        except Exception as e:
-            st.error(f"❌ Error al cargar los datos de la tabla: {str(e)}")
-            return None
-    else:
-        st.error("❌ La tabla seleccionada no contiene las columnas necesarias para el análisis: " + ", ".join(columnas_requeridas))
+    # Verificar si la tabla tiene datos
+    if df.empty:
+        st.error("❌ La tabla seleccionada no contiene registros.")
         return None
+    
+    return df
 
-def validar_registros(df):
-    """Valida los registros basados en Cliente_Cuenta."""
-    df['Es_Valido'] = df['Cliente_Cuenta'].notna() & (df['Cliente_Cuenta'] != '') & (df['Cliente_Cuenta'] != '0')
-    df_validos = df[df['Es_Valido']].copy()
-    df_validos['Estado'] = df_validos['Fecha_de_Desactivacion'].isna().map({True: 'Activada', False: 'Desactivada'})
-    return df_validos
+def memoria_reservada():
+    """Bytes del presupuesto de memoria que ya ocupan la caché compartida y el pool de procesos."""
+    reservado = obtener_registro().memoria_usada
+    procesos = paralelo.procesos_por_defecto()
+    if procesos >= 2:
+        reservado += paralelo.memoria_pool_bytes(procesos)
+    return reservado
+
+def planificar_carga(conn, tabla, df_costos):
+    """Elige la estrategia de carga según el presupuesto de memoria (LUC_MEMORIA_MB)."""
+    try:
+        return procesamiento.planificar_carga(conn, tabla, df_costos, reservado=memoria_reservada())
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
+        return None
+    except Exception as e:
+        st.error(f"❌ Error al estimar la memoria necesaria: {str(e)}")
+        return None
+
+def cargar_por_bloques(conn, tabla, plan, df_costos):
+    """Carga, valida e integra costos bloque por bloque. Devuelve (total_registros, df_validos, diagnostico) o None."""
+    try:
+        return procesamiento.cargar_por_bloques(conn, tabla, plan, df_costos)
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
+        return None
+    except Exception as e:
+        st.error(f"❌ Error al cargar los datos por bloques: {str(e)}")
+        return None
 
 def integrar_costos(df_validos, df_costos):
     """Integra la información de costos al DataFrame de registros válidos."""
+    # Verificar que df_costos no sea None
+    if df_costos is None:
+        st.warning("No hay datos de costos disponibles para integrar.")
+        return df_validos
+    
     try:
-        # Verificar que df_costos no sea None
-        if df_costos is None:
-            st.warning("No hay datos de costos disponibles para integrar.")
-            return df_validos
-            
-        # Verificar que las columnas necesarias existan
-        columnas_requeridas = ['Cuenta', 'Costo', 'Tipo']
-        if not all(col in df_costos.columns for col in columnas_requeridas):
-            st.error(f"❌ Error: Columnas faltantes en df_costos. Columnas requeridas: {columnas_requeridas}")
-            st.write("Columnas disponibles en df_costos:")
-            st.write(list(df_costos.columns))
-            return df_validos
-            
-        # Realizar la fusión con manejo de errores
-        df_validos = df_validos.merge(
-            df_costos[columnas_requeridas],
-            left_on='Cliente_Cuenta',
-            right_on='Cuenta',
-            how='left'
-        )
-        
-        # Validar y limpiar datos de costo
-        df_validos['Costo'] = pd.to_numeric(df_validos['Costo'], errors='coerce')
-        df_validos.loc[df_validos['Costo'] < 0, 'Costo'] = None
-        
-        # Calcular costo mensual con manejo de casos inválidos
-        def normalizar_costo_mensual(row):
-            if pd.isna(row['Tipo']) or pd.isna(row['Costo']):
-                return row['Costo']
-            tipo = row['Tipo'].lower() if isinstance(row['Tipo'], str) else ''
-            if tipo == 'semestral':
-                return row['Costo'] / 6
-            elif tipo == 'anual':
-                return row['Costo'] / 12
-            elif tipo == 'mensual':
-                return row['Costo']
-            else:
-                return None  # Tipo de facturación inválido
-        
-        df_validos['Costo_Mensual'] = df_validos.apply(normalizar_costo_mensual, axis=1)
-        df_validos['Ciclo_Facturacion'] = df_validos['Tipo'].fillna('No especificado')
-        
-        # Calcular métricas adicionales
-        df_validos['Perdida_Por_Desactivacion'] = df_validos.apply(
-            lambda x: x['Costo_Mensual'] if x['Estado'] == 'Desactivada' else 0, 
-            axis=1
-        )
-        
+        return procesamiento.integrar_costos(df_validos, df_costos)
+    
+    except ValueError as e:
+        st.error(f"❌ Error: {str(e)}")
+        st.write("Columnas disponibles en df_costos:")
+        st.write(list(df_costos.columns))
         return df_validos
         
     except Exception as e:
@@ -262,10 +349,10 @@ def integrar_costos(df_validos, df_costos):
         st.write(df_costos.head())
         return df_validos
 
-def mostrar_metricas_validacion(df, df_validos):
+def mostrar_metricas_validacion(conjunto):
     """Muestra las métricas de validación de registros."""
-    total_registros = len(df)
-    registros_validos = len(df_validos)
+    total_registros = conjunto.total_registros
+    registros_validos = conjunto.registros_validos
     registros_invalidos = total_registros - registros_validos
     
     st.markdown("### 🔍 Validación de Registros")
@@ -293,58 +380,116 @@ def mostrar_metricas_validacion(df, df_validos):
             "❌ Registros Inválidos",
             f"{registros_invalidos:,}",
             f"{porcentaje_invalidos:.1f}%",
-            help="Registros sin Cliente_Cuenta válido"
+            help="Registros rechazados por las reglas de limpieza (Cliente_Cuenta vacío o '0', fechas inválidas, ...)"
         )
     
-    if registros_invalidos > 0:
+    diagnostico = conjunto.diagnostico
+    if not diagnostico.vacio:
         with st.expander("📋 Ver Registros Inválidos"):
+            st.markdown("**Registros rechazados por motivo:**")
             st.dataframe(
-                df[~df['Es_Valido']],
+                conjunto.agregado('reporte_rechazos', diagnostico.reporte),
                 column_config={
-                    "Cliente_Cuenta": "ID Cliente",
-                    "Nombre": "Nombre",
-                    "Origen": "Plataforma",
-                    "Fecha_de_Desactivacion": "Fecha Desactivación"
+                    "Registros": st.column_config.NumberColumn("Registros", format="%d")
                 },
                 hide_index=True
             )
+            
+            columnas_invalidos = {
+                "Cliente_Cuenta": "ID Cliente",
+                "Nombre": "Nombre",
+                "Origen": "Plataforma",
+                "Fecha_de_Desactivacion": "Fecha Desactivación"
+            }
+            
+            # La lista completa se relee de SQLite solo cuando se pide
+            lista_completa = False
+            if conjunto.ruta_db is not None and len(diagnostico.muestra) < diagnostico.total:
+                lista_completa = st.toggle(
+                    f"Cargar los {diagnostico.total:,} registros inválidos",
+                    key="lista_completa_invalidos_toggle"
+                )
+            
+            if lista_completa:
+                conn = sqlite3.connect(Path(conjunto.ruta_db).as_uri() + "?mode=ro", uri=True)
+                try:
+                    df_invalidos = procesamiento.leer_registros_rechazados(
+                        conn, conjunto.tabla, diagnostico.identificadores
+                    )
+                finally:
+                    conn.close()
+            else:
+                df_invalidos = diagnostico.muestra_ordenada()
+                if len(df_invalidos) < diagnostico.total:
+                    st.caption(f"Muestra aleatoria de {len(df_invalidos):,} de {diagnostico.total:,} registros inválidos")
+            
+            st.dataframe(
+                df_invalidos,
+                column_config=columnas_invalidos,
+                hide_index=True
+            )
     
     st.markdown("---")
 
-def resumen_unidades_por_plataforma(df_validos, unique_suffix=""):
+def resumen_estimado(conjunto):
+    """Resumen por plataforma estimado sobre una muestra estratificada (modo aproximado)."""
+    # Estratos y bosquejo de clientes ya calculados: no se vuelve a recorrer cada registro
+    estimadores = conjunto.agregado(
+        'bosquejo_clientes',
+        lambda: aproximado.bosquejo_clientes(conjunto.df_validos, estratos=conjunto.estratos)
+    )
+    return conjunto.agregado(
+        'resumen_aproximado',
+        lambda: aproximado.resumen_aproximado(conjunto.df_validos, estratos=conjunto.estratos, estimadores=estimadores)
+    )
+
+def calcular_exactos_en_segundo_plano(conjunto):
+    """Lanza en segundo plano el cálculo exacto de las cifras que el modo aproximado estima."""
+    df_validos = conjunto.df_validos
+    # El motor se obtiene aquí: los hilos en segundo plano no tienen contexto de Streamlit
+    motor = obtener_motor()
+    conjunto.calcular_en_segundo_plano(
+        'resumen_plataformas',
+        lambda: motor.resumen_plataformas(df_validos)
+    )
+    for plataforma in conjunto.plataformas:
+        conjunto.calcular_en_segundo_plano(
+            ('metricas_plataforma', plataforma),
+            lambda plataforma=plataforma: motor.metricas_plataforma(conjunto.plataforma(plataforma))
+        )
+
+def mostrar_aviso_aproximado(conjunto, df_resumen, unique_suffix=""):
+    """Indica que las cifras son aproximadas y ofrece calcular las exactas."""
+    muestra = int(df_resumen.loc[df_resumen['Plataforma'] == 'TOTAL', 'Unidades en Muestra'].iloc[0])
+    st.warning(
+        f"≈ **Valores aproximados.** Estimados sobre una muestra estratificada por plataforma de "
+        f"{muestra:,} unidades ({muestra / conjunto.registros_validos * 100:.1f}%), con márgenes de error al 95%. "
+        "Los totales de unidades son exactos; los clientes únicos se estiman con HyperLogLog (error típico ~1%). "
+        "Los tops de clientes, la distribución por tamaño y los análisis por cliente siempre son exactos."
+    )
+    if conjunto.en_curso('resumen_plataformas'):
+        st.info("⏳ Calculando los valores exactos en segundo plano; se mostrarán en la próxima interacción.")
+        st.button("🔄 Actualizar", key=f"actualizar_exactos_button_{unique_suffix}")
+    elif st.button("🎯 Calcular valores exactos", key=f"calcular_exactos_button_{unique_suffix}"):
+        calcular_exactos_en_segundo_plano(conjunto)
+        st.info("⏳ Calculando los valores exactos en segundo plano; se mostrarán en la próxima interacción.")
+
+def resumen_unidades_por_plataforma(conjunto, unique_suffix="", modo_aproximado=False):
     """Crea y muestra un resumen de unidades por plataforma."""
     st.markdown("#### 📊 Resumen de Unidades por Plataforma")
     
-    plataformas = sorted(df_validos['Origen'].unique())
-    resumen_plataformas = []
-
-    for plataforma in plataformas:
-        df_plat = df_validos[df_validos['Origen'] == plataforma]
-        activas = df_plat[df_plat['Estado'] == 'Activada'].shape[0]
-        desactivadas = df_plat[df_plat['Estado'] == 'Desactivada'].shape[0]
-        total = len(df_plat)
-        
-        resumen_plataformas.append({
-            'Plataforma': plataforma,
-            'Unidades Activas': activas,
-            'Unidades Desactivadas': desactivadas,
-            'Total Unidades': total,
-            '% Activas': (activas / total * 100) if total > 0 else 0,
-            'Clientes Únicos': df_plat['Cliente_Cuenta'].nunique()
-        })
-    
-    df_resumen = pd.DataFrame(resumen_plataformas)
-    
-    # Agregar fila de totales
-    totales = {
-        'Plataforma': 'TOTAL',
-        'Unidades Activas': df_resumen['Unidades Activas'].sum(),
-        'Unidades Desactivadas': df_resumen['Unidades Desactivadas'].sum(),
-        'Total Unidades': df_resumen['Total Unidades'].sum(),
-        '% Activas': (df_resumen['Unidades Activas'].sum() / df_resumen['Total Unidades'].sum() * 100) if df_resumen['Total Unidades'].sum() > 0 else 0,
-        'Clientes Únicos': df_validos['Cliente_Cuenta'].nunique()
-    }
-    df_resumen = pd.concat([df_resumen, pd.DataFrame([totales])], ignore_index=True)
+    plataformas = conjunto.plataformas
+    # En modo aproximado se usan las estimaciones hasta que el cálculo exacto esté disponible
+    estimado = modo_aproximado and not conjunto.disponible('resumen_plataformas')
+    if estimado:
+        df_resumen = resumen_estimado(conjunto)
+        mostrar_aviso_aproximado(conjunto, df_resumen, unique_suffix)
+    else:
+        df_resumen = conjunto.agregado(
+            'resumen_plataformas',
+            lambda: obtener_motor().resumen_plataformas(conjunto.df_validos)
+        )
+    prefijo = "≈ " if estimado else ""
     
     # Mostrar tabla de resumen
     st.dataframe(
@@ -356,12 +501,12 @@ def resumen_unidades_por_plataforma(df_validos, unique_suffix=""):
                 help="Plataforma de origen"
             ),
             "Unidades Activas": st.column_config.NumberColumn(
-                "Unidades Activas",
+                f"{prefijo}Unidades Activas",
                 format="%d",
                 help="Número de unidades activas"
             ),
             "Unidades Desactivadas": st.column_config.NumberColumn(
-                "Unidades Desactivadas",
+                f"{prefijo}Unidades Desactivadas",
                 format="%d",
                 help="Número de unidades desactivadas"
             ),
@@ -371,17 +516,24 @@ def resumen_unidades_por_plataforma(df_validos, unique_suffix=""):
                 help="Total de unidades en la plataforma"
             ),
             "% Activas": st.column_config.ProgressColumn(
-                "% Activas",
+                f"{prefijo}% Activas",
                 format="%.1f%%",
                 min_value=0,
                 max_value=100,
                 help="Porcentaje de unidades activas"
             ),
             "Clientes Únicos": st.column_config.NumberColumn(
-                "Clientes Únicos",
+                f"{prefijo}Clientes Únicos",
                 format="%d",
                 help="Número de clientes únicos"
-            )
+            ),
+            "± % Activas": st.column_config.NumberColumn("± % Activas", format="%.2f", help="Margen de error al 95% (puntos porcentuales)"),
+            "% Desactivadas": st.column_config.NumberColumn(f"{prefijo}% Desactivadas", format="%.1f%%"),
+            "Unidades en Muestra": st.column_config.NumberColumn("Unidades en Muestra", format="%d"),
+            "Facturación Mensual": st.column_config.NumberColumn(f"{prefijo}Facturación Mensual", format="$%.2f"),
+            "± Facturación Mensual": st.column_config.NumberColumn("± Facturación Mensual", format="$%.2f"),
+            "Costo Promedio por Unidad": st.column_config.NumberColumn(f"{prefijo}Costo Promedio por Unidad", format="$%.2f"),
+            "± Costo Promedio por Unidad": st.column_config.NumberColumn("± Costo Promedio por Unidad", format="$%.2f")
         },
         hide_index=True,
         use_container_width=True
@@ -420,44 +572,81 @@ def resumen_unidades_por_plataforma(df_validos, unique_suffix=""):
     st.markdown("---")
     return plataformas
 
-def detalles_por_plataforma(df_validos, plataformas, df_costos):
+def seleccionar_limites_tamano(maximo_unidades):
+    """Controles para los límites de las categorías de tamaño. Devuelve una tupla creciente."""
+    nombres = categorias.NOMBRES_TAMANO
+    tope = max(maximo_unidades, categorias.LIMITES_TAMANO[-1]) + 1
+    with st.expander("⚙️ Límites de Categorías de Tamaño"):
+        columnas = st.columns(len(categorias.LIMITES_TAMANO))
+        limites = []
+        for i, (columna, defecto) in enumerate(zip(columnas, categorias.LIMITES_TAMANO)):
+            with columna:
+                limites.append(st.slider(
+                    f"{nombres[i + 1]} desde (unidades)",
+                    min_value=2,
+                    max_value=tope,
+                    value=defecto,
+                    key=f"limite_tamano_slider_{i}"
+                ))
+        if limites != sorted(set(limites)):
+            st.warning("⚠️ Los límites deben ser estrictamente crecientes; se usarán los valores por defecto.")
+            return categorias.LIMITES_TAMANO
+    return tuple(limites)
+
+def detalles_por_plataforma(conjunto, plataformas, modo_aproximado=False):
     """Muestra detalles detallados por plataforma."""
     st.markdown("##### 📑 Detalles por Plataforma (Solo Registros Válidos)")
     
+    # Límites de tamaño de cliente; al moverlos solo se reclasifican los conteos ya calculados
+    conteos = conjunto.agregado('conteos_por_cliente', lambda: categorias.conteos_por_cliente(conjunto.df_validos))
+    limites = seleccionar_limites_tamano(int(conteos['Total_Unidades'].max()))
+    distribucion = conjunto.agregado(
+        ('distribucion_tamano', limites),
+        lambda: categorias.distribucion_tamano(conteos, limites)
+    )
+    
     for plataforma in plataformas:
         with st.expander(f"📱 {plataforma} - Análisis Detallado"):
-            df_plat = df_validos[df_validos['Origen'] == plataforma]
+            df_plat = conjunto.plataforma(plataforma)
             
             # Columnas para métricas y gráficos
             col1, col2, col3 = st.columns([1, 1, 1])
             
             # Métricas Generales
             with col1:
-                total_plat = len(df_plat)
-                activas_plat = df_plat[df_plat['Estado'] == 'Activada'].shape[0]
-                desactivadas_plat = df_plat[df_plat['Estado'] == 'Desactivada'].shape[0]
-                clientes_unicos = df_plat['Cliente_Cuenta'].nunique()
-                promedio_unidades_cliente = (total_plat / clientes_unicos) if clientes_unicos > 0 else 0
+                estimado = modo_aproximado and not conjunto.disponible(('metricas_plataforma', plataforma))
+                if estimado:
+                    metricas = aproximado.metricas_aproximadas(resumen_estimado(conjunto), plataforma)
+                else:
+                    metricas = conjunto.agregado(
+                        ('metricas_plataforma', plataforma),
+                        lambda: obtener_motor().metricas_plataforma(df_plat)
+                    )
+                prefijo = "≈ " if estimado else ""
+                total_plat = metricas['Total Unidades']
+                activas_plat = metricas['Unidades Activas']
+                desactivadas_plat = metricas['Unidades Desactivadas']
+                clientes_unicos = metricas['Clientes Únicos']
+                promedio_unidades_cliente = metricas['Promedio Unidades/Cliente']
                 
-                st.markdown("**📊 Métricas Generales:**")
+                st.markdown("**📊 Métricas Generales (≈ aproximadas):**" if estimado else "**📊 Métricas Generales:**")
                 st.markdown(f"""
                 - 📦 Total Unidades: **{total_plat:,}**
-                - ✅ Unidades Activas: **{activas_plat:,}** ({(activas_plat/total_plat*100):.1f}%)
-                - ❌ Unidades Desactivadas: **{desactivadas_plat:,}** ({(desactivadas_plat/total_plat*100):.1f}%)
-                - 👥 Clientes Únicos: **{clientes_unicos:,}**
-                - 📈 Promedio Unidades/Cliente: **{promedio_unidades_cliente:.2f}**
+                - ✅ Unidades Activas: **{prefijo}{activas_plat:,}** ({(activas_plat/total_plat*100):.1f}%)
+                - ❌ Unidades Desactivadas: **{prefijo}{desactivadas_plat:,}** ({(desactivadas_plat/total_plat*100):.1f}%)
+                - 👥 Clientes Únicos: **{prefijo}{clientes_unicos:,}**
+                - 📈 Promedio Unidades/Cliente: **{prefijo}{promedio_unidades_cliente:.2f}**
                 """)
                 
                 # Métricas de Facturación
                 if 'Costo_Mensual' in df_plat.columns:
-                    df_activas = df_plat[df_plat['Estado'] == 'Activada']
-                    facturacion_mensual = df_activas['Costo_Mensual'].sum()
-                    promedio_costo = df_activas['Costo_Mensual'].mean()
+                    facturacion_mensual = metricas['Facturación Mensual']
+                    promedio_costo = metricas['Costo Promedio por Unidad']
                     
                     st.markdown("**💰 Métricas de Facturación:**")
                     st.markdown(f"""
-                    - 💵 Facturación Mensual Total: **${facturacion_mensual:,.2f}**
-                    - 📊 Costo Promedio por Unidad: **${promedio_costo:,.2f}**
+                    - 💵 Facturación Mensual Total: **{prefijo}${facturacion_mensual:,.2f}**
+                    - 📊 Costo Promedio por Unidad: **{prefijo}${promedio_costo:,.2f}**
                     """)
                     
                     # Ciclos de Facturación
@@ -482,12 +671,11 @@ def detalles_por_plataforma(df_validos, plataformas, df_costos):
             # Tendencia de Desactivaciones
             with col3:
                 if 'Fecha_de_Desactivacion' in df_plat.columns:
-                    df_temporal = df_plat[df_plat['Fecha_de_Desactivacion'].notna()].copy()
-                    if not df_temporal.empty:
-                        df_temporal['Fecha_de_Desactivacion'] = pd.to_datetime(df_temporal['Fecha_de_Desactivacion'], errors='coerce')
-                        df_temporal['Mes'] = df_temporal['Fecha_de_Desactivacion'].dt.to_period('M')
-                        desactivaciones = df_temporal.groupby('Mes').size().reset_index(name='Cantidad')
-                        desactivaciones['Mes'] = desactivaciones['Mes'].astype(str)
+                    if df_plat['Fecha_de_Desactivacion'].notna().any():
+                        desactivaciones = conjunto.agregado(
+                            ('desactivaciones_por_mes', plataforma),
+                            lambda: obtener_motor().desactivaciones_por_mes(df_plat)
+                        )
                         
                         fig_trend = px.line(
                             desactivaciones,
@@ -505,14 +693,10 @@ def detalles_por_plataforma(df_validos, plataformas, df_costos):
             
             # Top 10 Clientes por Total de Unidades
             with col1:
-                top_clientes = df_plat.groupby('Cliente_Cuenta').agg({
-                    'Nombre': 'count',
-                    'Estado': lambda x: (x == 'Activada').sum()
-                }).reset_index()
-                
-                top_clientes.columns = ['Cliente', 'Total Unidades', 'Unidades Activas']
-                top_clientes['% Activas'] = (top_clientes['Unidades Activas'] / top_clientes['Total Unidades'] * 100).round(1)
-                top_clientes = top_clientes.sort_values('Total Unidades', ascending=False).head(10)
+                top_clientes = conjunto.agregado(
+                    ('top_clientes_plataforma', plataforma),
+                    lambda: obtener_motor().top_clientes_plataforma(df_plat)
+                )
                 
                 st.markdown("**📈 Top 10 Clientes por Total de Unidades:**")
                 st.dataframe(
@@ -529,15 +713,10 @@ def detalles_por_plataforma(df_validos, plataformas, df_costos):
             
             # Top 10 Clientes por % de Unidades Activas
             with col2:
-                top_activos = df_plat.groupby('Cliente_Cuenta').agg({
-                    'Nombre': 'count',
-                    'Estado': lambda x: (x == 'Activada').sum()
-                }).reset_index()
-                
-                top_activos.columns = ['Cliente', 'Total Unidades', 'Unidades Activas']
-                top_activos['% Activas'] = (top_activos['Unidades Activas'] / top_activos['Total Unidades'] * 100).round(1)
-                top_activos = top_activos[top_activos['Total Unidades'] >= 5]
-                top_activos = top_activos.sort_values(['% Activas', 'Total Unidades'], ascending=[False, False]).head(10)
+                top_activos = conjunto.agregado(
+                    ('top_activos_plataforma', plataforma),
+                    lambda: obtener_motor().top_activos_plataforma(df_plat)
+                )
                 
                 st.markdown("**🏆 Top 10 Clientes por % de Unidades Activas (mín. 5 unidades):**")
                 st.dataframe(
@@ -555,20 +734,7 @@ def detalles_por_plataforma(df_validos, plataformas, df_costos):
             # Distribución de Clientes por Tamaño
             st.markdown("**📊 Distribución de Clientes por Tamaño**")
             
-            def categorizar_cliente(total):
-                if total >= 100:
-                    return 'Grande (100+ unidades)'
-                elif total >= 50:
-                    return 'Mediano (50-99 unidades)'
-                elif total >= 10:
-                    return 'Pequeño (10-49 unidades)'
-                else:
-                    return 'Micro (1-9 unidades)'
-            
-            distribucion_clientes = df_plat.groupby('Cliente_Cuenta').size().reset_index(name='Total')
-            distribucion_clientes['Categoría'] = distribucion_clientes['Total'].apply(categorizar_cliente)
-            resumen_categorias = distribucion_clientes['Categoría'].value_counts().reset_index()
-            resumen_categorias.columns = ['Categoría', 'Cantidad de Clientes']
+            resumen_categorias = distribucion[distribucion['Origen'] == plataforma].drop(columns='Origen')
             
             col1, col2 = st.columns([2, 1])
             
@@ -597,32 +763,20 @@ def detalles_por_plataforma(df_validos, plataformas, df_costos):
             
             st.markdown("---")
 
-def analisis_de_costos(df_validos):
+def analisis_de_costos(conjunto):
     """Crea y muestra el análisis de costos por cliente."""
     st.markdown("#### 📊 Análisis de Costos por Cliente")
     
     # Verificar si los datos de costos están integrados
-    if 'Costo_Mensual' not in df_validos.columns or 'Costo' not in df_validos.columns:
+    if 'Costo_Mensual' not in conjunto.df_validos.columns or 'Costo' not in conjunto.df_validos.columns:
         st.warning("⚠️ No hay datos de costos disponibles para realizar el análisis.")
         return
     
     # Agrupar por Cliente
-    df_costos_cliente = df_validos.groupby('Cliente_Cuenta').agg(
-        Unidades_Activadas=('Estado', lambda x: (x == 'Activada').sum()),
-        Unidades_Desactivadas=('Estado', lambda x: (x == 'Desactivada').sum()),
-        Total_Unidades=('Estado', 'count'),
-        Costo_Unitario=('Costo_Mensual', 'mean')
-    ).reset_index()
-    
-    # Calcular Costo Total Impactado por Unidades Activas
-    df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Unidades_Activadas'] * df_costos_cliente['Costo_Unitario']
-    
-    # Redondear los costos a dos decimales
-    df_costos_cliente['Costo_Unitario'] = df_costos_cliente['Costo_Unitario'].round(2)
-    df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Costo_Total_Impactado'].round(2)
-    
-    # Ordenar por Costo Total Impactado Descendente
-    df_costos_cliente = df_costos_cliente.sort_values('Costo_Total_Impactado', ascending=False)
+    df_costos_cliente = conjunto.agregado(
+        'costos_por_cliente',
+        lambda: obtener_motor().costos_por_cliente(conjunto.df_validos)
+    )
     
     # Mostrar la tabla
     st.dataframe(
@@ -652,14 +806,103 @@ def analisis_de_costos(df_validos):
     )
     fig.update_layout(xaxis_tickangle=-45)
     st.plotly_chart(fig, use_container_width=True, key="costo_total_impactado_bar_chart")
+    
+    # Histograma por rangos de costo impactado, a partir de los mismos conteos por cliente
+    st.markdown("##### 📊 Clientes por Rango de Costo Impactado")
+    conteos = conjunto.agregado('conteos_por_cliente', lambda: categorias.conteos_por_cliente(conjunto.df_validos))
+    histograma = conjunto.agregado('histograma_costo', lambda: categorias.histograma_costo(conteos))
+    col1, col2 = st.columns(2)
+    with col1:
+        fig_clientes = px.bar(
+            histograma,
+            x='Rango',
+            y='Clientes',
+            color='Origen',
+            title='Clientes por Rango de Costo Impactado',
+            labels={'Rango': 'Costo Impactado (USD)', 'Origen': 'Plataforma'},
+            category_orders={'Rango': categorias.etiquetas_costo()}
+        )
+        st.plotly_chart(fig_clientes, use_container_width=True, key="histograma_costo_clientes_bar")
+    with col2:
+        fig_costo = px.bar(
+            histograma,
+            x='Rango',
+            y='Costo_Impactado',
+            color='Origen',
+            title='Costo Impactado por Rango',
+            labels={'Rango': 'Costo Impactado (USD)', 'Costo_Impactado': 'Costo Total Impactado (USD)', 'Origen': 'Plataforma'},
+            category_orders={'Rango': categorias.etiquetas_costo()}
+        )
+        st.plotly_chart(fig_costo, use_container_width=True, key="histograma_costo_total_bar")
 
-def crear_tabs(df_validos, df_costos):
-    """Crea las diferentes pestañas del dashboard."""
-    # Obtener plataformas únicas para dividir los datos
-    plataformas = sorted(df_validos['Origen'].unique())
+def precalcular_plataformas(conjunto, modo_aproximado=False):
+    """Calcula en paralelo los análisis por plataforma pendientes (solo si compensa)."""
+    if (
+        len(conjunto.plataformas) < 2
+        or conjunto.registros_validos < paralelo.UMBRAL_REGISTROS
+        or paralelo.procesos_por_defecto() < 2
+        # DuckDB ya reparte cada consulta entre varios hilos
+        or obtener_motor().nombre != 'pandas'
+    ):
+        return
     
-    # Dividir el dataframe validado en dataframes separados por plataforma
-    df_plataformas = {plataforma: df_validos[df_validos['Origen'] == plataforma].copy() for plataforma in plataformas}
+    pendientes = [p for p in conjunto.plataformas if not conjunto.disponible(('top_clientes_plataforma', p))]
+    if pendientes:
+        pool = paralelo.obtener_pool()
+        try:
+            with st.spinner(f"⚙️ Analizando {len(pendientes)} plataformas en paralelo..."):
+                conjunto.sembrar(paralelo.analizar_plataformas(
+                    conjunto.df_validos,
+                    pool,
+                    pendientes,
+                    omitir=('metricas_plataforma',) if modo_aproximado else ()
+                ))
+        except BrokenProcessPool:
+            # Un proceso terminó de forma anormal (p. ej. por falta de memoria): el
+            # pool se vuelve a crear en el próximo uso y esta vez se calcula en serie
+            paralelo.descartar_pool(pool)
+            st.warning("⚠️ El cálculo en paralelo falló; los análisis por plataforma se calculan en serie.")
+
+# Clientes que se precargan alrededor del seleccionado (en orden alfabético) y entre los de mayor costo
+VECINOS_PRECARGA = 3
+TOP_PRECARGA = 5
+
+def vistas_clientes(conjunto):
+    """Caché LRU de las vistas de la búsqueda de clientes, compartida por las sesiones."""
+    # Posiciones de los registros de cada cliente: extraer un cliente no recorre toda la tabla
+    indices = conjunto.agregado(
+        'indices_clientes',
+        lambda: conjunto.df_validos.groupby('Cliente_Cuenta').indices
+    )
+    
+    def calcular(cliente):
+        if cliente not in indices:
+            return None
+        return procesamiento.vista_cliente(conjunto.df_validos.iloc[indices[cliente]])
+    
+    return conjunto.agregado('vistas_clientes', lambda: VistasClientes(calcular))
+
+def precargar_clientes(conjunto, vistas, clientes, cliente):
+    """Precarga los clientes vecinos del seleccionado y los de mayor costo impactado."""
+    posicion = bisect.bisect_left(clientes, cliente)
+    siguientes = []
+    for distancia in range(1, VECINOS_PRECARGA + 1):
+        for vecino in (posicion + distancia, posicion - distancia):
+            if 0 <= vecino < len(clientes):
+                siguientes.append(clientes[vecino])
+    # Solo si ya se calcularon: la precarga no debe retrasar esta interacción
+    if conjunto.disponible('costos_por_cliente'):
+        df_costos_cliente = conjunto.agregado(
+            'costos_por_cliente',
+            lambda: obtener_motor().costos_por_cliente(conjunto.df_validos)
+        )
+        siguientes += df_costos_cliente['Cliente_Cuenta'].head(TOP_PRECARGA).tolist()
+    vistas.precargar(siguientes)
+
+def crear_tabs(conjunto, modo_aproximado=False):
+    """Crea las diferentes pestañas del dashboard."""
+    df_validos = conjunto.df_validos
+    precalcular_plataformas(conjunto, modo_aproximado)
     
     # Crear una lista de etiquetas para las pestañas
     etiquetas_tabs = [
@@ -681,24 +924,10 @@ def crear_tabs(df_validos, df_costos):
         with col1:
             # Gráfico de barras apiladas para top N clientes
             top_n = st.slider("Seleccionar número de clientes", 5, 20, 10, key="top_n_slider")
-            top_clients = df_validos.groupby(['Cliente_Cuenta', 'Estado']).agg({
-                'Nombre': 'count'
-            }).reset_index()
-            top_clients = top_clients.pivot_table(
-                index='Cliente_Cuenta',
-                columns='Estado',
-                values='Nombre',
-                aggfunc='sum',
-                fill_value=0
-            ).reset_index()
-            
-            if 'Activada' not in top_clients.columns:
-                top_clients['Activada'] = 0
-            if 'Desactivada' not in top_clients.columns:
-                top_clients['Desactivada'] = 0
-            
-            top_clients['Total'] = top_clients['Activada'] + top_clients['Desactivada']
-            top_clients = top_clients.sort_values(['Total'], ascending=[False]).head(top_n)
+            top_clients = conjunto.agregado(
+                ('top_clientes_por_estado', top_n),
+                lambda: obtener_motor().top_clientes_por_estado(df_validos, top_n)
+            )
             
             fig1 = px.bar(
                 top_clients,
@@ -717,14 +946,22 @@ def crear_tabs(df_validos, df_costos):
             st.plotly_chart(fig1, use_container_width=True, key=f"top_clientes_barras_{top_n}")
         
         with col2:
-            # Gráfico de pastel para distribución general de estados
-            fig2 = px.pie(
-                values=[
+            # Gráfico de pastel para distribución general de estados (en modo
+            # aproximado, con la estimación hasta que el cálculo exacto esté disponible)
+            if modo_aproximado and not conjunto.disponible('resumen_plataformas'):
+                total = resumen_estimado(conjunto).set_index('Plataforma').loc['TOTAL']
+                estados = [total['Unidades Activas'], total['Unidades Desactivadas']]
+                titulo = '≈ Distribución de Estados (estimada)'
+            else:
+                estados = [
                     df_validos[df_validos['Estado'] == 'Activada'].shape[0],
                     df_validos[df_validos['Estado'] == 'Desactivada'].shape[0]
-                ],
+                ]
+                titulo = 'Distribución de Estados'
+            fig2 = px.pie(
+                values=estados,
                 names=['Activadas', 'Desactivadas'],
-                title='Distribución de Estados',
+                title=titulo,
                 color_discrete_sequence=['#00CC96', '#EF553B'],
                 hole=0.4
             )
@@ -734,11 +971,10 @@ def crear_tabs(df_validos, df_costos):
         # Análisis Temporal de Desactivaciones
         if 'Fecha_de_Desactivacion' in df_validos.columns:
             st.markdown("#### 📅 Análisis Temporal")
-            df_temporal = df_validos[df_validos['Fecha_de_Desactivacion'].notna()].copy()
-            df_temporal['Fecha_de_Desactivacion'] = pd.to_datetime(df_temporal['Fecha_de_Desactivacion'], errors='coerce')
-            df_temporal['Mes'] = df_temporal['Fecha_de_Desactivacion'].dt.to_period('M')
-            desactivaciones_por_mes = df_temporal.groupby('Mes').size().reset_index(name='Cantidad')
-            desactivaciones_por_mes['Mes'] = desactivaciones_por_mes['Mes'].astype(str)
+            desactivaciones_por_mes = conjunto.agregado(
+                'desactivaciones_por_mes',
+                lambda: obtener_motor().desactivaciones_por_mes(df_validos)
+            )
             
             fig3 = px.line(
                 desactivaciones_por_mes,
@@ -757,7 +993,10 @@ def crear_tabs(df_validos, df_costos):
         # Selector de Cliente
         col1, col2 = st.columns([1, 2])
         with col1:
-            clientes_unicos = sorted(df_validos['Cliente_Cuenta'].unique())
+            clientes_unicos = conjunto.agregado(
+                'clientes_unicos',
+                lambda: sorted(df_validos['Cliente_Cuenta'].unique())
+            )
             buscar_cliente = st.selectbox(
                 "Seleccionar Cliente:",
                 options=clientes_unicos,
@@ -765,15 +1004,18 @@ def crear_tabs(df_validos, df_costos):
             )
         
         if buscar_cliente:
-            clientes_filtrados = df_validos[df_validos['Cliente_Cuenta'] == buscar_cliente].copy()
+            vistas = vistas_clientes(conjunto)
+            vista = vistas.obtener(buscar_cliente)
             
-            if not clientes_filtrados.empty:
+            if vista is not None:
+                precargar_clientes(conjunto, vistas, clientes_unicos, buscar_cliente)
+                
                 # Resumen del Cliente
                 st.markdown("#### 📊 Resumen del Cliente")
                 col1, col2 = st.columns([1, 1])
                 
                 with col1:
-                    estados_cliente = clientes_filtrados['Estado'].value_counts()
+                    estados_cliente = vista['estados']
                     fig = px.pie(
                         values=estados_cliente.values,
                         names=estados_cliente.index,
@@ -785,9 +1027,8 @@ def crear_tabs(df_validos, df_costos):
                     st.plotly_chart(fig, use_container_width=True, key=f"resumen_cliente_pie_{buscar_cliente}")
                 
                 with col2:
-                    total_unidades_cliente = len(clientes_filtrados)
-                    unidades_activas = clientes_filtrados[clientes_filtrados['Estado'] == 'Activada']
-                    unidades_activas_cliente = len(unidades_activas)
+                    total_unidades_cliente = vista['total_unidades']
+                    unidades_activas_cliente = vista['unidades_activas']
                     
                     st.markdown("**📈 Métricas Generales:**")
                     st.markdown(f"""
@@ -796,9 +1037,9 @@ def crear_tabs(df_validos, df_costos):
                     - ❌ Unidades Desactivadas: **{total_unidades_cliente - unidades_activas_cliente:,}**
                     """)
                     
-                    if 'Costo_Mensual' in clientes_filtrados.columns:
-                        costo_total = unidades_activas['Costo_Mensual'].sum()
-                        costo_promedio = unidades_activas['Costo_Mensual'].mean()
+                    if 'facturacion' in vista:
+                        costo_total = vista['facturacion']
+                        costo_promedio = vista['costo_promedio']
                         
                         st.markdown("**💰 Información de Costos:**")
                         st.markdown(f"""
@@ -809,16 +1050,9 @@ def crear_tabs(df_validos, df_costos):
                 # Detalle de Unidades y Costos
                 st.markdown("#### 📋 Detalle de Unidades y Costos")
                 
-                if 'Costo_Mensual' in clientes_filtrados.columns:
-                    detalle_unidades = clientes_filtrados[['Estado', 'Origen', 'Ciclo_Facturacion', 'Costo_Mensual']].copy()
-                    detalle_unidades['Costo_Mensual'] = detalle_unidades['Costo_Mensual'].fillna(0)
-                    detalle_unidades['Costo_Efectivo'] = detalle_unidades.apply(
-                        lambda x: x['Costo_Mensual'] if x['Estado'] == 'Activada' else 0,
-                        axis=1
-                    )
-                    
+                if 'detalle' in vista:
                     st.dataframe(
-                        detalle_unidades,
+                        vista['detalle'],
                         column_config={
                             "Estado": st.column_config.TextColumn("Estado", width="medium"),
                             "Origen": st.column_config.TextColumn("Plataforma", width="medium"),
@@ -841,12 +1075,7 @@ def crear_tabs(df_validos, df_costos):
                     
                     # Resumen por Plataforma
                     st.markdown("#### 📊 Resumen por Plataforma")
-                    resumen_plataforma = clientes_filtrados[clientes_filtrados['Estado'] == 'Activada'].groupby('Origen').agg({
-                        'Estado': 'count',
-                        'Costo_Mensual': 'sum'
-                    }).reset_index()
-                    
-                    resumen_plataforma.columns = ['Plataforma', 'Unidades Activas', 'Facturación Mensual']
+                    resumen_plataforma = vista['resumen_plataforma']
                     
                     st.dataframe(
                         resumen_plataforma,
@@ -886,8 +1115,8 @@ def crear_tabs(df_validos, df_costos):
         st.markdown("### 💰 Análisis por Plataforma")
         
         # Reutilizar el resumen de unidades por plataforma con un sufijo único
-        plataformas_resumen = resumen_unidades_por_plataforma(df_validos, unique_suffix="tab3")
-        detalles_por_plataforma(df_validos, plataformas_resumen, df_costos)
+        plataformas_resumen = resumen_unidades_por_plataforma(conjunto, unique_suffix="tab3", modo_aproximado=modo_aproximado)
+        detalles_por_plataforma(conjunto, plataformas_resumen, modo_aproximado)
 
     with tabs[3]:
         st.markdown("### 📋 Datos Completos")
@@ -923,39 +1152,28 @@ def crear_tabs(df_validos, df_costos):
 
     with tabs[4]:
         st.markdown("### 💵 Análisis de Costos")
-        analisis_de_costos(df_validos)
+        analisis_de_costos(conjunto)
     
     with tabs[5]:
         st.markdown("### 📂 Datos por Plataforma")
-        mostrar_tablas_por_plataforma(df_plataformas)
+        mostrar_tablas_por_plataforma(conjunto)
 
-def mostrar_tablas_por_plataforma(df_plataformas):
+def mostrar_tablas_por_plataforma(conjunto):
     """Muestra tres tablas separadas, una para cada plataforma."""
     st.markdown("#### 📂 Datos por Plataforma")
     
-    for plataforma, df_plat in df_plataformas.items():
+    for plataforma in conjunto.plataformas:
         st.markdown(f"##### 📱 Plataforma: {plataforma}")
+        df_plat = conjunto.plataforma(plataforma)
         if df_plat.empty:
             st.warning(f"No hay datos disponibles para la plataforma **{plataforma}**.")
             continue
         
         # Agrupar por Cliente para obtener las métricas requeridas
-        df_costos_cliente = df_plat.groupby('Cliente_Cuenta').agg(
-            Unidades_Activadas=('Estado', lambda x: (x == 'Activada').sum()),
-            Unidades_Desactivadas=('Estado', lambda x: (x == 'Desactivada').sum()),
-            Total_Unidades=('Estado', 'count'),
-            Costo_Unitario=('Costo_Mensual', 'mean')
-        ).reset_index()
-        
-        # Calcular Costo Total Impactado por Unidades Activas
-        df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Unidades_Activadas'] * df_costos_cliente['Costo_Unitario']
-        
-        # Redondear los costos a dos decimales
-        df_costos_cliente['Costo_Unitario'] = df_costos_cliente['Costo_Unitario'].round(2)
-        df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Costo_Total_Impactado'].round(2)
-        
-        # Ordenar por Costo Total Impactado Descendente
-        df_costos_cliente = df_costos_cliente.sort_values('Costo_Total_Impactado', ascending=False)
+        df_costos_cliente = conjunto.agregado(
+            ('costos_por_cliente', plataforma),
+            lambda: obtener_motor().costos_por_cliente(df_plat)
+        )
         
         # Mostrar la tabla
         st.dataframe(
@@ -986,24 +1204,217 @@ def mostrar_tablas_por_plataforma(df_plataformas):
         fig.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig, use_container_width=True, key=f"costo_total_impactado_bar_chart_{plataforma}")
 
+def resumenes_snapshots(snapshot_files, costos_file):
+    """Resumen de cada snapshot, ordenado por periodo. Solo procesa los que no estén guardados."""
+    archivos = sorted(snapshot_files, key=lambda f: f.name)
+    # Las unidades activas toman el costo vigente a la fecha del snapshot (la
+    # de su nombre; si no tiene, la de hoy), que también identifica el resumen
+    # El hash de cada archivo se recuerda en la sesión por su file_id: los
+    # recorridos siguientes del script no vuelven a leer los snapshots
+    anteriores = st.session_state.get('claves_snapshots', {})
+    hashes = {}
+    fechas, claves = {}, {}
+    for archivo in archivos:
+        subida = (getattr(archivo, 'file_id', None), getattr(costos_file, 'file_id', None))
+        if subida[0] is not None and subida in anteriores:
+            hashes[subida] = anteriores[subida]
+        else:
+            hashes[subida] = clave_contenido(archivo, costos_file)
+        fecha = comparacion.fecha_snapshot(archivo.name)
+        dia = time.strftime("%Y%m%d") if fecha is None else fecha.strftime("%Y%m%d")
+        fechas[archivo.name] = fecha
+        claves[archivo.name] = f"{hashes[subida]}_{dia}"
+    st.session_state['claves_snapshots'] = {subida: h for subida, h in hashes.items() if subida[0] is not None}
+    pendientes = [f for f in archivos if leer_resumen_snapshot(str(ruta_resumen_snapshot(claves[f.name]))) is None]
+    
+    if pendientes:
+        df_costos = None
+        if costos_file is not None:
+            df_costos = ingesta.preparar_costos(costos_file.getvalue())['df_costos']
+        
+        progreso = st.progress(0.0, text="Procesando snapshots...")
+        try:
+            for i, archivo in enumerate(pendientes):
+                progreso.progress(i / len(pendientes), text=f"Procesando {archivo.name}...")
+                # Copia privada: la de ruta_copia_db puede estar en uso por un conjunto en caché
+                with tempfile.TemporaryDirectory(prefix="luc_snapshot_") as directorio:
+                    ruta_db = Path(directorio) / "snapshot.db"
+                    try:
+                        ruta_db.write_bytes(archivo.getvalue())
+                        resumen = comparacion.resumen_desde_db(ruta_db, df_costos, fecha_referencia=fechas[archivo.name])
+                    except ValueError as e:
+                        st.error(f"❌ Error al procesar el snapshot {archivo.name}: {str(e)}")
+                        return None
+                comparacion.guardar_resumen(resumen, ruta_resumen_snapshot(claves[archivo.name]))
+                leer_resumen_snapshot.clear()
+        finally:
+            # Sin la barra a medias si un snapshot falla
+            progreso.empty()
+    
+    return {
+        Path(f.name).stem: leer_resumen_snapshot(str(ruta_resumen_snapshot(claves[f.name])))
+        for f in archivos
+    }
+
+def mostrar_comparacion(resumenes):
+    """Muestra la evolución entre periodos y el detalle de un par de periodos."""
+    periodos = list(resumenes)
+    evolucion = comparacion.evolucion(resumenes)
+    movimiento = comparacion.movimiento_por_periodo(resumenes)
+    
+    st.markdown("### 📅 Comparación de Periodos")
+    totales = evolucion.groupby('Periodo', sort=False)[['Unidades_Activas', 'MRR']].sum()
+    ultimo, penultimo = totales.iloc[-1], totales.iloc[-2]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Periodos", len(periodos), help=f"{periodos[0]} → {periodos[-1]}")
+    with col2:
+        st.metric(
+            f"Unidades Activas ({periodos[-1]})",
+            f"{int(ultimo['Unidades_Activas']):,}",
+            delta=f"{int(ultimo['Unidades_Activas'] - penultimo['Unidades_Activas']):,}"
+        )
+    with col3:
+        st.metric(
+            f"MRR ({periodos[-1]})",
+            f"${ultimo['MRR']:,.2f}",
+            delta=f"${ultimo['MRR'] - penultimo['MRR']:,.2f}"
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.line(
+            evolucion,
+            x='Periodo',
+            y='MRR',
+            color='Origen',
+            markers=True,
+            title='MRR por Plataforma',
+            labels={'MRR': 'Facturación Mensual (USD)', 'Origen': 'Plataforma'}
+        )
+        st.plotly_chart(fig, use_container_width=True, key="comparacion_mrr_line")
+    with col2:
+        movimiento_total = movimiento.groupby('Periodo', sort=False)[['Activaciones', 'Desactivaciones']].sum().reset_index()
+        fig = px.bar(
+            movimiento_total,
+            x='Periodo',
+            y=['Activaciones', 'Desactivaciones'],
+            barmode='group',
+            title='Activaciones y Desactivaciones por Periodo',
+            labels={'value': 'Cantidad de Unidades', 'variable': 'Movimiento'},
+            color_discrete_sequence=['#00CC96', '#EF553B']
+        )
+        st.plotly_chart(fig, use_container_width=True, key="comparacion_movimiento_bar")
+    
+    st.dataframe(movimiento, hide_index=True, use_container_width=True)
+    
+    # Detalle entre dos periodos
+    st.markdown("#### 🔍 Detalle entre Periodos")
+    col1, col2 = st.columns(2)
+    with col1:
+        anterior = st.selectbox("Periodo anterior", periodos[:-1], index=len(periodos) - 2, key="comparacion_anterior_select")
+    with col2:
+        posteriores = periodos[periodos.index(anterior) + 1:]
+        actual = st.selectbox("Periodo actual", posteriores, index=len(posteriores) - 1, key="comparacion_actual_select")
+    
+    diferencias = comparacion.comparar_par(resumenes[anterior], resumenes[actual])
+    formato_delta = {
+        "Unidades_Activas_Anterior": st.column_config.NumberColumn(f"Activas {anterior}", format="%d"),
+        "Unidades_Activas_Actual": st.column_config.NumberColumn(f"Activas {actual}", format="%d"),
+        "Delta_Unidades_Activas": st.column_config.NumberColumn("Δ Activas", format="%d"),
+        "MRR_Anterior": st.column_config.NumberColumn(f"MRR {anterior}", format="$%.2f"),
+        "MRR_Actual": st.column_config.NumberColumn(f"MRR {actual}", format="$%.2f"),
+        "Delta_MRR": st.column_config.NumberColumn("Δ MRR", format="$%.2f"),
+    }
+    
+    st.markdown("##### 💰 MRR por Plataforma")
+    st.dataframe(
+        diferencias['mrr_plataformas'],
+        column_config={"Origen": st.column_config.TextColumn("Plataforma"), **formato_delta},
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.markdown("##### 👥 Clientes con Mayor Cambio de MRR")
+    st.dataframe(
+        diferencias['mrr_clientes'].head(50),
+        column_config={"Cliente_Cuenta": st.column_config.TextColumn("Cliente", width="medium"), **formato_delta},
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.markdown("##### 🔀 Cambios de Categoría")
+    if diferencias['cambios_categoria'].empty:
+        st.info("Ningún cliente cambió de categoría entre estos periodos.")
+    else:
+        st.dataframe(diferencias['cambios_categoria'], hide_index=True, use_container_width=True)
+
 # =====================================
 # Sidebar: Carga y Configuración
 # =====================================
+MODO_DASHBOARD = "📊 Dashboard"
+MODO_COMPARACION = "📅 Comparación de periodos"
+
+# Tiempos del primer recorrido y precarga del último conjunto (solo en un proceso nuevo)
+tiempos_arranque = obtener_tiempos_arranque()
+tiempos_arranque.marcar('importaciones', FIN_IMPORTACIONES)
+iniciar_precarga()
+
 with st.sidebar:
     st.header("Configuración")
+    modo = st.radio("Modo de análisis", [MODO_DASHBOARD, MODO_COMPARACION], key="modo_analisis_radio")
     st.markdown("---")
     
-    # Cargar base de datos
-    st.subheader("📁 Base de Datos Principal")
-    db_file = st.file_uploader("Cargar base de datos SQLite", type=['db'], key="db_file_uploader")
+    db_file = None
+    snapshot_files = []
+    instantanea = None
+    usar_instantanea = False
+    if modo == MODO_DASHBOARD:
+        # Cargar base de datos
+        st.subheader("📁 Base de Datos Principal")
+        db_file = st.file_uploader("Cargar base de datos SQLite", type=['db'], key="db_file_uploader")
+        # Sin archivo subido se puede abrir el último conjunto guardado en disco
+        if db_file is None and arranque.en_caliente_activado():
+            instantanea = obtener_instantanea().metadatos()
+        if instantanea is not None:
+            usar_instantanea = st.checkbox(
+                f"♻️ Abrir el último conjunto ({instantanea['tabla']}, {instantanea['registros_validos']:,} registros válidos)",
+                value=True,
+                key="usar_instantanea_checkbox",
+                help=f"Guardado el {instantanea['guardado'].replace('T', ' ')}; se abre sin volver a leer ni validar la base"
+            )
+    else:
+        # Cargar un snapshot por periodo; el nombre del archivo es la etiqueta del periodo
+        st.subheader("📅 Snapshots por Periodo")
+        snapshot_files = st.file_uploader(
+            "Cargar snapshots SQLite (uno por periodo)",
+            type=['db'],
+            accept_multiple_files=True,
+            key="snapshots_file_uploader",
+            help="Los periodos se ordenan por nombre de archivo (p. ej. 2024-01.db, 2024-02.db, ...)"
+        ) or []
     
     # Cargar archivo de costos
     st.markdown("---")
     st.subheader("💰 Costos y Ciclos de Facturación")
     costos_file = st.file_uploader("Cargar archivo de costos", type=['xlsx', 'xls'], key="costos_file_uploader")
     
-    if db_file:
-        st.success("✅ Base de datos cargada correctamente")
+    st.markdown("---")
+    preparar_trabajo = False
+    if modo == MODO_DASHBOARD:
+        preparar_trabajo = st.checkbox(
+            "⚡ Preparar base de trabajo",
+            value=False,
+            key="preparar_base_trabajo_checkbox",
+            help="Copia la tabla a una base local con índices y resúmenes materializados para que las siguientes sesiones sobre el mismo archivo carguen más rápido"
+        )
+    
+    if modo == MODO_COMPARACION:
+        if len(snapshot_files) < 2:
+            st.info("👆 Seleccione al menos dos snapshots para comparar periodos.")
+    elif db_file or usar_instantanea:
+        if db_file:
+            st.success("✅ Base de datos cargada correctamente")
         st.markdown("---")
         st.markdown("""
         ### 📌 Guía Rápida
@@ -1015,53 +1426,179 @@ with st.sidebar:
     else:
         st.info("👆 Seleccione un archivo de base de datos SQLite para comenzar el análisis.")
 
+
+tiempos_arranque.marcar('barra_lateral')
+
 # =====================================
 # Lógica Principal
 # =====================================
-datos = cargar_datos(db_file, costos_file)
+def cargar_instantanea(clave):
+    """ConjuntoDatos guardado del último conjunto usado (None si ya no está en disco)."""
+    with st.spinner("♻️ Cargando el último conjunto..."):
+        conjunto = obtener_instantanea().cargar(clave, ruta_copia_db(clave))
+    if conjunto is None:
+        st.error("❌ El último conjunto ya no está disponible; vuelva a subir la base de datos.")
+    return conjunto
 
-if datos['conn'] is not None:
+def construir_conjunto(db_file, costos_file, datos=None):
+    """Carga, valida e integra los datos subidos. Devuelve un ConjuntoDatos o None.
+    
+    `datos` es el resultado de cargar_datos, si ya se ingirieron los archivos.
+    """
+    if datos is None:
+        datos = cargar_datos(db_file, costos_file)
+    if datos['conn'] is None:
+        return None
+    
+    conjunto = None
     try:
-        tablas = obtener_tablas(datos['conn'])
+        # Tabla 'main' si existe; si no, la primera (elegida durante la ingesta)
+        tabla_seleccionada = datos['tabla']
         
-        if not tablas:
-            st.error("❌ No se encontraron tablas en la base de datos.")
-        else:
-            # Asumir que la tabla principal se llama 'main', si no, seleccionar la primera tabla
-            with st.sidebar:
-                if 'main' in tablas:
-                    tabla_seleccionada = 'main'
-                else:
-                    tabla_seleccionada = tablas[0]
-                st.info(f"📂 Tabla seleccionada: **{tabla_seleccionada}**")
+        # Estimar la memoria de cada etapa y elegir cómo cargar la tabla
+        plan = planificar_carga(datos['conn'], tabla_seleccionada, datos['df_costos'])
+        if plan is None:
+            return None
         
+        if plan.estrategia == 'memoria':
             # Cargar datos de la tabla seleccionada
             df = cargar_datos_tabla(datos['conn'], tabla_seleccionada)
+            if df is None:
+                return None
             
-            if df is not None:
-                # Validar registros
-                df_validos = validar_registros(df)
+            # Validar registros; de los inválidos solo se guarda el diagnóstico
+            df_validos, diagnostico = validar_registros(df)
+            total_registros = len(df)
+            del df
+        else:
+            # Lectura, validación y costos bloque por bloque
+            st.info(f"🧠 Estrategia de carga: {plan.descripcion()}")
+            resultado = cargar_por_bloques(datos['conn'], tabla_seleccionada, plan, datos['df_costos'])
+            if resultado is None:
+                return None
+            total_registros, df_validos, diagnostico = resultado
+            if total_registros == 0:
+                st.error("❌ La tabla seleccionada no contiene registros.")
+                return None
+        
+        if df_validos.empty:
+            st.warning("⚠️ No hay registros válidos para mostrar.")
+            return None
+        
+        # Integrar costos si están disponibles (por bloques ya se integraron)
+        if datos['df_costos'] is not None and plan.estrategia == 'memoria':
+            df_validos = integrar_costos(df_validos, datos['df_costos'])
+        
+        conjunto = ConjuntoDatos(
+            tabla_seleccionada,
+            total_registros,
+            df_validos,
+            diagnostico,
+            datos['df_costos'],
+            ruta_db=datos['temp_path']
+        )
+        conjunto.plan_carga = plan
+        return conjunto
+    
+    finally:
+        # Cerrar conexión; la copia local se conserva mientras el conjunto esté en caché
+        datos['conn'].close()
+        if conjunto is None and datos['temp_path']:
+            datos['temp_path'].unlink(missing_ok=True)
+
+if modo == MODO_COMPARACION:
+    if len(snapshot_files) >= 2:
+        try:
+            resumenes = resumenes_snapshots(snapshot_files, costos_file)
+            if resumenes is not None:
+                mostrar_comparacion(resumenes)
+        except Exception as e:
+            st.error(f"❌ Error al comparar los periodos: {str(e)}")
+    else:
+        st.info("👆 Cargue los snapshots de al menos dos periodos para compararlos.")
+elif db_file is not None or usar_instantanea:
+    try:
+        sesion_id = st.session_state.setdefault('sesion_id', uuid.uuid4().hex)
+        datos = None
+        if db_file is not None:
+            clave = clave_recordada(db_file, costos_file)
+            if clave is None:
+                # Primera vez en la sesión: la clave sale de la ingesta, que copia y
+                # hashea la base mientras se lee el Excel de costos
+                datos = cargar_datos(db_file, costos_file)
+                clave = datos['clave']
+                if clave is not None:
+                    recordar_clave(db_file, costos_file, clave)
+            constructor = lambda: construir_conjunto(db_file, costos_file, datos)
+        else:
+            clave = instantanea['clave']
+            constructor = lambda: cargar_instantanea(clave)
+        if clave is None:
+            conjunto, compartido = None, True
+        else:
+            conjunto, compartido = obtener_registro().obtener_o_construir(clave, sesion_id, constructor)
+        if datos is not None and datos['conn'] is not None:
+            # Ya estaba en la caché compartida: construir_conjunto no usó la ingesta
+            datos['conn'].close()
+        
+        if conjunto is not None:
+            # Mientras dura este recorrido, desalojarlo del registro no borra la copia local
+            conjunto.retener()
+            try:
+                if db_file is not None:
+                    if conjunto.ruta_db is None:
+                        # Precargado de la instantánea: con la copia local se pueden releer
+                        # los rechazados y preparar la base de trabajo
+                        ruta_db = ruta_copia_db(clave)
+                        if not ruta_db.exists():
+                            ruta_db.write_bytes(db_file.getvalue())
+                        conjunto.ruta_db = ruta_db
+                    if arranque.en_caliente_activado():
+                        obtener_instantanea().guardar_en_segundo_plano(clave, conjunto)
                 
-                if df_validos.empty:
-                    st.warning("⚠️ No hay registros válidos para mostrar.")
-                else:
-                    # Integrar costos si están disponibles
-                    if datos['df_costos'] is not None:
-                        df_validos = integrar_costos(df_validos, datos['df_costos'])
-                    
-                    # Mostrar métricas de validación
-                    mostrar_metricas_validacion(df, df_validos)
-                    
-                    # Crear Tabs para diferentes vistas
-                    crear_tabs(df_validos, df_costos=datos.get('df_costos'))
+                with st.sidebar:
+                    st.info(f"📂 Tabla seleccionada: **{conjunto.tabla}**")
+                    if conjunto.plan_carga is not None:
+                        st.caption(f"🧠 Estrategia de carga: {conjunto.plan_carga.descripcion()}")
+                    motor_pedido = os.environ.get("LUC_MOTOR", "pandas").lower()
+                    if obtener_motor().nombre != motor_pedido:
+                        st.warning(f"⚠️ El motor de análisis '{motor_pedido}' no está disponible; se usa pandas.")
+                    # Activado por defecto en bases muy grandes, antes de calcular cualquier resumen
+                    modo_aproximado = st.checkbox(
+                        "≈ Modo aproximado",
+                        value=conjunto.registros_validos >= aproximado.UMBRAL_REGISTROS,
+                        key="modo_aproximado_checkbox",
+                        help="Estima el resumen y las métricas por plataforma y la distribución de estados sobre una muestra estratificada (con márgenes de error) y los clientes únicos con HyperLogLog; los tops de clientes, la distribución por tamaño y los análisis por cliente siguen siendo exactos. Las cifras exactas se pueden calcular en segundo plano"
+                    )
+                if not compartido:
+                    st.warning("⚠️ Se alcanzó el límite de memoria de la caché compartida: estos datos se procesarán de nuevo en cada interacción.")
+                
+                # Mostrar métricas de validación
+                mostrar_metricas_validacion(conjunto)
+                tiempos_arranque.marcar('metricas')
+                
+                # La base de trabajo se prepara después de mostrar las métricas
+                if preparar_trabajo:
+                    with st.sidebar:
+                        usar_base_trabajo(conjunto, clave)
+                        if conjunto.base_trabajo is not None:
+                            with st.expander("🗂️ Base de trabajo"):
+                                st.dataframe(
+                                    preparacion.leer_metadatos(conjunto.base_trabajo)[['objeto', 'tipo', 'filas', 'creado']],
+                                    hide_index=True
+                                )
+                
+                # Crear Tabs para diferentes vistas
+                crear_tabs(conjunto, modo_aproximado)
+            finally:
+                # Fuera de la caché nadie más usará la copia local de la base
+                if not compartido:
+                    conjunto.liberar()
+                conjunto.soltar()
     
     except Exception as e:
         st.error(f"❌ Error al procesar los datos: {str(e)}")
-    
-    finally:
-        # Cerrar conexión y limpiar archivos temporales
-        datos['conn'].close()
-        if datos['temp_path']:
-            datos['temp_path'].unlink()
 else:
     st.info("👆 Seleccione un archivo de base de datos SQLite para comenzar el análisis.")
+
+tiempos_arranque.registrar()
@@ -0,0 +1,271 @@
+import numpy as np
+import pandas as pd
+
+# =====================================
+# Modo Aproximado (Muestreo Estratificado y HyperLogLog)
+# =====================================
+# Para bases muy grandes, las métricas del resumen por plataforma se estiman
+# sobre una muestra estratificada por 'Origen' (cada plataforma es un estrato
+# con su propia muestra aleatoria), con intervalos de confianza del 95%.
+# Los totales de unidades por plataforma son exactos (un conteo es barato) y
+# los clientes únicos se estiman con HyperLogLog, que recorre la columna de
+# clientes una sola vez con memoria fija y permite combinar plataformas sin
+# volver a contar.
+#
+# Los estratos (códigos de plataforma de cada registro) se calculan una vez por
+# conjunto de datos y se reutilizan; lo único que recorre todos los registros
+# es el sorteo de la muestra (un número aleatorio por registro) y el bosquejo
+# de HyperLogLog, que también se guarda para reutilizarlo.
+
+Z_95 = 1.96
+FRACCION_MUESTRA = 0.05
+MINIMO_POR_ESTRATO = 2000
+PRECISION_HLL = 14
+
+# A partir de este número de registros válidos se sugiere el modo aproximado
+UMBRAL_REGISTROS = 2_000_000
+
+
+# =====================================
+# HyperLogLog
+# =====================================
+
+def _longitud_bits(valores):
+    """Número de bits significativos de cada uint64 (0 para el valor 0)."""
+    longitud = np.zeros(len(valores), dtype=np.int64)
+    positivos = valores > 0
+    estimada = np.floor(np.log2(valores[positivos].astype(np.float64))).astype(np.int64)
+    # La conversión a float puede redondear hacia la siguiente potencia de 2
+    potencia = np.left_shift(np.uint64(1), estimada.astype(np.uint64))
+    estimada -= (potencia > valores[positivos]).astype(np.int64)
+    longitud[positivos] = estimada + 1
+    return longitud
+
+
+def _hashes(valores):
+    return pd.util.hash_pandas_object(pd.Series(valores), index=False).to_numpy()
+
+
+def _registro_y_rango(hashes, precision):
+    """Registro (primeros `precision` bits) y rango (posición del primer 1 en el resto) de cada hash."""
+    bits_resto = 64 - precision
+    indice = (hashes >> np.uint64(bits_resto)).astype(np.int64)
+    resto = hashes & np.uint64((1 << bits_resto) - 1)
+    rango = (bits_resto - _longitud_bits(resto) + 1).astype(np.uint8)
+    return indice, rango
+
+
+class HyperLogLog:
+    """Estimador de cardinalidad con 2**precision registros (error típico ~1.04/sqrt(m))."""
+
+    def __init__(self, precision=PRECISION_HLL):
+        if not 4 <= precision <= 18:
+            raise ValueError("La precisión de HyperLogLog debe estar entre 4 y 18.")
+        self.precision = precision
+        self.registros = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def tamano_bytes(self):
+        return int(self.registros.nbytes)
+
+    def agregar(self, valores):
+        """Incorpora los valores de una Series (vectorizado)."""
+        indice, rango = _registro_y_rango(_hashes(valores), self.precision)
+        np.maximum.at(self.registros, indice, rango)
+        return self
+
+    @classmethod
+    def por_grupos(cls, valores, grupos, precision=PRECISION_HLL, estratos=None):
+        """Un estimador por cada valor de `grupos`, con una sola pasada de hash.
+
+        `estratos` es (códigos, nombres) de `grupos` ya calculados (ver
+        calcular_estratos); con ellos no se recorre `grupos`.
+        """
+        codigos, nombres = estratos if estratos is not None else calcular_estratos(grupos)
+        indice, rango = _registro_y_rango(_hashes(valores), precision)
+        registros = np.zeros((len(nombres), 1 << precision), dtype=np.uint8)
+        presentes = codigos >= 0
+        np.maximum.at(registros, (codigos[presentes], indice[presentes]), rango[presentes])
+
+        estimadores = {}
+        for nombre, fila in zip(nombres, registros):
+            estimador = cls(precision)
+            estimador.registros = fila
+            estimadores[nombre] = estimador
+        return estimadores
+
+    def unir(self, otro):
+        """Combina otro estimador de la misma precisión (unión de conjuntos)."""
+        if otro.precision != self.precision:
+            raise ValueError("Solo se pueden unir estimadores HyperLogLog de la misma precisión.")
+        combinado = HyperLogLog(self.precision)
+        combinado.registros = np.maximum(self.registros, otro.registros)
+        return combinado
+
+    def estimar(self):
+        """Cantidad estimada de valores distintos."""
+        m = len(self.registros)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimacion = alfa * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        vacios = int(np.count_nonzero(self.registros == 0))
+        # Corrección para cardinalidades pequeñas (conteo lineal)
+        if estimacion <= 2.5 * m and vacios > 0:
+            estimacion = m * np.log(m / vacios)
+        return int(round(estimacion))
+
+
+# =====================================
+# Muestreo Estratificado
+# =====================================
+
+def calcular_estratos(valores):
+    """(códigos, nombres) de los estratos: nombres ordenados y el código de cada
+    registro en el tipo entero más chico posible (-1 si el valor está vacío)."""
+    codigos, nombres = pd.factorize(pd.Series(valores), sort=True)
+    return codigos.astype(np.min_scalar_type(-max(len(nombres), 1))), nombres
+
+
+def muestra_estratificada(df, estrato='Origen', fraccion=FRACCION_MUESTRA, minimo=MINIMO_POR_ESTRATO, semilla=0,
+                          estratos=None):
+    """Muestra aleatoria dentro de cada estrato.
+
+    Cada estrato aporta en promedio max(minimo, fraccion * N) registros (todos
+    si tiene menos). Devuelve (muestra, tamanos) con tamanos = N por estrato.
+    `estratos` es (códigos, nombres) de la columna `estrato` ya calculados.
+    """
+    codigos, nombres = estratos if estratos is not None else calcular_estratos(df[estrato])
+    presentes = codigos >= 0
+    tamanos = pd.Series(np.bincount(codigos[presentes], minlength=len(nombres)), index=nombres)
+    objetivo = np.minimum(tamanos, np.maximum(minimo, np.ceil(tamanos * fraccion)))
+
+    # Muestreo de Poisson dentro de cada estrato: cada registro entra con
+    # probabilidad objetivo / N de su estrato (una sola pasada, sin ordenar)
+    probabilidad = np.append((objetivo / tamanos).fillna(0).to_numpy(), 0.0)
+    seleccion = np.random.default_rng(semilla).random(len(df)) < probabilidad[codigos]
+    return df[seleccion], tamanos
+
+
+def estimacion_estratificada(valores, estratos, tamanos):
+    """Media estratificada de `valores` con su margen de error al 95%.
+
+    `valores` y `estratos` son Series de la muestra; los NaN se excluyen (la
+    estimación queda restringida a los registros con valor). `tamanos` es el
+    tamaño N de cada estrato en la población. Devuelve un DataFrame indexado por
+    estrato, más la fila 'TOTAL', con las columnas 'Estimacion' y 'Margen'.
+    """
+    por_estrato = pd.DataFrame({'valor': valores, 'estrato': estratos}).dropna().groupby('estrato')['valor'].agg(
+        ['mean', 'var', 'size']
+    )
+    por_estrato = por_estrato.reindex(tamanos.index)
+    poblacion = tamanos.astype(float)
+    fraccion = (por_estrato['size'] / poblacion).fillna(0).clip(upper=1)
+    varianza = ((1 - fraccion) * por_estrato['var'].fillna(0) / por_estrato['size']).fillna(0)
+
+    resultado = pd.DataFrame({
+        'Estimacion': por_estrato['mean'],
+        'Margen': Z_95 * np.sqrt(varianza),
+    })
+
+    presentes = por_estrato['mean'].notna()
+    pesos = poblacion[presentes] / poblacion[presentes].sum()
+    resultado.loc['TOTAL'] = [
+        (pesos * por_estrato['mean'][presentes]).sum(),
+        Z_95 * np.sqrt((pesos ** 2 * varianza[presentes]).sum()),
+    ]
+    return resultado
+
+
+# =====================================
+# Resumen Aproximado por Plataforma
+# =====================================
+
+def bosquejo_clientes(df, estrato='Origen', precision=PRECISION_HLL, estratos=None):
+    """Un HyperLogLog de Cliente_Cuenta por plataforma (para guardarlo y reutilizarlo)."""
+    return HyperLogLog.por_grupos(df['Cliente_Cuenta'], df[estrato] if estratos is None else None, precision, estratos)
+
+
+def clientes_unicos_aproximados(df, estrato='Origen', precision=PRECISION_HLL, estimadores=None):
+    """Clientes únicos estimados por plataforma y en total (Series con fila 'TOTAL').
+
+    `estimadores` es un bosquejo ya calculado con bosquejo_clientes.
+    """
+    if estimadores is None:
+        estimadores = bosquejo_clientes(df, estrato, precision)
+    total = HyperLogLog(precision)
+    for estimador in estimadores.values():
+        total = total.unir(estimador)
+    clientes = pd.Series({plataforma: e.estimar() for plataforma, e in estimadores.items()})
+    clientes['TOTAL'] = total.estimar()
+    return clientes
+
+
+def resumen_aproximado(df_validos, fraccion=FRACCION_MUESTRA, minimo=MINIMO_POR_ESTRATO, semilla=0,
+                       estratos=None, estimadores=None):
+    """Métricas por plataforma estimadas sobre una muestra estratificada.
+
+    Devuelve un DataFrame con las columnas de procesamiento.resumen_plataformas
+    (incluida la fila 'TOTAL'), los márgenes de error al 95% y, si hay costos
+    integrados, la facturación mensual y el costo promedio por unidad activa.
+    Los totales de unidades son exactos; el resto son estimaciones.
+    `estratos` (códigos y nombres de 'Origen') y `estimadores` (bosquejo de
+    clientes) se pasan si ya están calculados, para no recorrer los datos.
+    """
+    muestra, tamanos = muestra_estratificada(df_validos, 'Origen', fraccion, minimo, semilla, estratos)
+    activa = (muestra['Estado'] == 'Activada').astype(float)
+
+    proporcion = estimacion_estratificada(activa, muestra['Origen'], tamanos)
+    totales = tamanos.copy()
+    totales['TOTAL'] = tamanos.sum()
+
+    resumen = pd.DataFrame({
+        'Total Unidades': totales,
+        '% Activas': proporcion['Estimacion'] * 100,
+        '± % Activas': proporcion['Margen'] * 100,
+    })
+    resumen['Unidades Activas'] = (resumen['Total Unidades'] * proporcion['Estimacion']).round().astype(int)
+    resumen['Unidades Desactivadas'] = resumen['Total Unidades'] - resumen['Unidades Activas']
+    resumen['% Desactivadas'] = 100 - resumen['% Activas']
+    resumen['Clientes Únicos'] = clientes_unicos_aproximados(df_validos, estimadores=estimadores)
+    resumen['Unidades en Muestra'] = muestra['Origen'].value_counts().reindex(resumen.index)
+    resumen.loc['TOTAL', 'Unidades en Muestra'] = len(muestra)
+
+    if 'Costo_Mensual' in muestra.columns:
+        # Facturación: media estratificada del costo de las unidades activas (0 si está desactivada)
+        facturacion = estimacion_estratificada(
+            muestra['Costo_Mensual'].fillna(0) * activa, muestra['Origen'], tamanos
+        )
+        resumen['Facturación Mensual'] = facturacion['Estimacion'] * resumen['Total Unidades']
+        resumen['± Facturación Mensual'] = facturacion['Margen'] * resumen['Total Unidades']
+
+        # Costo promedio: media dentro de cada plataforma de las unidades activas con costo
+        costo = estimacion_estratificada(
+            muestra['Costo_Mensual'].where(activa == 1), muestra['Origen'], tamanos
+        )
+        resumen['Costo Promedio por Unidad'] = costo['Estimacion']
+        resumen['± Costo Promedio por Unidad'] = costo['Margen']
+        # En el total se usa la razón facturación / unidades activas
+        resumen.loc['TOTAL', 'Costo Promedio por Unidad'] = (
+            resumen.loc['TOTAL', 'Facturación Mensual'] / resumen.loc['TOTAL', 'Unidades Activas']
+            if resumen.loc['TOTAL', 'Unidades Activas'] > 0 else np.nan
+        )
+        resumen.loc['TOTAL', '± Costo Promedio por Unidad'] = np.nan
+
+    resumen = resumen.rename_axis('Plataforma').reset_index()
+    columnas = ['Plataforma', 'Unidades Activas', 'Unidades Desactivadas', 'Total Unidades', '% Activas', 'Clientes Únicos']
+    return resumen[columnas + [c for c in resumen.columns if c not in columnas]]
+
+
+def metricas_aproximadas(resumen, plataforma):
+    """Métricas de una plataforma con las mismas claves que procesamiento.metricas_plataforma."""
+    fila = resumen[resumen['Plataforma'] == plataforma].iloc[0]
+    metricas = {
+        'Total Unidades': int(fila['Total Unidades']),
+        'Unidades Activas': int(fila['Unidades Activas']),
+        'Unidades Desactivadas': int(fila['Unidades Desactivadas']),
+        'Clientes Únicos': int(fila['Clientes Únicos']),
+        'Promedio Unidades/Cliente': fila['Total Unidades'] / fila['Clientes Únicos'] if fila['Clientes Únicos'] > 0 else 0,
+    }
+    if 'Facturación Mensual' in resumen.columns:
+        metricas['Facturación Mensual'] = fila['Facturación Mensual']
+        metricas['Costo Promedio por Unidad'] = fila['Costo Promedio por Unidad']
+    return metricas
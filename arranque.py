@@ -0,0 +1,224 @@
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache_compartido import ConjuntoDatos
+from esquema import DiagnosticoRechazos
+
+# =====================================
+# Arranque Rápido del Dashboard
+# =====================================
+# Un proceso nuevo del dashboard debe mostrar la barra lateral cuanto antes:
+#
+# - plotly se importa al dibujar el primer gráfico (importar_diferido), y el
+#   motor de Excel lo importa pandas solo al leer un archivo de costos.
+# - Los tiempos del primer recorrido del script (importaciones, barra lateral,
+#   métricas, total) se escriben en el log 'luc_app.arranque' y en
+#   LUC_DIR_TRABAJO/arranque/tiempos.jsonl, para comparar entre versiones.
+# - Con LUC_ARRANQUE_EN_CALIENTE=1 se guarda en disco el último conjunto de
+#   datos cargado (registros válidos, costos y diagnóstico de rechazos) y el
+#   primer recorrido del script en un proceso nuevo lo precarga en la caché
+#   compartida en segundo plano, sin volver a leer ni validar la base.
+
+logger = logging.getLogger('luc_app.arranque')
+if not logger.handlers:
+    _manejador = logging.StreamHandler()
+    _manejador.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+    logger.addHandler(_manejador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def importar_diferido(nombre):
+    """Módulo `nombre` que se importa de verdad al usar por primera vez uno de sus atributos."""
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.find_spec(nombre)
+    cargador = importlib.util.LazyLoader(spec.loader)
+    spec.loader = cargador
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    cargador.exec_module(modulo)
+    return modulo
+
+
+def directorio_arranque():
+    """Directorio con los tiempos de arranque y la instantánea del último conjunto."""
+    base = Path(os.environ.get('LUC_DIR_TRABAJO', Path(tempfile.gettempdir()) / 'luc_app' / 'trabajo'))
+    return base / 'arranque'
+
+
+def en_caliente_activado():
+    """True si LUC_ARRANQUE_EN_CALIENTE pide guardar y precargar el último conjunto."""
+    return os.environ.get('LUC_ARRANQUE_EN_CALIENTE', '').strip().lower() not in ('', '0', 'false', 'no')
+
+
+# =====================================
+# Tiempos de Arranque
+# =====================================
+
+class TiemposArranque:
+    """Segundos desde `inicio` hasta cada etapa del primer recorrido del script.
+
+    Cada etapa se marca una sola vez; `registrar` escribe el resultado una
+    sola vez (al final del primer recorrido).
+    """
+
+    def __init__(self, inicio, ruta=None):
+        self.inicio = inicio
+        self.ruta = ruta
+        self.etapas = {}
+        self.registrado = False
+        self._lock = threading.Lock()
+
+    def marcar(self, etapa, momento=None):
+        """Registra `etapa` ahora (o en `momento`, un valor de time.perf_counter())."""
+        momento = time.perf_counter() if momento is None else momento
+        with self._lock:
+            if not self.registrado and etapa not in self.etapas:
+                self.etapas[etapa] = momento - self.inicio
+
+    def registrar(self):
+        with self._lock:
+            if self.registrado:
+                return
+            self.registrado = True
+            self.etapas.setdefault('total', time.perf_counter() - self.inicio)
+            etapas = dict(self.etapas)
+
+        logger.info("Arranque: %s", ", ".join(f"{etapa}={segundos:.2f}s" for etapa, segundos in etapas.items()))
+        if self.ruta is None:
+            return
+        try:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            registro = {'fecha': datetime.now().isoformat(timespec='seconds'), 'pid': os.getpid()}
+            registro.update({etapa: round(segundos, 4) for etapa, segundos in etapas.items()})
+            with open(self.ruta, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(registro) + "\n")
+        except OSError as e:
+            logger.warning("No se pudieron guardar los tiempos de arranque: %s", e)
+
+
+# =====================================
+# Instantánea del Último Conjunto
+# =====================================
+
+class InstantaneaArranque:
+    """Último conjunto de datos usado, guardado en disco para precargarlo al arrancar.
+
+    Cada conjunto se guarda en un subdirectorio con su clave (validos.parquet,
+    costos.parquet, rechazos.parquet y rechazos.npz) y 'ultimo.json' apunta
+    al más reciente; se reemplaza al final, así que una escritura interrumpida
+    no deja una instantánea a medias.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = Path(directorio)
+        self._lock = threading.Lock()
+        self._guardando = None
+        metadatos = self.metadatos()
+        self._ultima_clave = metadatos['clave'] if metadatos else None
+
+    @property
+    def ruta_metadatos(self):
+        return self.directorio / 'ultimo.json'
+
+    def metadatos(self):
+        """Clave, tabla, registros y fecha de la última instantánea (None si no hay)."""
+        try:
+            return json.loads(self.ruta_metadatos.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def guardar(self, clave, conjunto):
+        """Escribe la instantánea del conjunto y la marca como la última."""
+        destino = self.directorio / clave
+        destino.mkdir(parents=True, exist_ok=True)
+        conjunto.df_validos.to_parquet(destino / 'validos.parquet')
+        if conjunto.df_costos is not None:
+            conjunto.df_costos.to_parquet(destino / 'costos.parquet')
+        diagnostico = conjunto.diagnostico
+        if diagnostico.muestra is not None:
+            diagnostico.muestra.to_parquet(destino / 'rechazos.parquet')
+        np.savez(destino / 'rechazos.npz', identificadores=diagnostico.identificadores, claves=diagnostico._claves)
+
+        metadatos = {
+            'clave': clave,
+            'tabla': conjunto.tabla,
+            'total_registros': conjunto.total_registros,
+            'registros_validos': conjunto.registros_validos,
+            'rechazos': {motivo: int(n) for motivo, n in diagnostico.conteos.items()},
+            'guardado': datetime.now().isoformat(timespec='seconds'),
+        }
+        temporal = self.ruta_metadatos.with_suffix('.tmp')
+        temporal.write_text(json.dumps(metadatos, ensure_ascii=False), encoding='utf-8')
+        os.replace(temporal, self.ruta_metadatos)
+
+        # Solo se conserva la última
+        for otro in self.directorio.iterdir():
+            if otro.is_dir() and otro.name != clave:
+                shutil.rmtree(otro, ignore_errors=True)
+
+    def guardar_en_segundo_plano(self, clave, conjunto):
+        """Guarda la instantánea en un hilo aparte si `clave` no es ya la última guardada."""
+        with self._lock:
+            if clave == self._ultima_clave or clave == self._guardando:
+                return
+            self._guardando = clave
+
+        def guardar():
+            inicio = time.perf_counter()
+            try:
+                self.guardar(clave, conjunto)
+            except Exception as e:
+                logger.warning("No se pudo guardar la instantánea de arranque: %s", e)
+            else:
+                logger.info("Instantánea de arranque guardada en %.2fs", time.perf_counter() - inicio)
+                with self._lock:
+                    self._ultima_clave = clave
+            finally:
+                with self._lock:
+                    if self._guardando == clave:
+                        self._guardando = None
+
+        threading.Thread(target=guardar, name="instantanea-arranque", daemon=True).start()
+
+    def cargar(self, clave, ruta_db=None):
+        """ConjuntoDatos de la instantánea `clave` (None si no existe o está incompleta).
+
+        `ruta_db` es la copia local de la base, si todavía existe (para releer
+        los registros rechazados y preparar la base de trabajo).
+        """
+        metadatos = self.metadatos()
+        origen = self.directorio / clave
+        if metadatos is None or metadatos['clave'] != clave or not (origen / 'validos.parquet').exists():
+            return None
+
+        diagnostico = DiagnosticoRechazos()
+        diagnostico.conteos = pd.Series(metadatos['rechazos'], dtype='int64')
+        arreglos = np.load(origen / 'rechazos.npz')
+        diagnostico.identificadores = arreglos['identificadores']
+        diagnostico._claves = arreglos['claves']
+        if (origen / 'rechazos.parquet').exists():
+            diagnostico.muestra = pd.read_parquet(origen / 'rechazos.parquet')
+
+        df_costos = pd.read_parquet(origen / 'costos.parquet') if (origen / 'costos.parquet').exists() else None
+        return ConjuntoDatos(
+            metadatos['tabla'],
+            metadatos['total_registros'],
+            pd.read_parquet(origen / 'validos.parquet'),
+            diagnostico,
+            df_costos,
+            ruta_db=ruta_db if ruta_db is not None and Path(ruta_db).exists() else None
+        )
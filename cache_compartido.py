@@ -0,0 +1,447 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import aproximado
+
+# =====================================
+# Caché Compartida de Datos entre Sesiones
+# =====================================
+# Un único registro por proceso guarda una copia de cada conjunto de datos
+# procesado (df_validos y sus agregados), identificado por el hash del
+# contenido de los archivos subidos. Las sesiones de Streamlit solo guardan la
+# clave y su estado de interfaz. Los DataFrames compartidos son de solo
+# lectura: quien necesite modificarlos debe trabajar sobre una copia.
+
+
+def _tamano_bytes(valor):
+    """Memoria aproximada de un agregado.
+
+    Cuenta DataFrames, Series, arreglos NumPy, diccionarios y listas (con su
+    contenido) y los objetos con un atributo `tamano_bytes` (p. ej.
+    VistasClientes o HyperLogLog); del resto, solo el objeto en sí.
+    """
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (pd.Series, pd.Index)):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamano_bytes(k) + _tamano_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamano_bytes(v) for v in valor)
+    if hasattr(valor, 'tamano_bytes'):
+        return int(valor.tamano_bytes)
+    return sys.getsizeof(valor)
+
+
+def _crece(valor):
+    """True si el agregado cambia de tamaño después de guardarse (p. ej. una caché)."""
+    return isinstance(valor, VistasClientes)
+
+
+class ConjuntoDatos:
+    """Resultado del pipeline para un par (base de datos, costos), compartido y de solo lectura."""
+
+    def __init__(self, tabla, total_registros, df_validos, diagnostico, df_costos=None, ruta_db=None):
+        self.tabla = tabla
+        self.total_registros = total_registros
+        self.diagnostico = diagnostico
+        self.df_validos = df_validos
+        self.df_costos = df_costos
+        self.ruta_db = ruta_db
+        self.base_trabajo = None
+        self.plan_carga = None
+        # Código de plataforma de cada registro: lo reutilizan el muestreo y
+        # los bosquejos del modo aproximado sin volver a recorrer 'Origen'
+        self.estratos = aproximado.calcular_estratos(df_validos['Origen'])
+        self.plataformas = self.estratos[1].tolist()
+        self._agregados = {}
+        self._calculando = {}
+        self._en_segundo_plano = {}
+        self._crecientes = []
+        self._lock = threading.Lock()
+        self._tamano_base = diagnostico.tamano_bytes + sum(
+            _tamano_bytes(v) for v in (df_validos, df_costos, self.estratos[0]) if v is not None
+        )
+        self._tamano_agregados = 0
+        self._usos = 0
+        self._liberacion_pendiente = False
+
+    @property
+    def registros_validos(self):
+        return len(self.df_validos)
+
+    @property
+    def tamano_bytes(self):
+        with self._lock:
+            crecientes = list(self._crecientes)
+        return self._tamano_base + self._tamano_agregados + sum(_tamano_bytes(v) for v in crecientes)
+
+    def _guardar_agregado(self, clave, resultado):
+        """Guarda un agregado nuevo y suma su tamaño (con el lock tomado)."""
+        self._agregados[clave] = resultado
+        if _crece(resultado):
+            self._crecientes.append(resultado)
+        else:
+            self._tamano_agregados += _tamano_bytes(resultado)
+
+    def plataforma(self, plataforma):
+        """Registros válidos de una plataforma (vista temporal, no se guarda)."""
+        return self.df_validos[self.df_validos['Origen'] == plataforma]
+
+    def agregado(self, clave, funcion):
+        """Devuelve el agregado `clave`, calculándolo con `funcion()` la primera vez.
+
+        El cálculo se hace fuera del lock: las consultas de otros agregados no
+        esperan, y quien pida la misma clave mientras tanto espera ese mismo
+        cálculo en lugar de repetirlo. Si falla, el error llega a todos los
+        que esperaban y el próximo pedido vuelve a intentarlo.
+        """
+        with self._lock:
+            if clave in self._agregados:
+                return self._agregados[clave]
+            futuro = self._calculando.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = self._calculando[clave] = Future()
+        if not propio:
+            return futuro.result()
+
+        try:
+            resultado = funcion()
+        except BaseException as e:
+            with self._lock:
+                del self._calculando[clave]
+            futuro.set_exception(e)
+            raise
+        with self._lock:
+            # Pudo llegar antes con sembrar (p. ej. desde la base de trabajo)
+            if clave not in self._agregados:
+                self._guardar_agregado(clave, resultado)
+            resultado = self._agregados[clave]
+            del self._calculando[clave]
+        futuro.set_result(resultado)
+        return resultado
+
+    def disponible(self, clave):
+        """True si el agregado `clave` ya está calculado."""
+        with self._lock:
+            return clave in self._agregados
+
+    def en_curso(self, clave):
+        """True si el agregado `clave` se está calculando en segundo plano."""
+        with self._lock:
+            hilo = self._en_segundo_plano.get(clave)
+            return hilo is not None and hilo.is_alive()
+
+    def calcular_en_segundo_plano(self, clave, funcion):
+        """Calcula el agregado `clave` en un hilo aparte (si no está hecho ni en curso).
+
+        Es el mismo cálculo que `agregado`: quien lo pida antes de que termine
+        espera este resultado en lugar de calcularlo otra vez.
+        """
+        with self._lock:
+            if clave in self._agregados or clave in self._calculando or (
+                clave in self._en_segundo_plano and self._en_segundo_plano[clave].is_alive()
+            ):
+                return
+            hilo = threading.Thread(
+                target=lambda: self.agregado(clave, funcion),
+                name=f"agregado-{clave}",
+                daemon=True
+            )
+            self._en_segundo_plano[clave] = hilo
+        hilo.start()
+
+    def sembrar(self, agregados):
+        """Agrega resultados ya calculados (p. ej. leídos de la base de trabajo) sin pisar los existentes."""
+        with self._lock:
+            for clave, resultado in agregados.items():
+                if clave not in self._agregados:
+                    self._guardar_agregado(clave, resultado)
+
+    def retener(self):
+        """Marca el conjunto en uso (p. ej. durante un recorrido del script): `liberar`
+        no borra la copia local de la base hasta que se llame a `soltar`."""
+        with self._lock:
+            self._usos += 1
+
+    def soltar(self):
+        """Termina un uso marcado con `retener` (y hace la liberación pendiente, si la hay)."""
+        with self._lock:
+            self._usos -= 1
+            borrar = self._usos == 0 and self._liberacion_pendiente
+            if borrar:
+                self._liberacion_pendiente = False
+        if borrar:
+            self._borrar_copia()
+
+    @property
+    def liberacion_pendiente(self):
+        """True si se liberó mientras estaba en uso y la copia espera a que se suelte."""
+        with self._lock:
+            return self._liberacion_pendiente
+
+    def conservar(self):
+        """Cancela una liberación pendiente (el conjunto vuelve al registro).
+
+        Devuelve False si ya no estaba pendiente (la copia local ya se borró).
+        """
+        with self._lock:
+            pendiente = self._liberacion_pendiente
+            self._liberacion_pendiente = False
+            return pendiente
+
+    def liberar(self):
+        """Elimina la copia local de la base de datos (al salir del registro).
+
+        Si alguien lo está usando (ver `retener`), la copia se borra cuando
+        termina el último uso.
+        """
+        with self._lock:
+            if self._usos > 0:
+                self._liberacion_pendiente = True
+                return
+        self._borrar_copia()
+
+    def _borrar_copia(self):
+        if self.ruta_db is not None:
+            Path(self.ruta_db).unlink(missing_ok=True)
+
+
+class VistasClientes:
+    """Caché LRU de las vistas por cliente de un conjunto, con precarga en segundo plano.
+
+    `calcular(cliente)` construye la vista de un cliente. `precargar` deja en
+    cola los clientes que probablemente se consulten después; un único hilo
+    los calcula de a uno, y cada nueva precarga reemplaza la cola anterior
+    (los vecinos de la última selección son los más probables).
+    """
+
+    def __init__(self, calcular, capacidad=128):
+        self._calcular = calcular
+        self.capacidad = capacidad
+        self._vistas = OrderedDict()
+        self._pendientes = []
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, cliente):
+        with self._lock:
+            return cliente in self._vistas
+
+    @property
+    def tamano_bytes(self):
+        """Memoria aproximada de las vistas en caché."""
+        with self._lock:
+            vistas = list(self._vistas.values())
+        return sum(_tamano_bytes(vista) for vista in vistas if vista is not None)
+
+    def _guardar(self, cliente, vista):
+        with self._lock:
+            self._vistas[cliente] = vista
+            self._vistas.move_to_end(cliente)
+            while len(self._vistas) > self.capacidad:
+                self._vistas.popitem(last=False)
+
+    def obtener(self, cliente):
+        """Vista del cliente (la calcula si no está en caché)."""
+        with self._lock:
+            if cliente in self._vistas:
+                self._vistas.move_to_end(cliente)
+                return self._vistas[cliente]
+        vista = self._calcular(cliente)
+        self._guardar(cliente, vista)
+        return vista
+
+    def precargar(self, clientes):
+        """Calcula en segundo plano las vistas de `clientes` que falten (en ese orden)."""
+        with self._lock:
+            pendientes = []
+            for cliente in clientes:
+                if cliente not in self._vistas and cliente not in pendientes:
+                    pendientes.append(cliente)
+            # Nunca más de media caché, para no desalojar lo que se está usando
+            self._pendientes = pendientes[:self.capacidad // 2]
+            # El hilo en curso toma la nueva cola
+            if not self._pendientes or self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._precargar, name="precarga-clientes", daemon=True)
+        self._hilo.start()
+
+    def _precargar(self):
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    self._hilo = None
+                    return
+                cliente = self._pendientes.pop(0)
+                if cliente in self._vistas:
+                    continue
+            try:
+                vista = self._calcular(cliente)
+            except Exception:
+                # El error se verá (y se reintentará) si alguien consulta ese cliente
+                continue
+            self._guardar(cliente, vista)
+
+
+class _Entrada:
+    def __init__(self, conjunto):
+        self.conjunto = conjunto
+        self.sesiones = set()
+        self.ultimo_acceso = time.monotonic()
+
+
+class RegistroDatasets:
+    """Registro de conjuntos de datos por hash de contenido, con referencias, TTL y límite de memoria.
+
+    Cada sesión mantiene una referencia a la entrada que está usando. Una entrada
+    se desaloja cuando no tiene referencias y hace falta memoria, o cuando nadie
+    la ha consultado durante `ttl_segundos` (las sesiones cerradas no avisan, así
+    que sus referencias caducan con el TTL).
+    """
+
+    def __init__(self, limite_bytes, ttl_segundos):
+        self.limite_bytes = limite_bytes
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()
+        self._lock = threading.RLock()
+        # Clave -> [lock, hilos que lo tienen o lo esperan]; se descarta en cero
+        self._locks_construccion = {}
+        # Conjuntos desalojados que alguna sesión todavía está usando
+        self._desalojados = {}
+
+    def _desalojar_expirados(self):
+        ahora = time.monotonic()
+        for clave in [c for c, e in self._entradas.items() if ahora - e.ultimo_acceso > self.ttl_segundos]:
+            self._desalojar(clave)
+
+    def _desalojar(self, clave):
+        conjunto = self._entradas.pop(clave).conjunto
+        conjunto.liberar()
+        if conjunto.liberacion_pendiente:
+            self._desalojados[clave] = conjunto
+
+    def _recuperar_desalojado(self, clave):
+        """Conjunto desalojado de `clave` que sigue en uso (con su copia local), o None."""
+        for otra in [c for c, conjunto in self._desalojados.items() if not conjunto.liberacion_pendiente]:
+            del self._desalojados[otra]
+        conjunto = self._desalojados.pop(clave, None)
+        if conjunto is not None and conjunto.conservar():
+            return conjunto
+        return None
+
+    def _liberar_sesion(self, sesion_id, excepto=None):
+        for clave, entrada in self._entradas.items():
+            if clave != excepto:
+                entrada.sesiones.discard(sesion_id)
+
+    @contextmanager
+    def _construccion(self, clave):
+        """Un solo hilo a la vez construye `clave`. El lock se descarta cuando
+        nadie lo tiene ni lo espera, así que las claves desalojadas no lo dejan."""
+        with self._lock:
+            uso = self._locks_construccion.setdefault(clave, [threading.Lock(), 0])
+            uso[1] += 1
+        try:
+            with uso[0]:
+                yield
+        finally:
+            with self._lock:
+                uso[1] -= 1
+                if uso[1] == 0:
+                    del self._locks_construccion[clave]
+
+    @property
+    def memoria_usada(self):
+        with self._lock:
+            return sum(e.conjunto.tamano_bytes for e in self._entradas.values())
+
+    def obtener(self, clave, sesion_id):
+        """Devuelve el conjunto de `clave` y registra la referencia de la sesión (None si no está)."""
+        with self._lock:
+            self._desalojar_expirados()
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            self._liberar_sesion(sesion_id, excepto=clave)
+            entrada.sesiones.add(sesion_id)
+            entrada.ultimo_acceso = time.monotonic()
+            self._entradas.move_to_end(clave)
+            return entrada.conjunto
+
+    def registrar(self, clave, conjunto, sesion_id):
+        """Guarda un conjunto nuevo. Devuelve False si no cabe en el límite de memoria.
+
+        Con `sesion_id` None el conjunto queda sin referencias (desalojable).
+        """
+        with self._lock:
+            self._desalojar_expirados()
+            necesario = conjunto.tamano_bytes
+            tamanos = {c: e.conjunto.tamano_bytes for c, e in self._entradas.items()}
+            usada = sum(tamanos.values())
+            # Desalojar primero las entradas sin referencias, de la menos a la más reciente
+            for clave_libre in [c for c, e in self._entradas.items() if not e.sesiones]:
+                if usada + necesario <= self.limite_bytes:
+                    break
+                usada -= tamanos[clave_libre]
+                self._desalojar(clave_libre)
+            if usada + necesario > self.limite_bytes:
+                return False
+
+            entrada = _Entrada(conjunto)
+            if sesion_id is not None:
+                self._liberar_sesion(sesion_id)
+                entrada.sesiones.add(sesion_id)
+            self._entradas[clave] = entrada
+            return True
+
+    def obtener_o_construir(self, clave, sesion_id, constructor):
+        """Devuelve (conjunto, compartido). Solo una sesión construye cada clave a la vez.
+
+        `constructor()` devuelve un ConjuntoDatos o None si los datos no se pudieron
+        procesar. `compartido` es False si el conjunto no entró en el registro.
+        """
+        conjunto = self.obtener(clave, sesion_id)
+        if conjunto is not None:
+            return conjunto, True
+
+        with self._construccion(clave):
+            # Otra sesión pudo haberlo construido mientras esperábamos
+            conjunto = self.obtener(clave, sesion_id)
+            if conjunto is not None:
+                return conjunto, True
+
+            # Desalojado pero todavía en uso: vuelve al registro sin reconstruirlo
+            with self._lock:
+                conjunto = self._recuperar_desalojado(clave)
+            if conjunto is None:
+                conjunto = constructor()
+            if conjunto is None:
+                return None, False
+            return conjunto, self.registrar(clave, conjunto, sesion_id)
+
+    def precargar(self, clave, constructor):
+        """Construye y registra `clave` sin asociarla a ninguna sesión (p. ej. al arrancar).
+
+        Las sesiones que pidan la misma clave mientras tanto esperan a que
+        termine. Devuelve True si el conjunto quedó en el registro.
+        """
+        with self._construccion(clave):
+            with self._lock:
+                if clave in self._entradas:
+                    return True
+            conjunto = constructor()
+            if conjunto is None:
+                return False
+            return self.registrar(clave, conjunto, None)
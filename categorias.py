@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+# =====================================
+# Categorías de Clientes por Rangos
+# =====================================
+# Los clientes se clasifican con límites configurables: un límite es el primer
+# valor de su rango, así que los límites [10, 50, 100] producen los rangos
+# 1-9, 10-49, 50-99 y 100+. La clasificación es vectorizada (np.searchsorted)
+# y se aplica sobre los conteos por plataforma y cliente, que se calculan una
+# sola vez para todas las plataformas; cambiar los límites solo vuelve a
+# clasificar esa tabla.
+
+LIMITES_TAMANO = (10, 50, 100)
+NOMBRES_TAMANO = ('Micro', 'Pequeño', 'Mediano', 'Grande')
+
+LIMITES_COSTO = (100, 500, 1000, 5000)
+
+
+def _normalizar_limites(limites):
+    limites = sorted(set(limites))
+    if not limites:
+        raise ValueError("Se necesita al menos un límite para definir los rangos.")
+    return limites
+
+
+def etiquetas_tamano(limites=LIMITES_TAMANO, nombres=NOMBRES_TAMANO):
+    """Etiquetas de los rangos de tamaño, p. ej. 'Pequeño (10-49 unidades)'."""
+    limites = _normalizar_limites(limites)
+    if len(nombres) != len(limites) + 1:
+        raise ValueError(f"Se esperaban {len(limites) + 1} nombres de categoría para {len(limites)} límites.")
+    inicios = [1] + limites
+    etiquetas = [
+        f"{nombre} ({inicio}-{fin - 1} unidades)"
+        for nombre, inicio, fin in zip(nombres, inicios, limites)
+    ]
+    etiquetas.append(f"{nombres[-1]} ({limites[-1]}+ unidades)")
+    return etiquetas
+
+
+def etiquetas_costo(limites=LIMITES_COSTO):
+    """Etiquetas de los rangos de costo, p. ej. '$100-500'."""
+    limites = _normalizar_limites(limites)
+    inicios = [0] + limites
+    etiquetas = [f"${inicio:,.0f}-{fin:,.0f}" for inicio, fin in zip(inicios, limites)]
+    etiquetas.append(f"${limites[-1]:,.0f}+")
+    return etiquetas
+
+
+def categorizar(valores, limites, etiquetas):
+    """Clasifica `valores` en los rangos definidos por `limites` (Categorical ordenado)."""
+    limites = _normalizar_limites(limites)
+    valores = pd.Series(valores)
+    codigos = np.searchsorted(np.asarray(limites, dtype=float), valores.to_numpy(dtype=float), side='right')
+    codigos = np.where(valores.isna().to_numpy(), -1, codigos)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=etiquetas, ordered=True),
+        index=valores.index
+    )
+
+
+def categorizar_tamano(totales, limites=LIMITES_TAMANO, nombres=NOMBRES_TAMANO):
+    """Categoría de tamaño para cada total de unidades."""
+    return categorizar(totales, limites, etiquetas_tamano(limites, nombres))
+
+
+def conteos_por_cliente(df_validos):
+    """Unidades por plataforma y cliente (y costo impactado si hay costos integrados).
+
+    Es la tabla base de las distribuciones: se calcula una vez y se reutiliza
+    para cualquier combinación de límites.
+    """
+    columnas = {'Activa': df_validos['Estado'] == 'Activada'}
+    agregaciones = {
+        'Total_Unidades': ('Activa', 'size'),
+        'Unidades_Activas': ('Activa', 'sum'),
+    }
+    if 'Costo_Mensual' in df_validos.columns:
+        agregaciones['Costo_Unitario'] = ('Costo_Mensual', 'mean')
+
+    conteos = df_validos.assign(**columnas).groupby(['Origen', 'Cliente_Cuenta']).agg(**agregaciones).reset_index()
+    if 'Costo_Unitario' in conteos.columns:
+        conteos['Costo_Impactado'] = conteos['Unidades_Activas'] * conteos['Costo_Unitario']
+    return conteos
+
+
+def distribucion_tamano(conteos, limites=LIMITES_TAMANO, nombres=NOMBRES_TAMANO):
+    """Cantidad de clientes por plataforma y categoría de tamaño (todas las plataformas a la vez)."""
+    categoria = categorizar_tamano(conteos['Total_Unidades'], limites, nombres)
+    distribucion = conteos.groupby([conteos['Origen'], categoria.rename('Categoría')], observed=True).size()
+    return distribucion.reset_index(name='Cantidad de Clientes')
+
+
+def histograma_costo(conteos, limites=LIMITES_COSTO):
+    """Clientes y costo impactado por plataforma y rango de costo impactado."""
+    if 'Costo_Impactado' not in conteos.columns:
+        raise ValueError("No hay datos de costos integrados para calcular el histograma.")
+    rango = categorizar(conteos['Costo_Impactado'], limites, etiquetas_costo(limites)).rename('Rango')
+    histograma = conteos.groupby([conteos['Origen'], rango], observed=True).agg(
+        Clientes=('Cliente_Cuenta', 'size'),
+        Costo_Impactado=('Costo_Impactado', 'sum')
+    )
+    return histograma.reset_index()
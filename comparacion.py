@@ -0,0 +1,194 @@
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import categorias
+import procesamiento
+
+# =====================================
+# Comparación entre Periodos (Snapshots)
+# =====================================
+# Cada snapshot (una base SQLite mensual) se reduce una sola vez a un resumen
+# compacto: sus unidades identificadas por un hash de Cliente_Cuenta + Nombre
+# (y el número de aparición, para las unidades homónimas de una misma cuenta),
+# y sus totales por cliente y por plataforma. Los resúmenes se guardan en
+# Parquet por hash de contenido, así que agregar un mes nuevo solo procesa ese
+# archivo. Las diferencias entre periodos se calculan alineando los hashes con
+# operaciones vectorizadas.
+
+PARTES_RESUMEN = ('unidades', 'clientes', 'plataformas')
+
+# Fecha en el nombre del archivo: AAAA-MM-DD, AAAA-MM, AAAAMMDD o AAAAMM
+PATRON_FECHA = re.compile(r'(?<!\d)(\d{4})[-_]?(\d{2})(?:[-_]?(\d{2}))?(?!\d)')
+
+
+def fecha_snapshot(nombre):
+    """Fecha de un snapshot según su nombre de archivo (None si no tiene una).
+
+    Un snapshot mensual (solo año y mes) corresponde al último día del mes.
+    """
+    for coincidencia in PATRON_FECHA.finditer(Path(nombre).stem):
+        anio, mes, dia = coincidencia.groups()
+        try:
+            if dia is None:
+                return pd.Timestamp(int(anio), int(mes), 1) + pd.offsets.MonthEnd(0)
+            return pd.Timestamp(int(anio), int(mes), int(dia))
+        except ValueError:
+            continue
+    return None
+
+
+def claves_unidades(df):
+    """Hash estable (uint64) de Cliente_Cuenta + Nombre para cada registro.
+
+    Las unidades con la misma cuenta y el mismo nombre se distinguen por su
+    orden de aparición (la primera de un periodo se alinea con la primera
+    del otro).
+    """
+    identidad = df[['Cliente_Cuenta', 'Nombre']].copy()
+    identidad['Aparicion'] = identidad.groupby(['Cliente_Cuenta', 'Nombre'], sort=False, observed=True).cumcount()
+    return pd.util.hash_pandas_object(identidad, index=False).to_numpy()
+
+
+def resumen_snapshot(df_validos):
+    """Reduce los registros válidos de un snapshot a unidades, clientes y plataformas."""
+    if 'Costo_Mensual' in df_validos.columns:
+        costo = df_validos['Costo_Mensual'].fillna(0).to_numpy()
+    else:
+        costo = np.zeros(len(df_validos))
+
+    unidades = pd.DataFrame({
+        'Clave': claves_unidades(df_validos),
+        'Cliente_Cuenta': df_validos['Cliente_Cuenta'].to_numpy(),
+        'Origen': df_validos['Origen'].to_numpy(),
+        'Activa': (df_validos['Estado'] == 'Activada').to_numpy(),
+        'Costo_Mensual': costo,
+    })
+    unidades = unidades.set_index('Clave')
+    unidades['MRR'] = np.where(unidades['Activa'], unidades['Costo_Mensual'], 0.0)
+
+    clientes = unidades.groupby('Cliente_Cuenta').agg(
+        Total_Unidades=('Activa', 'size'),
+        Unidades_Activas=('Activa', 'sum'),
+        MRR=('MRR', 'sum')
+    ).reset_index()
+    clientes['Categoría'] = categorias.categorizar_tamano(clientes['Total_Unidades']).astype(str)
+
+    plataformas = unidades.groupby('Origen').agg(
+        Total_Unidades=('Activa', 'size'),
+        Unidades_Activas=('Activa', 'sum'),
+        MRR=('MRR', 'sum')
+    ).reset_index()
+
+    return {'unidades': unidades, 'clientes': clientes, 'plataformas': plataformas}
+
+
+def guardar_resumen(resumen, directorio):
+    """Guarda el resumen de un snapshot como Parquet (una tabla por parte)."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    for parte in PARTES_RESUMEN:
+        resumen[parte].to_parquet(directorio / f"{parte}.parquet", index=(parte == 'unidades'))
+
+
+def leer_resumen(directorio):
+    """Lee un resumen guardado con guardar_resumen (None si no existe)."""
+    directorio = Path(directorio)
+    if not all((directorio / f"{parte}.parquet").exists() for parte in PARTES_RESUMEN):
+        return None
+    return {parte: pd.read_parquet(directorio / f"{parte}.parquet") for parte in PARTES_RESUMEN}
+
+
+def resumen_desde_db(db_path, df_costos=None, esquema=None, fecha_referencia=None):
+    """Procesa un snapshot completo y devuelve su resumen.
+
+    `fecha_referencia` es la fecha del snapshot: sus unidades activas toman el
+    costo vigente a esa fecha (ver procesamiento.integrar_costos).
+    """
+    _, _, df_validos, _ = procesamiento.cargar_validos(
+        db_path, df_costos, esquema=esquema, fecha_referencia=fecha_referencia
+    )
+    return resumen_snapshot(df_validos)
+
+
+def _movimiento_unidades(anterior, actual):
+    """Activaciones y desactivaciones por plataforma entre dos snapshots."""
+    claves = anterior.index.union(actual.index)
+    activa_antes = anterior['Activa'].reindex(claves, fill_value=False).to_numpy(dtype=bool)
+    activa_ahora = actual['Activa'].reindex(claves, fill_value=False).to_numpy(dtype=bool)
+    origen = actual['Origen'].reindex(claves).fillna(anterior['Origen'].reindex(claves))
+
+    movimiento = pd.DataFrame({
+        'Origen': origen.to_numpy(),
+        'Activaciones': ~activa_antes & activa_ahora,
+        'Desactivaciones': activa_antes & ~activa_ahora,
+        'Nuevas': ~claves.isin(anterior.index),
+        'Retiradas': ~claves.isin(actual.index),
+    })
+    movimiento = movimiento.groupby('Origen')[['Activaciones', 'Desactivaciones', 'Nuevas', 'Retiradas']].sum().reset_index()
+    movimiento['Neto'] = movimiento['Activaciones'] - movimiento['Desactivaciones']
+    return movimiento
+
+
+def _delta(anterior, actual, clave, columnas):
+    """Une dos tablas por `clave` y calcula la diferencia de cada columna."""
+    unido = anterior[[clave] + columnas].merge(
+        actual[[clave] + columnas],
+        on=clave,
+        how='outer',
+        suffixes=('_Anterior', '_Actual')
+    )
+    for columna in columnas:
+        antes = unido[f"{columna}_Anterior"].fillna(0)
+        ahora = unido[f"{columna}_Actual"].fillna(0)
+        unido[f"{columna}_Anterior"] = antes
+        unido[f"{columna}_Actual"] = ahora
+        unido[f"Delta_{columna}"] = ahora - antes
+    return unido
+
+
+def comparar_par(anterior, actual):
+    """Diferencias entre dos resúmenes de snapshot."""
+    clientes = _delta(anterior['clientes'], actual['clientes'], 'Cliente_Cuenta', ['Unidades_Activas', 'MRR'])
+    clientes = clientes.sort_values('Delta_MRR', key=np.abs, ascending=False)
+
+    categorias = anterior['clientes'][['Cliente_Cuenta', 'Categoría']].merge(
+        actual['clientes'][['Cliente_Cuenta', 'Categoría']],
+        on='Cliente_Cuenta',
+        suffixes=(' Anterior', ' Actual')
+    )
+    categorias = categorias[categorias['Categoría Anterior'] != categorias['Categoría Actual']]
+
+    return {
+        'movimiento': _movimiento_unidades(anterior['unidades'], actual['unidades']),
+        'mrr_plataformas': _delta(anterior['plataformas'], actual['plataformas'], 'Origen', ['Unidades_Activas', 'MRR']),
+        'mrr_clientes': clientes.reset_index(drop=True),
+        'cambios_categoria': categorias.reset_index(drop=True),
+    }
+
+
+def evolucion(resumenes):
+    """Serie de unidades activas y MRR por plataforma en todos los periodos.
+
+    `resumenes` es un diccionario ordenado etiqueta -> resumen.
+    """
+    partes = [
+        resumen['plataformas'].assign(Periodo=etiqueta)
+        for etiqueta, resumen in resumenes.items()
+    ]
+    return pd.concat(partes, ignore_index=True)[['Periodo', 'Origen', 'Total_Unidades', 'Unidades_Activas', 'MRR']]
+
+
+def movimiento_por_periodo(resumenes):
+    """Activaciones y desactivaciones entre cada par de periodos consecutivos."""
+    etiquetas = list(resumenes)
+    partes = [
+        _movimiento_unidades(resumenes[anterior]['unidades'], resumenes[actual]['unidades']).assign(Periodo=actual)
+        for anterior, actual in zip(etiquetas, etiquetas[1:])
+    ]
+    if not partes:
+        return pd.DataFrame(columns=['Periodo', 'Origen', 'Activaciones', 'Desactivaciones', 'Nuevas', 'Retiradas', 'Neto'])
+    movimiento = pd.concat(partes, ignore_index=True)
+    return movimiento[['Periodo'] + [c for c in movimiento.columns if c != 'Periodo']]
@@ -0,0 +1,332 @@
+import copy
+import json
+
+import numpy as np
+import pandas as pd
+
+# =====================================
+# Esquemas de Columnas y Reglas de Limpieza
+# =====================================
+# Cada esquema es un diccionario declarativo: nombre canónico de la columna ->
+# reglas. Las reglas admitidas son:
+#   alias       otros nombres con los que puede venir la columna
+#   tipo        'texto', 'numero', 'moneda' ($ y separadores de miles) o 'fecha'
+#   nulos       valores que se consideran vacíos (se comparan tras quitar espacios)
+#   formato     formato de fecha (strftime); si se omite, pandas lo infiere y las
+#               fechas con otro formato se interpretan una por una
+#   requerida   el registro se rechaza si el valor queda vacío
+#   obligatoria la columna debe existir en el origen (por defecto, igual que requerida)
+#   por_defecto valor para los vacíos de una columna no requerida
+#   minimo      el registro se rechaza si el valor numérico es menor
+#   invalidos   'rechazar' (por defecto) o 'conservar': con 'conservar', un valor
+#               que no se puede convertir queda vacío y el registro no se rechaza
+#   presente    nombre de una columna booleana que se agrega a los válidos: True
+#               si el valor venía informado (aunque no se pudiera convertir)
+# El esquema se compila una vez (EsquemaCompilado) y se aplica en una sola
+# pasada vectorizada que devuelve los registros válidos y los rechazados con su
+# motivo.
+
+ESQUEMA_UNIDADES = {
+    'Cliente_Cuenta': {
+        'alias': ['Cuenta_Cliente', 'ClienteCuenta', 'Cliente', 'Cuenta'],
+        'tipo': 'texto',
+        'nulos': ['', '0'],
+        'requerida': True,
+    },
+    'Nombre': {
+        'alias': ['Unidad', 'Nombre_Unidad'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'requerida': True,
+    },
+    'Fecha_de_Desactivacion': {
+        'alias': ['Fecha_Desactivacion', 'FechaDesactivacion'],
+        'tipo': 'fecha',
+        'nulos': ['', '0'],
+        'obligatoria': True,
+        # Una fecha ilegible sigue indicando que la unidad se desactivó
+        'invalidos': 'conservar',
+        'presente': 'Fecha_Informada',
+    },
+    'Origen': {
+        'alias': ['Plataforma'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'requerida': True,
+    },
+}
+
+ESQUEMA_COSTOS = {
+    'Cuenta': {
+        'alias': ['Cliente_Cuenta', 'Cuenta Cliente'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'requerida': True,
+    },
+    'Costo': {
+        'alias': ['Precio', 'Tarifa'],
+        'tipo': 'moneda',
+        'nulos': [''],
+        'requerida': True,
+        'minimo': 0,
+    },
+    'Tipo': {
+        'alias': ['Ciclo', 'Ciclo de Facturación'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'por_defecto': 'Mensual',
+    },
+    # Historial de precios: una fila por versión del costo de cada cuenta
+    'Vigente_Desde': {
+        'alias': ['Vigente Desde', 'Vigencia', 'Fecha Vigencia', 'Desde'],
+        'tipo': 'fecha',
+        'nulos': [''],
+    },
+    'Moneda': {
+        'alias': ['Divisa'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'por_defecto': 'USD',
+    },
+    'Usuario': {'tipo': 'texto'},
+    'Nombre Comercial': {'tipo': 'texto'},
+    'Observaciones': {'tipo': 'texto'},
+}
+
+# Hoja opcional del archivo de costos: valor de una unidad de cada moneda en
+# la moneda base, con su fecha de vigencia
+ESQUEMA_TIPOS_CAMBIO = {
+    'Moneda': {
+        'alias': ['Divisa'],
+        'tipo': 'texto',
+        'nulos': [''],
+        'requerida': True,
+    },
+    'Tasa': {
+        'alias': ['Tipo de Cambio', 'Tipo_Cambio'],
+        'tipo': 'numero',
+        'nulos': [''],
+        'requerida': True,
+        'minimo': 0,
+    },
+    'Vigente_Desde': {
+        'alias': ['Vigente Desde', 'Fecha'],
+        'tipo': 'fecha',
+        'nulos': [''],
+    },
+}
+
+TIPOS_VALIDOS = ('texto', 'numero', 'moneda', 'fecha')
+
+
+def _normalizar_nombre(nombre):
+    return str(nombre).strip().lower()
+
+
+class EsquemaCompilado:
+    """Esquema validado y listo para aplicarse de forma vectorizada."""
+
+    def __init__(self, definicion):
+        self.reglas = {}
+        for columna, reglas in definicion.items():
+            reglas = dict(reglas)
+            tipo = reglas.setdefault('tipo', 'texto')
+            if tipo not in TIPOS_VALIDOS:
+                raise ValueError(f"Tipo '{tipo}' no válido para la columna {columna}. Tipos admitidos: {', '.join(TIPOS_VALIDOS)}")
+            reglas.setdefault('alias', [])
+            reglas['nulos'] = [str(v).strip() for v in reglas.get('nulos', [])]
+            reglas.setdefault('requerida', False)
+            reglas.setdefault('obligatoria', reglas['requerida'])
+            reglas.setdefault('invalidos', 'rechazar')
+            if reglas['invalidos'] not in ('rechazar', 'conservar'):
+                raise ValueError(f"Regla 'invalidos' no válida para la columna {columna}: use 'rechazar' o 'conservar'")
+            self.reglas[columna] = reglas
+
+    @property
+    def columnas(self):
+        return list(self.reglas)
+
+    def resolver_columnas(self, disponibles):
+        """Asocia cada columna del esquema a una columna disponible (por nombre o alias).
+
+        Devuelve {columna_canónica: columna_origen}. Lanza ValueError si falta una
+        columna obligatoria.
+        """
+        por_nombre = {}
+        for disponible in disponibles:
+            por_nombre.setdefault(_normalizar_nombre(disponible), disponible)
+
+        mapeo = {}
+        faltantes = []
+        for columna, reglas in self.reglas.items():
+            for candidato in [columna] + list(reglas['alias']):
+                encontrada = por_nombre.get(_normalizar_nombre(candidato))
+                if encontrada is not None:
+                    mapeo[columna] = encontrada
+                    break
+            else:
+                if reglas['obligatoria']:
+                    faltantes.append(columna)
+
+        if faltantes:
+            detalle = ", ".join(
+                f"{col} (alias: {', '.join(self.reglas[col]['alias'])})" if self.reglas[col]['alias'] else col
+                for col in faltantes
+            )
+            raise ValueError(f"Faltan columnas necesarias para el análisis: {detalle}")
+        return mapeo
+
+    def aplicar(self, df):
+        """Limpia `df` en una sola pasada. Devuelve (df_validos, df_rechazados).
+
+        `df` puede traer los nombres de origen o los canónicos. df_rechazados
+        conserva los valores originales y agrega la columna 'Motivo' (la primera
+        regla incumplida de cada registro).
+        """
+        mapeo = self.resolver_columnas(df.columns)
+        origen = df[list(mapeo.values())].copy()
+        origen.columns = list(mapeo)
+
+        limpio = pd.DataFrame(index=df.index)
+        condiciones = []
+        motivos = []
+
+        for columna, reglas in self.reglas.items():
+            if columna not in origen.columns:
+                limpio[columna] = reglas.get('por_defecto', np.nan)
+                if 'presente' in reglas:
+                    limpio[reglas['presente']] = False
+                continue
+
+            serie = origen[columna]
+            presente = serie.notna()
+            texto = serie.astype(str).str.strip().where(presente)
+            vacio = texto.isna() | texto.isin(reglas['nulos'])
+            texto = texto.mask(vacio)
+
+            tipo = reglas['tipo']
+            if tipo == 'texto':
+                valor = texto
+            elif tipo == 'fecha' and reglas.get('formato'):
+                valor = pd.to_datetime(texto, format=reglas['formato'], errors='coerce')
+            elif tipo == 'fecha':
+                # pandas infiere el formato del primer valor; las fechas escritas
+                # con otro formato se reintentan una por una
+                valor = pd.to_datetime(texto, errors='coerce')
+                fallidas = ~vacio & valor.isna()
+                if fallidas.any():
+                    valor[fallidas] = pd.to_datetime(texto[fallidas], format='mixed', errors='coerce')
+            else:
+                if tipo == 'moneda':
+                    texto = texto.str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+                valor = pd.to_numeric(texto, errors='coerce')
+
+            # Valores presentes que no se pudieron convertir al tipo esperado
+            if tipo != 'texto' and reglas['invalidos'] == 'rechazar':
+                condiciones.append((~vacio & valor.isna()).to_numpy())
+                motivos.append(f"{columna} con valor inválido")
+
+            if reglas['requerida']:
+                condiciones.append(vacio.to_numpy())
+                motivos.append(f"{columna} vacío")
+            elif 'por_defecto' in reglas:
+                valor = valor.where(~vacio, reglas['por_defecto'])
+
+            if 'minimo' in reglas:
+                condiciones.append((valor < reglas['minimo']).fillna(False).to_numpy(dtype=bool))
+                motivos.append(f"{columna} menor que {reglas['minimo']}")
+
+            limpio[columna] = valor
+            if 'presente' in reglas:
+                limpio[reglas['presente']] = ~vacio
+
+        if condiciones:
+            motivo = np.select(condiciones, motivos, default='')
+        else:
+            motivo = np.full(len(df), '', dtype=object)
+        rechazado = motivo != ''
+
+        df_validos = limpio[~rechazado].copy()
+        df_rechazados = origen[rechazado].copy()
+        df_rechazados['Motivo'] = motivo[rechazado]
+        return df_validos, df_rechazados
+
+
+class DiagnosticoRechazos:
+    """Resumen acotado de los registros rechazados.
+
+    Guarda solo los conteos por motivo, los identificadores (índice) de los
+    rechazados y una muestra aleatoria uniforme de a lo sumo `tamano_muestra`
+    filas. La muestra es un reservorio: se puede alimentar por lotes con
+    `agregar` y cada fila conserva la misma probabilidad de quedar.
+    """
+
+    def __init__(self, tamano_muestra=200, semilla=None):
+        self.tamano_muestra = tamano_muestra
+        self.conteos = pd.Series(dtype='int64')
+        self.identificadores = np.empty(0, dtype=np.int64)
+        self.muestra = None
+        self._claves = np.empty(0)
+        self._rng = np.random.default_rng(semilla)
+
+    @property
+    def total(self):
+        return int(self.conteos.sum())
+
+    @property
+    def vacio(self):
+        return self.total == 0
+
+    @property
+    def tamano_bytes(self):
+        muestra = int(self.muestra.memory_usage(deep=True).sum()) if self.muestra is not None else 0
+        return muestra + self.identificadores.nbytes
+
+    def agregar(self, df_rechazados):
+        """Incorpora un lote de rechazados (con columna 'Motivo')."""
+        if df_rechazados.empty:
+            return
+        self.conteos = self.conteos.add(df_rechazados['Motivo'].value_counts(), fill_value=0).astype('int64')
+        self.identificadores = np.concatenate([self.identificadores, df_rechazados.index.to_numpy(dtype=np.int64)])
+
+        # Reservorio: cada fila recibe una clave aleatoria y se conservan las k menores
+        candidatos = df_rechazados if self.muestra is None else pd.concat([self.muestra, df_rechazados])
+        claves = np.concatenate([self._claves, self._rng.random(len(df_rechazados))])
+        if len(claves) > self.tamano_muestra:
+            seleccion = np.argpartition(claves, self.tamano_muestra)[:self.tamano_muestra]
+            candidatos = candidatos.iloc[seleccion]
+            claves = claves[seleccion]
+        self.muestra, self._claves = candidatos, claves
+
+    def reporte(self):
+        """Cantidad de registros rechazados por motivo."""
+        reporte = self.conteos.sort_values(ascending=False).reset_index()
+        reporte.columns = ['Motivo', 'Registros']
+        return reporte
+
+    def muestra_ordenada(self):
+        """Muestra de rechazados en el orden original de la tabla."""
+        return self.muestra.sort_index() if self.muestra is not None else pd.DataFrame()
+
+
+def reporte_rechazos(df_rechazados):
+    """Cantidad de registros rechazados por motivo."""
+    reporte = df_rechazados['Motivo'].value_counts().reset_index()
+    reporte.columns = ['Motivo', 'Registros']
+    return reporte
+
+
+def cargar_esquemas(ruta=None):
+    """Devuelve (esquema_unidades, esquema_costos) compilados.
+
+    `ruta` es un JSON opcional con las claves 'unidades' y/o 'costos'; sus
+    columnas reemplazan o amplían las del esquema por defecto.
+    """
+    unidades = copy.deepcopy(ESQUEMA_UNIDADES)
+    costos = copy.deepcopy(ESQUEMA_COSTOS)
+    if ruta:
+        with open(ruta, encoding='utf-8') as f:
+            personalizado = json.load(f)
+        unidades.update(personalizado.get('unidades', {}))
+        costos.update(personalizado.get('costos', {}))
+    return EsquemaCompilado(unidades), EsquemaCompilado(costos)
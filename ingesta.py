@@ -0,0 +1,125 @@
+import contextlib
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import procesamiento
+
+# =====================================
+# Ingesta Concurrente de Archivos Subidos
+# =====================================
+# La base SQLite (persistir + listar tablas + revisar columnas) y el Excel de
+# costos (parseo + limpieza) son independientes, así que se procesan en
+# paralelo en un pool de hilos. Escribir el archivo y consultar SQLite liberan
+# el GIL, por lo que el tiempo total se acerca al de la carga más lenta en
+# lugar de la suma de ambas. Los resultados se entregan a medida que terminan.
+#
+# La clave del conjunto (el hash de los archivos subidos) la calcula la tarea
+# de la base en la misma pasada que escribe su copia local (copiar_con_hash),
+# así que también se solapa con la lectura del Excel.
+
+# Tamaño de los trozos con que se copia y se hashea un archivo subido
+BLOQUE_COPIA = 4 * 1024 * 1024
+
+
+def copiar_con_hash(archivo, destino=None):
+    """sha256 de `archivo` leído por trozos; si se pasa `destino`, lo copia ahí en la misma pasada.
+
+    Devuelve el objeto de hashlib, para agregarle otros contenidos.
+    """
+    h = hashlib.sha256()
+    archivo.seek(0)
+    with open(destino, "wb") if destino is not None else contextlib.nullcontext() as f:
+        while trozo := archivo.read(BLOQUE_COPIA):
+            h.update(trozo)
+            if f is not None:
+                f.write(trozo)
+    archivo.seek(0)
+    return h
+
+
+def preparar_db(archivo, directorio, sufijo=b"", esquema=None):
+    """Copia la base subida a `directorio` calculando su clave, elige la tabla y valida sus columnas.
+
+    La clave es el sha256 del contenido seguido de `sufijo` y la copia queda en
+    `directorio/<clave>.db`; si ya existe (la misma base de un conjunto
+    cargado, que puede estar en uso) se conserva esa.
+    """
+    inicio = time.perf_counter()
+    with tempfile.NamedTemporaryFile(dir=directorio, suffix=".db.tmp", delete=False) as f:
+        temporal = f.name
+    try:
+        h = copiar_con_hash(archivo, temporal)
+        h.update(sufijo)
+        clave = h.hexdigest()
+        ruta_db = os.path.join(directorio, f"{clave}.db")
+        creada = not os.path.exists(ruta_db)
+        if creada:
+            os.replace(temporal, ruta_db)
+        else:
+            os.unlink(temporal)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporal)
+        raise
+
+    try:
+        conn = sqlite3.connect(ruta_db)
+        try:
+            tablas = procesamiento.obtener_tablas(conn)
+            if not tablas:
+                raise ValueError("No se encontraron tablas en la base de datos.")
+            tabla = procesamiento.seleccionar_tabla(tablas)
+            # Falla aquí (y no tras leer la tabla) si faltan columnas del esquema
+            procesamiento.seleccion_esquema(conn, tabla, esquema or procesamiento.ESQUEMA_UNIDADES)
+        finally:
+            conn.close()
+    except Exception:
+        # La copia de una base inválida no se conserva (sí la de un conjunto cargado)
+        if creada:
+            with contextlib.suppress(OSError):
+                os.unlink(ruta_db)
+        raise
+
+    return {
+        'clave': clave,
+        'ruta_db': ruta_db,
+        'tablas': tablas,
+        'tabla': tabla,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def preparar_costos(contenido, esquema=None):
+    """Parsea y limpia el Excel de costos (y su hoja de tipos de cambio, si la tiene)."""
+    inicio = time.perf_counter()
+    df_costos, rechazados = procesamiento.leer_costos(io.BytesIO(contenido), esquema)
+    return {
+        'df_costos': df_costos,
+        'rechazados': rechazados,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def ingerir(archivo_db, directorio, contenido_costos=None):
+    """Procesa en paralelo la base y el archivo de costos.
+
+    Genera tuplas (nombre, resultado, error) en el orden en que terminan, con
+    nombre 'db' o 'costos'; exactamente uno de resultado/error es None. La
+    clave del conjunto (base y costos) viene en el resultado de 'db'.
+    """
+    sufijo = b"\0" + (contenido_costos or b"")
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingesta") as executor:
+        futuros = {executor.submit(preparar_db, archivo_db, directorio, sufijo): 'db'}
+        if contenido_costos is not None:
+            futuros[executor.submit(preparar_costos, contenido_costos)] = 'costos'
+
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as e:
+                yield futuros[futuro], None, e
@@ -0,0 +1,205 @@
+import os
+import threading
+import weakref
+
+import pyarrow as pa
+
+import procesamiento
+
+# =====================================
+# Motores de Análisis (pandas / DuckDB)
+# =====================================
+# Las agregaciones del dashboard se piden a un motor con la misma interfaz que
+# las funciones de procesamiento. El motor 'pandas' las usa tal cual. El motor
+# 'duckdb' (opcional, requiere `pip install duckdb`) lee el DataFrame de
+# registros válidos como tabla Arrow (las columnas de texto de pandas ya son
+# Arrow, así que no se copian; la conversión se hace una vez por DataFrame y
+# se reutiliza mientras exista) y hace los conteos por plataforma, cliente y
+# mes con su motor columnar multihilo; el paso final (porcentajes, totales y
+# orden) es el mismo de procesamiento, así que ambos dan los mismos resultados
+# salvo el redondeo de sumas y promedios de punto flotante.
+#
+# La carga y validación siguen en pandas: las reglas de limpieza del esquema
+# (esquema.py) se aplican sobre el DataFrame. duckdb se importa al crear el
+# motor, para no demorar el arranque cuando no se usa.
+
+MOTORES = ('pandas', 'duckdb')
+
+
+class MotorPandas:
+    nombre = 'pandas'
+
+    resumen_plataformas = staticmethod(procesamiento.resumen_plataformas)
+    metricas_plataforma = staticmethod(procesamiento.metricas_plataforma)
+    top_clientes_plataforma = staticmethod(procesamiento.top_clientes_plataforma)
+    top_activos_plataforma = staticmethod(procesamiento.top_activos_plataforma)
+    desactivaciones_por_mes = staticmethod(procesamiento.desactivaciones_por_mes)
+    costos_por_cliente = staticmethod(procesamiento.costos_por_cliente)
+    top_clientes_por_estado = staticmethod(procesamiento.top_clientes_por_estado)
+
+
+class MotorDuckDB:
+    """Conteos en DuckDB sobre el DataFrame registrado como vista 'datos'.
+
+    Cada consulta usa su propio cursor (DuckDB admite un cursor por hilo), así
+    que el motor se puede compartir entre las sesiones de Streamlit. La tabla
+    Arrow de cada DataFrame se guarda mientras el DataFrame exista (se asume
+    que no se modifica después de consultarlo) y registrarla en el cursor no
+    la copia.
+    """
+    nombre = 'duckdb'
+
+    def __init__(self, hilos=None):
+        try:
+            import duckdb
+        except ImportError:
+            raise ValueError("El motor 'duckdb' requiere instalar el paquete duckdb (pip install duckdb).")
+        self._conexion = duckdb.connect()
+        if hilos:
+            self._conexion.execute(f"SET threads = {int(hilos)}")
+        self._lock = threading.Lock()
+        self._lock_tablas = threading.Lock()
+        self._tablas = {}
+
+    def _tabla(self, df):
+        """Tabla Arrow de `df`, convertida la primera vez que se consulta."""
+        clave = id(df)
+        tablas = self._tablas
+
+        def olvidar(referencia):
+            # Llamado al liberar el DataFrame (sin lock: puede ocurrir en cualquier hilo)
+            if tablas.get(clave, (None,))[0] is referencia:
+                tablas.pop(clave, None)
+
+        with self._lock_tablas:
+            entrada = tablas.get(clave)
+            if entrada is None or entrada[0]() is not df:
+                # Registrar el DataFrame directamente obliga a DuckDB a
+                # inspeccionar cada columna en cada consulta; la tabla Arrow se lee tal cual
+                entrada = (weakref.ref(df, olvidar), pa.Table.from_pandas(df, preserve_index=False))
+                tablas[clave] = entrada
+            return entrada[1]
+
+    def _consultas(self, df, *consultas):
+        """Resultados de `consultas` sobre `df` (vista 'datos'), en el mismo cursor."""
+        tabla = self._tabla(df)
+        with self._lock:
+            cursor = self._conexion.cursor()
+        try:
+            cursor.register('datos', tabla)
+            return [cursor.execute(sql).df() for sql in consultas]
+        finally:
+            cursor.close()
+
+    def _consultar(self, df, sql):
+        return self._consultas(df, sql)[0]
+
+    def resumen_plataformas(self, df_validos):
+        conteos, clientes = self._consultas(df_validos, """
+            SELECT
+                Origen AS "Plataforma",
+                count(*) FILTER (WHERE Estado = 'Activada') AS "Unidades Activas",
+                count(*) FILTER (WHERE Estado = 'Desactivada') AS "Unidades Desactivadas",
+                count(*) AS "Total Unidades",
+                count(DISTINCT Cliente_Cuenta) AS "Clientes Únicos"
+            FROM datos
+            WHERE Origen IS NOT NULL
+            GROUP BY Origen
+            ORDER BY Origen
+        """, "SELECT count(DISTINCT Cliente_Cuenta) AS n FROM datos")
+        return procesamiento.completar_resumen_plataformas(conteos, int(clientes['n'].iloc[0]))
+
+    def metricas_plataforma(self, df_plat):
+        tiene_costos = 'Costo_Mensual' in df_plat.columns
+        costos = """,
+            coalesce(sum(Costo_Mensual) FILTER (WHERE Estado = 'Activada'), 0) AS facturacion,
+            avg(Costo_Mensual) FILTER (WHERE Estado = 'Activada') AS costo_promedio""" if tiene_costos else ""
+        fila = self._consultar(df_plat, f"""
+            SELECT
+                count(*) AS total,
+                count(*) FILTER (WHERE Estado = 'Activada') AS activas,
+                count(*) FILTER (WHERE Estado = 'Desactivada') AS desactivadas,
+                count(DISTINCT Cliente_Cuenta) AS clientes{costos}
+            FROM datos
+        """).iloc[0]
+
+        total_plat, clientes_unicos = int(fila['total']), int(fila['clientes'])
+        metricas = {
+            'Total Unidades': total_plat,
+            'Unidades Activas': int(fila['activas']),
+            'Unidades Desactivadas': int(fila['desactivadas']),
+            'Clientes Únicos': clientes_unicos,
+            'Promedio Unidades/Cliente': (total_plat / clientes_unicos) if clientes_unicos > 0 else 0
+        }
+        if tiene_costos:
+            metricas['Facturación Mensual'] = fila['facturacion']
+            metricas['Costo Promedio por Unidad'] = fila['costo_promedio']
+        return metricas
+
+    def _unidades_por_cliente(self, df_plat):
+        por_cliente = self._consultar(df_plat, """
+            SELECT
+                Cliente_Cuenta,
+                count(*) AS Total,
+                count(*) FILTER (WHERE Estado = 'Activada') AS Activas
+            FROM datos
+            GROUP BY Cliente_Cuenta
+            ORDER BY Cliente_Cuenta
+        """)
+        return procesamiento.completar_unidades_por_cliente(por_cliente)
+
+    def top_clientes_plataforma(self, df_plat, n=10):
+        return procesamiento.ordenar_top_clientes(self._unidades_por_cliente(df_plat), n)
+
+    def top_activos_plataforma(self, df_plat, n=10, minimo_unidades=5):
+        return procesamiento.ordenar_top_activos(self._unidades_por_cliente(df_plat), n, minimo_unidades)
+
+    def desactivaciones_por_mes(self, df):
+        return self._consultar(df, """
+            SELECT strftime(Fecha_de_Desactivacion, '%Y-%m') AS Mes, count(*) AS Cantidad
+            FROM datos
+            WHERE Fecha_de_Desactivacion IS NOT NULL
+            GROUP BY Mes
+            ORDER BY Mes
+        """)
+
+    def costos_por_cliente(self, df):
+        conteos, precios = self._consultas(df, """
+            SELECT
+                Cliente_Cuenta,
+                count(*) FILTER (WHERE Estado = 'Activada') AS Unidades_Activadas,
+                count(*) FILTER (WHERE Estado = 'Desactivada') AS Unidades_Desactivadas,
+                count(Estado) AS Total_Unidades
+            FROM datos
+            GROUP BY Cliente_Cuenta
+            ORDER BY Cliente_Cuenta
+        """, """
+            SELECT Cliente_Cuenta, Costo_Mensual, count(*) AS Unidades
+            FROM datos
+            WHERE Costo_Mensual IS NOT NULL
+            GROUP BY Cliente_Cuenta, Costo_Mensual
+            ORDER BY Cliente_Cuenta, Costo_Mensual
+        """)
+        return procesamiento.completar_costos_por_cliente(conteos, precios)
+
+    def top_clientes_por_estado(self, df_validos, top_n):
+        top_clients = self._consultar(df_validos, """
+            SELECT
+                Cliente_Cuenta,
+                count(Nombre) FILTER (WHERE Estado = 'Activada') AS Activada,
+                count(Nombre) FILTER (WHERE Estado = 'Desactivada') AS Desactivada
+            FROM datos
+            GROUP BY Cliente_Cuenta
+            ORDER BY Cliente_Cuenta
+        """)
+        return procesamiento.completar_top_por_estado(top_clients.rename_axis(columns='Estado'), top_n)
+
+
+def obtener_motor(nombre=None):
+    """Motor de análisis por nombre (por defecto, el de LUC_MOTOR o 'pandas')."""
+    nombre = (nombre or os.environ.get('LUC_MOTOR') or 'pandas').lower()
+    if nombre == 'pandas':
+        return MotorPandas()
+    if nombre == 'duckdb':
+        return MotorDuckDB()
+    raise ValueError(f"Motor de análisis desconocido: '{nombre}'. Opciones: {', '.join(MOTORES)}")
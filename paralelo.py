@@ -0,0 +1,232 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import presupuesto
+import procesamiento
+
+# =====================================
+# Cálculo Paralelo por Plataforma
+# =====================================
+# Los análisis de cada plataforma (métricas, top de clientes, desactivaciones
+# por mes y costos por cliente) son independientes, así que se reparten entre
+# procesos. Los datos no viajan como DataFrames serializados: las columnas que
+# usan los análisis se copian una vez a memoria compartida como arreglos NumPy
+# (texto como códigos enteros, fechas como int64), ordenadas por plataforma, y
+# cada proceso lee solo el tramo [inicio, fin) de su plataforma. Solo los
+# resultados, que son tablas pequeñas, vuelven serializados.
+
+COLUMNAS_ANALISIS = ['Cliente_Cuenta', 'Estado', 'Fecha_de_Desactivacion', 'Costo_Mensual']
+
+# Por debajo de este número de registros no compensa repartir el trabajo
+UMBRAL_REGISTROS = 200_000
+
+# Procesos del pool: no más que este máximo, y entre todos (en reposo, con
+# pandas y NumPy importados) no más que una fracción del presupuesto de memoria
+MAXIMO_PROCESOS = 4
+MEMORIA_PROCESO_MB = 64
+FRACCION_PRESUPUESTO = 0.25
+
+# Crear un pool cambia sys.modules['__main__'] por un momento: de a un hilo a
+# la vez. El pool compartido del proceso se crea una sola vez (obtener_pool)
+_lock_principal = threading.Lock()
+_lock_compartido = threading.Lock()
+_pool_compartido = None
+
+
+def procesos_por_defecto():
+    """Procesos del pool: LUC_PROCESOS, o los núcleos disponibles con los límites de arriba."""
+    if os.environ.get('LUC_PROCESOS'):
+        return max(1, int(os.environ['LUC_PROCESOS']))
+    procesos = min(os.cpu_count() or 1, MAXIMO_PROCESOS)
+    limite = presupuesto.presupuesto_bytes()
+    if limite is not None:
+        procesos = min(procesos, int(limite * FRACCION_PRESUPUESTO // memoria_pool_bytes(1)))
+    return max(1, procesos)
+
+
+def memoria_pool_bytes(procesos):
+    """Memoria estimada (bytes) de un pool de `procesos` procesos en reposo."""
+    return procesos * MEMORIA_PROCESO_MB * 1024 * 1024
+
+
+def crear_pool(procesos=None):
+    """Pool de procesos para los análisis por plataforma, con los procesos ya iniciados.
+
+    No se usa 'fork' (el servidor de Streamlit tiene hilos): con 'forkserver'
+    los procesos parten de un servidor que ya importó este módulo. Un proceso
+    nuevo vuelve a importar el script principal, y bajo Streamlit ese script es
+    app.py, así que los procesos se inician todos aquí con un módulo principal
+    vacío en lugar de hacerlo al enviar la primera tarea. El cambio dura solo
+    mientras se inician los procesos (al enviar las tareas, en este hilo) y
+    nunca hay dos a la vez.
+    """
+    procesos = procesos or procesos_por_defecto()
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context('forkserver')
+        contexto.set_forkserver_preload([__name__])
+    else:
+        contexto = multiprocessing.get_context('spawn')
+
+    executor = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+    with _lock_principal:
+        principal = sys.modules['__main__']
+        vacio = types.ModuleType('__main__')
+        sys.modules['__main__'] = vacio
+        try:
+            # Cada tarea enviada sin procesos libres inicia uno nuevo
+            futuros = [executor.submit(time.sleep, 0.2) for _ in range(procesos)]
+        finally:
+            # Si mientras tanto otro hilo puso su propio módulo principal (un
+            # recorrido del script de Streamlit), se deja el suyo
+            if sys.modules.get('__main__') is vacio:
+                sys.modules['__main__'] = principal
+    for futuro in futuros:
+        futuro.result()
+    return executor
+
+
+def obtener_pool():
+    """Pool compartido del proceso, creado en el primer uso."""
+    global _pool_compartido
+    with _lock_compartido:
+        if _pool_compartido is None:
+            _pool_compartido = crear_pool()
+        return _pool_compartido
+
+
+def descartar_pool(executor):
+    """Cierra un pool roto; si es el compartido, el próximo obtener_pool crea otro."""
+    global _pool_compartido
+    with _lock_compartido:
+        if _pool_compartido is executor:
+            _pool_compartido = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TablaCompartida:
+    """Columnas de un DataFrame en memoria compartida, agrupadas por plataforma.
+
+    `descriptor` es lo único que se envía a los procesos: nombres de los
+    bloques, tipos y, para las columnas de texto, sus categorías.
+    """
+
+    def __init__(self, df, columnas, estrato='Origen'):
+        codigos, plataformas = pd.factorize(df[estrato], sort=True)
+        orden = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[orden], np.arange(len(plataformas) + 1))
+        self.tramos = {
+            plataforma: (int(limites[i]), int(limites[i + 1]))
+            for i, plataforma in enumerate(plataformas)
+        }
+
+        self._bloques = []
+        self.descriptor = {}
+        try:
+            for columna in columnas:
+                if columna in df.columns:
+                    self.descriptor[columna] = self._compartir(df[columna], orden)
+        except Exception:
+            self.cerrar()
+            raise
+
+    def _compartir(self, serie, orden):
+        info = {'dtype_pandas': str(serie.dtype)}
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            arreglo = serie.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            info['tipo'] = 'fecha'
+        elif pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            arreglo = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+            info['tipo'] = 'numero'
+        else:
+            # Categorías ordenadas: agrupar por código da el mismo orden que por texto
+            arreglo, categorias = pd.factorize(serie, sort=True)
+            info['tipo'] = 'texto'
+            info['categorias'] = categorias
+
+        bloque = shared_memory.SharedMemory(create=True, size=max(arreglo.nbytes, 1))
+        self._bloques.append(bloque)
+        np.ndarray(arreglo.shape, dtype=arreglo.dtype, buffer=bloque.buf)[:] = arreglo[orden]
+        info.update({'bloque': bloque.name, 'forma': arreglo.shape, 'dtype': arreglo.dtype.str})
+        return info
+
+    def cerrar(self):
+        """Libera la memoria compartida."""
+        for bloque in self._bloques:
+            bloque.close()
+            bloque.unlink()
+        self._bloques = []
+
+
+def leer_tramo(descriptor, inicio, fin):
+    """Reconstruye (en el proceso que llama) el DataFrame de las filas [inicio, fin)."""
+    columnas = {}
+    for columna, info in descriptor.items():
+        bloque = shared_memory.SharedMemory(name=info['bloque'])
+        try:
+            tramo = np.ndarray(info['forma'], dtype=info['dtype'], buffer=bloque.buf)[inicio:fin].copy()
+        finally:
+            bloque.close()
+
+        if info['tipo'] == 'fecha':
+            columnas[columna] = pd.Series(tramo.view('datetime64[ns]')).astype(info['dtype_pandas'])
+        elif info['tipo'] == 'texto':
+            # Se queda como categórica: convertir cada código a texto costaría más que el análisis
+            columnas[columna] = pd.Categorical.from_codes(tramo, info['categorias'])
+        else:
+            columnas[columna] = pd.Series(tramo).astype(info['dtype_pandas'])
+    return pd.DataFrame(columnas)
+
+
+def _sin_categoricas(resultado):
+    """Devuelve las columnas categóricas de un resultado a su tipo original."""
+    if not isinstance(resultado, pd.DataFrame):
+        return resultado
+    for columna in resultado.columns:
+        if isinstance(resultado[columna].dtype, pd.CategoricalDtype):
+            resultado[columna] = resultado[columna].astype(resultado[columna].cat.categories.dtype)
+    return resultado
+
+
+def analizar_tramo(descriptor, plataforma, inicio, fin, omitir=()):
+    """Análisis de una plataforma, con las claves que usa ConjuntoDatos.agregado."""
+    df_plat = leer_tramo(descriptor, inicio, fin)
+    resultados = {}
+    if 'metricas_plataforma' not in omitir:
+        resultados[('metricas_plataforma', plataforma)] = procesamiento.metricas_plataforma(df_plat)
+    resultados[('top_clientes_plataforma', plataforma)] = procesamiento.top_clientes_plataforma(df_plat)
+    resultados[('top_activos_plataforma', plataforma)] = procesamiento.top_activos_plataforma(df_plat)
+    if df_plat['Fecha_de_Desactivacion'].notna().any():
+        resultados[('desactivaciones_por_mes', plataforma)] = procesamiento.desactivaciones_por_mes(df_plat)
+    if 'Costo_Mensual' in df_plat.columns:
+        resultados[('costos_por_cliente', plataforma)] = procesamiento.costos_por_cliente(df_plat)
+    return {clave: _sin_categoricas(resultado) for clave, resultado in resultados.items()}
+
+
+def analizar_plataformas(df_validos, executor, plataformas=None, omitir=()):
+    """Calcula en paralelo los análisis de cada plataforma. Devuelve un diccionario clave -> resultado.
+
+    `omitir` admite nombres de análisis que no se deben calcular (p. ej.
+    'metricas_plataforma' cuando se muestran estimaciones).
+    """
+    tabla = TablaCompartida(df_validos, COLUMNAS_ANALISIS)
+    try:
+        futuros = [
+            executor.submit(analizar_tramo, tabla.descriptor, plataforma, inicio, fin, tuple(omitir))
+            for plataforma, (inicio, fin) in tabla.tramos.items()
+            if plataformas is None or plataforma in plataformas
+        ]
+        resultados = {}
+        for futuro in as_completed(futuros):
+            resultados.update(futuro.result())
+        return resultados
+    finally:
+        tabla.cerrar()
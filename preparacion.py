@@ -0,0 +1,174 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import procesamiento
+
+# =====================================
+# Base de Trabajo: Índices y Resúmenes Materializados
+# =====================================
+# Paso opcional que copia la tabla subida a una base SQLite local, crea índices
+# de cobertura sobre las columnas de análisis, guarda tablas de resumen (por
+# plataforma, por cliente y por mes) calculadas con las mismas funciones que el
+# dashboard, ejecuta ANALYZE y registra todo en una tabla de metadatos. Las
+# sesiones posteriores sobre el mismo archivo (mismo hash) leen los resúmenes
+# directamente de esa base en lugar de recalcularlos.
+
+VERSION_PREPARACION = 1
+TABLA_METADATOS = '_luc_metadatos'
+
+INDICES = {
+    'idx_unidades_origen': ['Origen', 'Cliente_Cuenta', 'Fecha_de_Desactivacion'],
+    'idx_unidades_cliente': ['Cliente_Cuenta', 'Origen', 'Fecha_de_Desactivacion'],
+    'idx_unidades_fecha': ['Fecha_de_Desactivacion', 'Origen'],
+}
+
+
+def resumen_por_cliente(df_validos):
+    """Unidades totales y activas por plataforma y cliente."""
+    return df_validos.assign(
+        Activa=df_validos['Estado'] == 'Activada'
+    ).groupby(['Origen', 'Cliente_Cuenta']).agg(
+        Total_Unidades=('Activa', 'size'),
+        Unidades_Activadas=('Activa', 'sum')
+    ).reset_index()
+
+
+def resumen_por_mes(df_validos):
+    """Desactivaciones por plataforma y mes ('AAAA-MM')."""
+    partes = [
+        procesamiento.desactivaciones_por_mes(df_validos[df_validos['Origen'] == plataforma]).assign(Origen=plataforma)
+        for plataforma in sorted(df_validos['Origen'].dropna().unique())
+    ]
+    if not partes:
+        return pd.DataFrame(columns=['Mes', 'Cantidad', 'Origen'])
+    return pd.concat(partes, ignore_index=True)
+
+
+def esta_preparada(ruta_trabajo, hash_origen):
+    """True si la base de trabajo existe y corresponde a este archivo y versión."""
+    if not Path(ruta_trabajo).exists():
+        return False
+    conn = sqlite3.connect(Path(ruta_trabajo).as_uri() + "?mode=ro", uri=True)
+    try:
+        metadatos = pd.read_sql_query(
+            f"SELECT hash_origen, version FROM {TABLA_METADATOS} WHERE objeto = 'unidades'",
+            conn
+        )
+    except Exception:
+        return False
+    finally:
+        conn.close()
+    return (
+        not metadatos.empty
+        and metadatos['hash_origen'].iloc[0] == hash_origen
+        and int(metadatos['version'].iloc[0]) == VERSION_PREPARACION
+    )
+
+
+def preparar_base(ruta_origen, tabla, ruta_trabajo, hash_origen, df_validos, esquema=None):
+    """Construye la base de trabajo para `ruta_origen`. Devuelve los metadatos registrados.
+
+    La base se arma en un archivo temporal y se renombra al final, así una
+    sesión concurrente nunca ve una base a medio construir.
+    """
+    ruta_trabajo = Path(ruta_trabajo)
+    ruta_trabajo.parent.mkdir(parents=True, exist_ok=True)
+    ruta_parcial = ruta_trabajo.with_suffix('.parcial')
+    ruta_parcial.unlink(missing_ok=True)
+
+    uri_origen = Path(ruta_origen).resolve().as_uri() + "?mode=ro"
+    conn_origen = sqlite3.connect(uri_origen, uri=True)
+    try:
+        seleccion = procesamiento.seleccion_esquema(conn_origen, tabla, esquema or procesamiento.ESQUEMA_UNIDADES)
+    finally:
+        conn_origen.close()
+
+    conn = sqlite3.connect(ruta_parcial)
+    try:
+        conn.execute("ATTACH DATABASE ? AS origen", (uri_origen,))
+        conn.execute(
+            f"CREATE TABLE unidades AS SELECT rowid AS _rowid, {seleccion} FROM origen.{procesamiento.identificador_sql(tabla)}"
+        )
+        conn.execute("DETACH DATABASE origen")
+
+        registros = []
+        ahora = time.strftime('%Y-%m-%d %H:%M:%S')
+        filas = conn.execute("SELECT COUNT(*) FROM unidades").fetchone()[0]
+        registros.append(('unidades', 'tabla', filas))
+
+        for nombre, columnas in INDICES.items():
+            conn.execute(
+                f"CREATE INDEX {nombre} ON unidades ({', '.join(procesamiento.identificador_sql(c) for c in columnas)})"
+            )
+            registros.append((nombre, 'indice', filas))
+
+        resumenes = {
+            'resumen_plataformas': procesamiento.resumen_plataformas(df_validos),
+            'resumen_clientes': resumen_por_cliente(df_validos),
+            'resumen_mensual': resumen_por_mes(df_validos),
+        }
+        for nombre, df_resumen in resumenes.items():
+            df_resumen.to_sql(nombre, conn, index=False)
+            registros.append((nombre, 'resumen', len(df_resumen)))
+        conn.execute("CREATE INDEX idx_resumen_clientes ON resumen_clientes (Origen, Total_Unidades DESC)")
+        conn.execute("CREATE INDEX idx_resumen_mensual ON resumen_mensual (Origen, Mes)")
+
+        conn.execute("ANALYZE")
+
+        conn.execute(
+            f"""CREATE TABLE {TABLA_METADATOS} (
+                objeto TEXT PRIMARY KEY, tipo TEXT, filas INTEGER,
+                hash_origen TEXT, tabla_origen TEXT, version INTEGER, creado TEXT
+            )"""
+        )
+        conn.executemany(
+            f"INSERT INTO {TABLA_METADATOS} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(objeto, tipo, filas, hash_origen, tabla, VERSION_PREPARACION, ahora) for objeto, tipo, filas in registros]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    ruta_parcial.replace(ruta_trabajo)
+    return leer_metadatos(ruta_trabajo)
+
+
+def leer_metadatos(ruta_trabajo):
+    """Objetos registrados en la base de trabajo."""
+    conn = sqlite3.connect(Path(ruta_trabajo).as_uri() + "?mode=ro", uri=True)
+    try:
+        return pd.read_sql_query(f"SELECT * FROM {TABLA_METADATOS} ORDER BY tipo, objeto", conn)
+    finally:
+        conn.close()
+
+
+def leer_resumenes(ruta_trabajo):
+    """Agregados del dashboard leídos de los resúmenes materializados.
+
+    Las claves coinciden con las que usa ConjuntoDatos.agregado, de modo que
+    el dashboard los toma sin recalcular.
+    """
+    conn = sqlite3.connect(Path(ruta_trabajo).as_uri() + "?mode=ro", uri=True)
+    try:
+        resumen = pd.read_sql_query("SELECT * FROM resumen_plataformas", conn)
+        mensual = pd.read_sql_query(
+            "SELECT Mes, SUM(Cantidad) AS Cantidad FROM resumen_mensual GROUP BY Mes ORDER BY Mes",
+            conn
+        )
+        mensual_plataforma = pd.read_sql_query(
+            "SELECT Origen, Mes, Cantidad FROM resumen_mensual ORDER BY Origen, Mes",
+            conn
+        )
+    finally:
+        conn.close()
+
+    agregados = {
+        'resumen_plataformas': resumen,
+        'desactivaciones_por_mes': mensual,
+    }
+    for plataforma, df_mes in mensual_plataforma.groupby('Origen'):
+        agregados[('desactivaciones_por_mes', plataforma)] = df_mes[['Mes', 'Cantidad']].reset_index(drop=True)
+    return agregados
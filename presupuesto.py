@@ -0,0 +1,183 @@
+import os
+import tempfile
+from pathlib import Path
+
+# =====================================
+# Presupuesto de Memoria y Estrategia de Carga
+# =====================================
+# Antes de leer una base se estima cuánta memoria ocupará cada etapa (lectura,
+# validación e integración de costos) a partir del número de filas (un COUNT
+# en SQLite) y del tamaño por fila de una muestra que sí se procesa. Según el
+# presupuesto (LUC_MEMORIA_MB) se elige la estrategia de carga:
+#
+#   memoria   la tabla completa de una vez (lo más rápido).
+#   bloques   la tabla se lee por rangos de rowid (cada bloque es una consulta
+#             SQL aparte) y cada bloque se valida e integra con los costos
+#             antes de leer el siguiente: nunca están todos los registros
+#             crudos en memoria.
+#   disco     como 'bloques', pero cada bloque ya procesado se escribe en
+#             Parquet en disco y al final se leen columna por columna, sin
+#             tener los bloques y el resultado en memoria al mismo tiempo.
+#
+# Del presupuesto se descuenta la memoria que el proceso ya tiene ocupada
+# (`reservado`: en el dashboard, los conjuntos de la caché compartida y los
+# procesos del pool de cálculo paralelo). Si ni siquiera los registros válidos
+# caben en lo que queda se lanza ValueError con la estimación, en lugar de
+# dejar que el sistema mate el proceso a mitad de la carga.
+
+ESTRATEGIAS = ('memoria', 'bloques', 'disco')
+
+DESCRIPCIONES = {
+    'memoria': "carga completa en memoria",
+    'bloques': "lectura por bloques desde SQLite",
+    'disco': "lectura por bloques con resultados intermedios en disco (Parquet)",
+}
+
+# Presupuesto por defecto (MB); 0 desactiva el control
+PRESUPUESTO_MB = 2048
+
+# Filas de la muestra con la que se mide el tamaño por fila
+FILAS_MUESTRA = 2000
+
+# Memoria de cada etapa sobre los datos que recibe (medida con el RSS máximo
+# del proceso): read_sql arma tuplas de Python con cada valor antes de crear
+# el DataFrame, la validación guarda el texto original, el limpio y los
+# válidos, el cruce con los costos copia los registros válidos al agregar las
+# columnas nuevas y releer los bloques de disco suma las piezas de una columna
+FACTOR_LECTURA = 10.0
+FACTOR_VALIDACION = 3.0
+FACTOR_COSTOS = 1.5
+FACTOR_RELECTURA = 1.5
+
+# Fracción del presupuesto que puede ocupar el procesamiento de un bloque
+FRACCION_BLOQUE = 0.1
+MINIMO_FILAS_BLOQUE = 10_000
+
+
+def presupuesto_bytes(megabytes=None):
+    """Presupuesto de memoria en bytes (LUC_MEMORIA_MB; None si está desactivado)."""
+    if megabytes is None:
+        megabytes = float(os.environ.get('LUC_MEMORIA_MB') or PRESUPUESTO_MB)
+    if megabytes <= 0:
+        return None
+    return int(megabytes * 1024 * 1024)
+
+
+def directorio_desborde():
+    """Directorio donde la estrategia 'disco' escribe sus bloques."""
+    base = Path(os.environ.get('LUC_DIR_TRABAJO', Path(tempfile.gettempdir()) / 'luc_app' / 'trabajo'))
+    return base / 'desborde'
+
+
+def _mb(valor):
+    """Bytes como texto en MB (con un decimal si son pocos)."""
+    mb = valor / 1024 / 1024
+    return f"{mb:,.0f} MB" if mb >= 10 else f"{mb:.1f} MB"
+
+
+class PlanCarga:
+    """Estrategia elegida para cargar una tabla y las estimaciones que la justifican.
+
+    `por_fila` tiene los bytes por fila de la tabla cruda ('crudo'), de los
+    registros válidos ('validos') y de los válidos con costos ('final'),
+    medidos sobre la muestra (por fila de la tabla, así que ya descuentan la
+    proporción de rechazados).
+    """
+
+    def __init__(self, estrategia, filas, por_fila, presupuesto, filas_por_bloque=None, reservado=0):
+        self.estrategia = estrategia
+        self.filas = filas
+        self.por_fila = por_fila
+        self.presupuesto = presupuesto
+        self.filas_por_bloque = filas_por_bloque or filas
+        self.reservado = reservado
+
+    @property
+    def disponible(self):
+        """Bytes del presupuesto que quedan para la carga (None sin presupuesto)."""
+        return None if self.presupuesto is None else self.presupuesto - self.reservado
+
+    @property
+    def etapas(self):
+        """Memoria estimada (bytes) de cada etapa si se cargara la tabla completa."""
+        return estimar_etapas(self.filas, self.por_fila)
+
+    @property
+    def pico(self):
+        """Memoria máxima estimada (bytes) con la estrategia elegida."""
+        return pico_estrategia(self.estrategia, self.filas, self.por_fila, self.filas_por_bloque)
+
+    def descripcion(self):
+        """Texto para informar la estrategia al usuario."""
+        texto = f"{DESCRIPCIONES[self.estrategia]}, ~{_mb(self.pico)} estimados"
+        if self.presupuesto is not None and self.reservado:
+            texto += f" de {_mb(self.disponible)} disponibles ({_mb(self.presupuesto)} de presupuesto, {_mb(self.reservado)} ya en uso)"
+        elif self.presupuesto is not None:
+            texto += f" de {_mb(self.presupuesto)} de presupuesto"
+        if self.estrategia != 'memoria':
+            texto += (
+                f"; la carga completa necesitaría ~{_mb(max(self.etapas.values()))}"
+                f" (bloques de {self.filas_por_bloque:,} filas)"
+            )
+        return texto
+
+
+def _por_fila_bloque(por_fila):
+    """Bytes por fila en el peor momento de procesar un bloque (de lectura a costos)."""
+    return max(estimar_etapas(1, por_fila).values())
+
+
+def estimar_etapas(filas, por_fila):
+    """Memoria estimada (bytes) de cada etapa de la carga para `filas` filas."""
+    crudo, validos, final = por_fila['crudo'], por_fila['validos'], por_fila['final']
+    return {
+        'lectura': filas * crudo * FACTOR_LECTURA,
+        'validacion': filas * (crudo + validos * FACTOR_VALIDACION),
+        'costos': filas * (validos + final * FACTOR_COSTOS),
+    }
+
+
+def pico_estrategia(estrategia, filas, por_fila, filas_por_bloque):
+    """Memoria máxima estimada (bytes) de cargar `filas` filas con `estrategia`."""
+    if estrategia == 'memoria':
+        return max(estimar_etapas(filas, por_fila).values())
+    bloque = min(filas, filas_por_bloque) * _por_fila_bloque(por_fila)
+    final = filas * por_fila['final']
+    if estrategia == 'bloques':
+        # Al final se concatenan los bloques: piezas y resultado a la vez
+        return 2 * final + bloque
+    # 'disco': los bloques ya están en disco; solo el resultado y el último bloque
+    return final * FACTOR_RELECTURA + bloque
+
+
+def elegir_estrategia(filas, por_fila, presupuesto=None, reservado=0):
+    """Devuelve el PlanCarga más rápido que cabe en `presupuesto` bytes menos
+    los `reservado` bytes que ya están en uso.
+
+    Sin presupuesto se carga todo en memoria. Lanza ValueError si ni siquiera
+    los registros ya procesados caben.
+    """
+    if presupuesto is None:
+        return PlanCarga('memoria', filas, por_fila, None)
+
+    disponible = max(presupuesto - reservado, 0)
+    filas_por_bloque = int(FRACCION_BLOQUE * disponible / max(_por_fila_bloque(por_fila), 1))
+    filas_por_bloque = min(filas, max(MINIMO_FILAS_BLOQUE, filas_por_bloque))
+
+    for estrategia in ESTRATEGIAS:
+        if pico_estrategia(estrategia, filas, por_fila, filas_por_bloque) <= disponible:
+            return PlanCarga(estrategia, filas, por_fila, presupuesto, filas_por_bloque, reservado)
+
+    minimo = pico_estrategia('disco', filas, por_fila, MINIMO_FILAS_BLOQUE)
+    if reservado:
+        limite = (
+            f"más que la memoria disponible ({_mb(disponible)}: del presupuesto de {_mb(presupuesto)}, "
+            f"{_mb(reservado)} ya están en uso)"
+        )
+    else:
+        limite = f"más que el presupuesto de memoria ({_mb(presupuesto)})"
+    raise ValueError(
+        f"Se estima que cargar los {filas:,} registros necesita al menos ~{_mb(minimo)} "
+        f"(por bloques y con resultados intermedios en disco), {limite}. "
+        "Aumente LUC_MEMORIA_MB o divida la base antes de cargarla."
+    )
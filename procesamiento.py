@@ -0,0 +1,743 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import categorias
+import presupuesto
+from esquema import ESQUEMA_TIPOS_CAMBIO, DiagnosticoRechazos, EsquemaCompilado, cargar_esquemas
+
+# =====================================
+# Pipeline de Datos (sin interfaz)
+# =====================================
+# Funciones puras compartidas por el dashboard (app.py) y el reporte por
+# lotes (reporte.py). No dependen de Streamlit: ante datos inválidos lanzan
+# ValueError y es quien las llama el que decide cómo mostrar el error.
+
+# Esquemas por defecto (o los del JSON indicado en LUC_ESQUEMA)
+ESQUEMA_UNIDADES, ESQUEMA_COSTOS = cargar_esquemas(os.environ.get('LUC_ESQUEMA'))
+
+COLUMNAS_INTEGRACION_COSTOS = ['Cuenta', 'Costo', 'Tipo']
+# Columnas opcionales del historial de precios que también pasan a las unidades
+COLUMNAS_VERSION_COSTOS = ['Vigente_Desde', 'Moneda', 'Costo_Original']
+
+MONEDA_BASE = 'USD'
+HOJA_TIPOS_CAMBIO = 'Tipos de Cambio'
+ESQUEMA_CAMBIO = EsquemaCompilado(ESQUEMA_TIPOS_CAMBIO)
+
+# Meses que cubre cada ciclo de facturación
+MESES_POR_CICLO = {'mensual': 1, 'semestral': 6, 'anual': 12}
+
+# Fecha de vigencia para las versiones sin fecha (vigentes desde siempre)
+FECHA_SIN_VIGENCIA = pd.Timestamp('1900-01-01')
+
+
+def limpiar_costos(df_costos, esquema=None, df_tipos_cambio=None):
+    """Aplica el esquema de costos y lleva los costos a la moneda base.
+
+    Devuelve (df_costos, df_rechazados).
+    """
+    df_costos, rechazados = (esquema or ESQUEMA_COSTOS).aplicar(df_costos)
+    df_costos, sin_cambio = convertir_moneda(df_costos, df_tipos_cambio)
+    if not sin_cambio.empty:
+        rechazados = pd.concat([rechazados, sin_cambio])
+    return df_costos, rechazados
+
+
+def leer_costos(costos_file, esquema=None):
+    """Lee y limpia el archivo Excel de costos (ruta o archivo abierto).
+
+    Los costos se toman de la primera hoja; la hoja opcional 'Tipos de Cambio'
+    trae las tasas para convertir otras monedas a la moneda base.
+    """
+    hojas = pd.read_excel(costos_file, sheet_name=None)
+    df_tipos_cambio = hojas.pop(HOJA_TIPOS_CAMBIO, None)
+    if not hojas:
+        raise ValueError("El archivo de costos no tiene una hoja con costos.")
+    return limpiar_costos(next(iter(hojas.values())), esquema, df_tipos_cambio)
+
+
+def unir_vigente(izquierda, fechas, derecha, por_izquierda, por_derecha, fecha_derecha='Vigente_Desde'):
+    """Une a cada fila de `izquierda` la versión de `derecha` vigente en su fecha.
+
+    Es un merge_asof por clave (por_izquierda / por_derecha) sobre las fechas
+    ordenadas: toma la última versión con fecha de vigencia <= `fechas`. Si la
+    fecha es anterior a la primera versión de la clave, usa esa primera versión.
+    Las versiones sin fecha rigen desde siempre. Conserva el orden de
+    `izquierda` y devuelve un índice nuevo (como merge).
+    """
+    izquierda = izquierda.assign(
+        _orden=np.arange(len(izquierda)),
+        _fecha=pd.to_datetime(fechas).astype('datetime64[ns]').to_numpy()
+    ).sort_values('_fecha', kind='stable')
+    if fecha_derecha in derecha.columns:
+        vigencia = derecha[fecha_derecha].fillna(FECHA_SIN_VIGENCIA)
+    else:
+        vigencia = pd.Series(FECHA_SIN_VIGENCIA, index=derecha.index)
+    derecha = derecha.assign(
+        _fecha=pd.to_datetime(vigencia).astype('datetime64[ns]'),
+        _version=True
+    ).sort_values('_fecha', kind='stable')
+
+    unido = pd.merge_asof(
+        izquierda, derecha, on='_fecha', left_by=por_izquierda, right_by=por_derecha, direction='backward'
+    )
+    faltantes = unido['_version'].isna().to_numpy()
+    if faltantes.any():
+        # Fechas anteriores a la primera versión: se usa la versión más antigua
+        anteriores = pd.merge_asof(
+            izquierda.iloc[np.flatnonzero(faltantes)], derecha,
+            on='_fecha', left_by=por_izquierda, right_by=por_derecha, direction='forward'
+        )
+        unido = pd.concat([unido[~faltantes], anteriores], ignore_index=True)
+
+    unido = unido.sort_values('_orden', kind='stable')
+    return unido.drop(columns=['_orden', '_fecha', '_version']).reset_index(drop=True)
+
+
+def convertir_moneda(df_costos, df_tipos_cambio=None):
+    """Convierte 'Costo' a la moneda base con la tasa vigente en la fecha de cada versión.
+
+    Conserva el valor original en 'Costo_Original'. Devuelve (df_costos,
+    df_rechazados); se rechazan las filas en otra moneda sin tipo de cambio.
+    """
+    if 'Moneda' not in df_costos.columns:
+        return df_costos, pd.DataFrame(columns=['Motivo'])
+
+    moneda = df_costos['Moneda'].fillna(MONEDA_BASE).astype(str).str.strip().str.upper()
+    df_costos = df_costos.assign(Moneda=moneda, Costo_Original=df_costos['Costo'])
+    extranjera = (moneda != MONEDA_BASE).to_numpy()
+    if not extranjera.any():
+        return df_costos, pd.DataFrame(columns=['Motivo'])
+
+    tasa = np.ones(len(df_costos))
+    if df_tipos_cambio is not None:
+        tipos, _ = ESQUEMA_CAMBIO.aplicar(df_tipos_cambio)
+        tipos['Moneda'] = tipos['Moneda'].astype(str).str.strip().str.upper()
+        versiones = df_costos.iloc[np.flatnonzero(extranjera)]
+        fechas = versiones['Vigente_Desde'] if 'Vigente_Desde' in versiones.columns else None
+        fechas = (fechas if fechas is not None else pd.Series(pd.NaT, index=versiones.index)).fillna(FECHA_SIN_VIGENCIA)
+        unido = unir_vigente(
+            versiones[['Moneda']], fechas, tipos[['Moneda', 'Tasa', 'Vigente_Desde']], 'Moneda', 'Moneda'
+        )
+        tasa[extranjera] = unido['Tasa'].to_numpy(dtype=float)
+    else:
+        tasa[extranjera] = np.nan
+
+    sin_tasa = np.isnan(tasa)
+    df_costos['Costo'] = df_costos['Costo'] * tasa
+    rechazados = df_costos[sin_tasa].copy()
+    rechazados['Motivo'] = 'Moneda sin tipo de cambio'
+    return df_costos[~sin_tasa], rechazados
+
+
+def obtener_tablas(conn):
+    """Obtiene la lista de tablas de la base de datos."""
+    tablas_query = "SELECT name FROM sqlite_master WHERE type='table'"
+    tablas = pd.read_sql_query(tablas_query, conn)['name'].tolist()
+    return tablas
+
+
+def seleccionar_tabla(tablas):
+    """Usa la tabla 'main' si existe; si no, la primera tabla disponible."""
+    if 'main' in tablas:
+        return 'main'
+    return tablas[0]
+
+
+def identificador_sql(nombre):
+    """Nombre de tabla/columna entre comillas para SQLite."""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def seleccion_esquema(conn, tabla, esquema):
+    """Lista SELECT con las columnas de origen renombradas a las del esquema."""
+    columnas_query = f"PRAGMA table_info({identificador_sql(tabla)})"
+    columnas = pd.read_sql_query(columnas_query, conn)
+    mapeo = esquema.resolver_columnas(columnas['name'].tolist())
+    return ", ".join(
+        f"{identificador_sql(origen)} AS {identificador_sql(columna)}" for columna, origen in mapeo.items()
+    )
+
+
+def leer_tabla(conn, tabla, esquema=None):
+    """Lee las columnas del esquema de una tabla, ya con sus nombres canónicos.
+
+    El índice del DataFrame es el rowid de SQLite, para poder volver a leer
+    registros concretos más tarde (ver leer_registros_rechazados).
+    """
+    seleccion = seleccion_esquema(conn, tabla, esquema or ESQUEMA_UNIDADES)
+    return pd.read_sql_query(
+        f"SELECT rowid AS _rowid, {seleccion} FROM {identificador_sql(tabla)}",
+        conn,
+        index_col='_rowid'
+    )
+
+
+def leer_bloques(conn, tabla, filas_por_bloque, esquema=None):
+    """Lee la tabla en bloques de a lo sumo `filas_por_bloque` filas, en orden de rowid.
+
+    Cada bloque es una consulta aparte (rowid mayor que el último leído), así
+    SQLite nunca arma el resultado completo en memoria.
+    """
+    seleccion = seleccion_esquema(conn, tabla, esquema or ESQUEMA_UNIDADES)
+    consulta = f"SELECT rowid AS _rowid, {seleccion} FROM {identificador_sql(tabla)}"
+    ultimo = None
+    while True:
+        if ultimo is None:
+            bloque = pd.read_sql_query(
+                f"{consulta} ORDER BY rowid LIMIT ?", conn, params=[filas_por_bloque], index_col='_rowid'
+            )
+        else:
+            bloque = pd.read_sql_query(
+                f"{consulta} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                conn,
+                params=[ultimo, filas_por_bloque],
+                index_col='_rowid'
+            )
+        if bloque.empty:
+            return
+        yield bloque
+        if len(bloque) < filas_por_bloque:
+            return
+        ultimo = int(bloque.index[-1])
+
+
+def leer_registros_rechazados(conn, tabla, rowids, esquema=None):
+    """Relee de SQLite los registros indicados por rowid y les agrega el motivo de rechazo."""
+    esquema = esquema or ESQUEMA_UNIDADES
+    seleccion = seleccion_esquema(conn, tabla, esquema)
+    # Los rowids se pasan como un único arreglo JSON para no chocar con el límite de parámetros
+    df = pd.read_sql_query(
+        f"""
+        SELECT rowid AS _rowid, {seleccion} FROM {identificador_sql(tabla)}
+        WHERE rowid IN (SELECT value FROM json_each(?))
+        """,
+        conn,
+        params=[json.dumps([int(r) for r in rowids])],
+        index_col='_rowid'
+    )
+    _, df_rechazados = esquema.aplicar(df)
+    return df_rechazados
+
+
+def validar_registros(df, esquema=None, diagnostico=None):
+    """Valida y limpia los registros según el esquema. Devuelve (df_validos, diagnostico).
+
+    De los rechazados solo se conserva un DiagnosticoRechazos (conteos por
+    motivo, rowids y una muestra acotada), no el DataFrame completo. Al validar
+    por bloques se pasa el mismo `diagnostico` en cada llamada.
+    """
+    df_validos, df_rechazados = (esquema or ESQUEMA_UNIDADES).aplicar(df)
+    # Una fecha informada pero ilegible también cuenta como desactivación
+    if 'Fecha_Informada' in df_validos.columns:
+        desactivada = df_validos.pop('Fecha_Informada')
+    else:
+        desactivada = df_validos['Fecha_de_Desactivacion'].notna()
+    df_validos['Estado'] = desactivada.map({False: 'Activada', True: 'Desactivada'})
+    if diagnostico is None:
+        diagnostico = DiagnosticoRechazos()
+    diagnostico.agregar(df_rechazados)
+    return df_validos, diagnostico
+
+
+def integrar_costos(df_validos, df_costos, fecha_referencia=None):
+    """Integra la información de costos al DataFrame de registros válidos.
+
+    Con historial de precios (columna 'Vigente_Desde'), cada unidad toma el
+    costo vigente a su fecha de desactivación; las unidades activas, el
+    vigente a `fecha_referencia` (por defecto, hoy).
+    """
+    if not all(col in df_costos.columns for col in COLUMNAS_INTEGRACION_COSTOS):
+        raise ValueError(
+            f"Columnas faltantes en df_costos. Columnas requeridas: {COLUMNAS_INTEGRACION_COSTOS}"
+        )
+
+    columnas = COLUMNAS_INTEGRACION_COSTOS + [c for c in COLUMNAS_VERSION_COSTOS if c in df_costos.columns]
+    costos = df_costos[columnas].copy()
+
+    # Validar y limpiar datos de costo
+    costos['Costo'] = pd.to_numeric(costos['Costo'], errors='coerce')
+    costos.loc[costos['Costo'] < 0, 'Costo'] = None
+
+    if fecha_referencia is None:
+        fecha_referencia = pd.Timestamp.now().normalize()
+    fechas = pd.to_datetime(df_validos['Fecha_de_Desactivacion'], errors='coerce').fillna(fecha_referencia)
+    df_validos = unir_vigente(df_validos, fechas, costos, 'Cliente_Cuenta', 'Cuenta')
+
+    # Costo mensual según el ciclo; un ciclo desconocido deja el costo vacío
+    tipo = df_validos['Tipo'].str.lower()
+    meses = tipo.map(MESES_POR_CICLO)
+    df_validos['Costo_Mensual'] = df_validos['Costo'].where(tipo.isna(), df_validos['Costo'] / meses)
+    df_validos['Ciclo_Facturacion'] = df_validos['Tipo'].fillna('No especificado')
+
+    # Calcular métricas adicionales
+    df_validos['Perdida_Por_Desactivacion'] = df_validos['Costo_Mensual'].where(df_validos['Estado'] == 'Desactivada', 0)
+
+    return df_validos
+
+
+# =====================================
+# Carga con Presupuesto de Memoria
+# =====================================
+
+def _bytes_por_fila(df, filas):
+    return int(df.memory_usage(deep=True).sum()) / filas if filas else 0
+
+
+def planificar_carga(conn, tabla, df_costos=None, esquema=None, presupuesto_mb=None, reservado=0):
+    """Elige la estrategia de carga de la tabla según el presupuesto de memoria.
+
+    Cuenta las filas en SQLite y procesa una muestra (validación y costos) para
+    medir los bytes por fila de cada etapa. Devuelve un presupuesto.PlanCarga;
+    lanza ValueError si la tabla no cabe en el presupuesto (`presupuesto_mb`,
+    por defecto LUC_MEMORIA_MB) menos los `reservado` bytes ya en uso.
+    """
+    filas = int(pd.read_sql_query(f"SELECT count(*) AS n FROM {identificador_sql(tabla)}", conn)['n'].iloc[0])
+    muestra = next(leer_bloques(conn, tabla, presupuesto.FILAS_MUESTRA, esquema), None)
+    if muestra is None:
+        return presupuesto.PlanCarga('memoria', 0, {'crudo': 0, 'validos': 0, 'final': 0}, None)
+
+    validos, _ = validar_registros(muestra, esquema)
+    final = integrar_costos(validos, df_costos) if df_costos is not None and not validos.empty else validos
+    por_fila = {
+        'crudo': _bytes_por_fila(muestra, len(muestra)),
+        'validos': _bytes_por_fila(validos, len(muestra)),
+        'final': _bytes_por_fila(final, len(muestra)),
+    }
+    return presupuesto.elegir_estrategia(filas, por_fila, presupuesto.presupuesto_bytes(presupuesto_mb), reservado)
+
+
+def _unir_bloques_parquet(rutas):
+    # Columna por columna: en memoria solo están el resultado y las piezas de
+    # una columna (leer la tabla Arrow completa y convertirla duplicaría todo).
+    # pd.concat promueve los tipos que difieran entre bloques (enteros y flotantes)
+    import pyarrow.parquet as pq
+
+    datos = {}
+    for columna in pq.read_schema(rutas[0]).names:
+        datos[columna] = pd.concat(
+            [pq.read_table(ruta, columns=[columna]).column(0).to_pandas() for ruta in rutas],
+            ignore_index=True
+        )
+    return pd.DataFrame(datos, copy=False)
+
+
+def cargar_por_bloques(conn, tabla, plan, df_costos=None, esquema=None, fecha_referencia=None):
+    """Carga la tabla por bloques según `plan` ('bloques' o 'disco').
+
+    Cada bloque se lee, valida e integra con los costos antes de leer el
+    siguiente. Con 'disco' los bloques procesados se escriben en Parquet y se
+    leen juntos al final. Devuelve (total_registros, df_validos, diagnostico),
+    lo mismo que leer la tabla completa y pasarla por validar_registros e
+    integrar_costos.
+    """
+    diagnostico = DiagnosticoRechazos()
+    total_registros = 0
+    piezas = []
+    # integrar_costos numera de nuevo las filas; sin costos el índice es el rowid
+    conservar_indice = df_costos is None
+
+    directorio = None
+    if plan.estrategia == 'disco':
+        base = presupuesto.directorio_desborde()
+        base.mkdir(parents=True, exist_ok=True)
+        directorio = tempfile.TemporaryDirectory(dir=base)
+
+    try:
+        for numero, bloque in enumerate(leer_bloques(conn, tabla, plan.filas_por_bloque, esquema)):
+            total_registros += len(bloque)
+            df_validos, _ = validar_registros(bloque, esquema, diagnostico)
+            del bloque
+            if df_validos.empty:
+                continue
+            if df_costos is not None:
+                df_validos = integrar_costos(df_validos, df_costos, fecha_referencia)
+            if directorio is None:
+                piezas.append(df_validos)
+            else:
+                ruta = Path(directorio.name) / f"bloque_{numero:06d}.parquet"
+                (df_validos.reset_index() if conservar_indice else df_validos).to_parquet(ruta, index=False)
+                piezas.append(ruta)
+            del df_validos
+
+        if not piezas:
+            df_validos = pd.DataFrame()
+        elif directorio is None:
+            df_validos = pd.concat(piezas, ignore_index=not conservar_indice)
+        else:
+            df_validos = _unir_bloques_parquet(piezas)
+            if conservar_indice:
+                df_validos = df_validos.set_index('_rowid')
+    finally:
+        if directorio is not None:
+            directorio.cleanup()
+
+    return total_registros, df_validos, diagnostico
+
+
+# =====================================
+# Agregaciones
+# =====================================
+
+# Cada agregación se divide en el conteo sobre los registros (lo costoso, que
+# un motor como DuckDB puede hacer por su cuenta, ver motores.py) y un paso
+# final sobre la tabla ya agregada (porcentajes, totales, orden), compartido
+# por todos los motores para que den exactamente los mismos resultados.
+
+def resumen_plataformas(df_validos):
+    """Resumen de unidades por plataforma con una fila final de TOTAL."""
+    plataformas = sorted(df_validos['Origen'].dropna().unique())
+    conteos = []
+
+    for plataforma in plataformas:
+        df_plat = df_validos[df_validos['Origen'] == plataforma]
+        conteos.append({
+            'Plataforma': plataforma,
+            'Unidades Activas': df_plat[df_plat['Estado'] == 'Activada'].shape[0],
+            'Unidades Desactivadas': df_plat[df_plat['Estado'] == 'Desactivada'].shape[0],
+            'Total Unidades': len(df_plat),
+            'Clientes Únicos': df_plat['Cliente_Cuenta'].nunique()
+        })
+
+    return completar_resumen_plataformas(pd.DataFrame(conteos), df_validos['Cliente_Cuenta'].nunique())
+
+
+def completar_resumen_plataformas(conteos, clientes_unicos):
+    """Agrega el % de activas y la fila de TOTAL a los conteos por plataforma (ordenados)."""
+    df_resumen = conteos[['Plataforma', 'Unidades Activas', 'Unidades Desactivadas', 'Total Unidades']].copy()
+    df_resumen['% Activas'] = df_resumen['Unidades Activas'] / df_resumen['Total Unidades'] * 100
+    df_resumen['Clientes Únicos'] = conteos['Clientes Únicos']
+
+    # Agregar fila de totales
+    totales = {
+        'Plataforma': 'TOTAL',
+        'Unidades Activas': df_resumen['Unidades Activas'].sum(),
+        'Unidades Desactivadas': df_resumen['Unidades Desactivadas'].sum(),
+        'Total Unidades': df_resumen['Total Unidades'].sum(),
+        '% Activas': (df_resumen['Unidades Activas'].sum() / df_resumen['Total Unidades'].sum() * 100) if df_resumen['Total Unidades'].sum() > 0 else 0,
+        'Clientes Únicos': clientes_unicos
+    }
+    return pd.concat([df_resumen, pd.DataFrame([totales])], ignore_index=True)
+
+
+def metricas_plataforma(df_plat):
+    """Métricas generales y de facturación de una plataforma."""
+    total_plat = len(df_plat)
+    activas_plat = df_plat[df_plat['Estado'] == 'Activada'].shape[0]
+    desactivadas_plat = df_plat[df_plat['Estado'] == 'Desactivada'].shape[0]
+    clientes_unicos = df_plat['Cliente_Cuenta'].nunique()
+
+    metricas = {
+        'Total Unidades': total_plat,
+        'Unidades Activas': activas_plat,
+        'Unidades Desactivadas': desactivadas_plat,
+        'Clientes Únicos': clientes_unicos,
+        'Promedio Unidades/Cliente': (total_plat / clientes_unicos) if clientes_unicos > 0 else 0
+    }
+
+    if 'Costo_Mensual' in df_plat.columns:
+        df_activas = df_plat[df_plat['Estado'] == 'Activada']
+        metricas['Facturación Mensual'] = df_activas['Costo_Mensual'].sum()
+        metricas['Costo Promedio por Unidad'] = df_activas['Costo_Mensual'].mean()
+
+    return metricas
+
+
+def _unidades_por_cliente(df_plat):
+    """Total de unidades y unidades activas por cliente."""
+    por_cliente = df_plat.assign(Activa=df_plat['Estado'] == 'Activada').groupby('Cliente_Cuenta', observed=True).agg(
+        Total=('Activa', 'size'),
+        Activas=('Activa', 'sum')
+    ).reset_index()
+    return completar_unidades_por_cliente(por_cliente)
+
+
+def completar_unidades_por_cliente(por_cliente):
+    """Nombres finales y % de activas de los conteos (cliente, total, activas) ordenados por cliente."""
+    por_cliente = por_cliente.copy()
+    por_cliente.columns = ['Cliente', 'Total Unidades', 'Unidades Activas']
+    por_cliente['% Activas'] = (por_cliente['Unidades Activas'] / por_cliente['Total Unidades'] * 100).round(1)
+    return por_cliente
+
+
+def top_clientes_plataforma(df_plat, n=10):
+    """Top clientes por total de unidades."""
+    return ordenar_top_clientes(_unidades_por_cliente(df_plat), n)
+
+
+def ordenar_top_clientes(por_cliente, n=10):
+    """Top N de la tabla por cliente según el total de unidades (a igual total, por cliente)."""
+    return por_cliente.sort_values('Total Unidades', ascending=False, kind='stable').head(n)
+
+
+def top_activos_plataforma(df_plat, n=10, minimo_unidades=5):
+    """Top clientes por % de unidades activas (con un mínimo de unidades)."""
+    return ordenar_top_activos(_unidades_por_cliente(df_plat), n, minimo_unidades)
+
+
+def ordenar_top_activos(top_activos, n=10, minimo_unidades=5):
+    """Top N de la tabla por cliente según el % de activas, entre los de al menos `minimo_unidades`."""
+    top_activos = top_activos[top_activos['Total Unidades'] >= minimo_unidades]
+    return top_activos.sort_values(['% Activas', 'Total Unidades'], ascending=[False, False]).head(n)
+
+
+def distribucion_por_tamano(df_plat, limites=categorias.LIMITES_TAMANO):
+    """Cantidad de clientes por categoría de tamaño."""
+    totales = df_plat.groupby('Cliente_Cuenta', observed=True).size()
+    categoria = categorias.categorizar_tamano(totales, limites).rename('Categoría')
+    return categoria.groupby(categoria, observed=True).size().reset_index(name='Cantidad de Clientes')
+
+
+def desactivaciones_por_mes(df):
+    """Cantidad de desactivaciones por mes (Mes como texto 'AAAA-MM')."""
+    df_temporal = df[df['Fecha_de_Desactivacion'].notna()].copy()
+    df_temporal['Fecha_de_Desactivacion'] = pd.to_datetime(df_temporal['Fecha_de_Desactivacion'], errors='coerce')
+    df_temporal['Mes'] = df_temporal['Fecha_de_Desactivacion'].dt.to_period('M')
+    desactivaciones = df_temporal.groupby('Mes').size().reset_index(name='Cantidad')
+    desactivaciones['Mes'] = desactivaciones['Mes'].astype(str)
+    return desactivaciones
+
+
+def costos_por_cliente(df):
+    """Unidades y costo total impactado por cliente, ordenado de mayor a menor."""
+    conteos = df.assign(
+        Activada=df['Estado'] == 'Activada',
+        Desactivada=df['Estado'] == 'Desactivada'
+    ).groupby('Cliente_Cuenta', observed=True).agg(
+        Unidades_Activadas=('Activada', 'sum'),
+        Unidades_Desactivadas=('Desactivada', 'sum'),
+        Total_Unidades=('Estado', 'count')
+    ).reset_index()
+    precios = df.groupby(['Cliente_Cuenta', 'Costo_Mensual'], observed=True).size().reset_index(name='Unidades')
+    return completar_costos_por_cliente(conteos, precios)
+
+
+def completar_costos_por_cliente(conteos, precios):
+    """Costo unitario, costo total impactado y orden final por cliente.
+
+    `conteos` tiene las unidades por cliente y `precios` las unidades de cada
+    cliente por costo mensual, ambos ordenados. El promedio se calcula aquí
+    (y no con la media de cada motor) para que el redondeo a centavos no
+    dependa del orden en que cada motor suma.
+    """
+    df_costos_cliente = conteos.copy()
+    importe = (precios['Costo_Mensual'] * precios['Unidades']).groupby(precios['Cliente_Cuenta'], observed=True).sum()
+    unidades = precios.groupby('Cliente_Cuenta', observed=True)['Unidades'].sum()
+    df_costos_cliente['Costo_Unitario'] = (importe / unidades).reindex(df_costos_cliente['Cliente_Cuenta']).to_numpy()
+
+    # Calcular Costo Total Impactado por Unidades Activas
+    df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Unidades_Activadas'] * df_costos_cliente['Costo_Unitario']
+
+    # Redondear los costos a dos decimales
+    df_costos_cliente['Costo_Unitario'] = df_costos_cliente['Costo_Unitario'].round(2)
+    df_costos_cliente['Costo_Total_Impactado'] = df_costos_cliente['Costo_Total_Impactado'].round(2)
+
+    # Ordenar por Costo Total Impactado Descendente
+    return df_costos_cliente.sort_values('Costo_Total_Impactado', ascending=False, kind='stable')
+
+
+def top_clientes_por_estado(df_validos, top_n):
+    """Unidades activas/desactivadas de los top N clientes por total de unidades."""
+    top_clients = df_validos.groupby(['Cliente_Cuenta', 'Estado']).agg({
+        'Nombre': 'count'
+    }).reset_index()
+    top_clients = top_clients.pivot_table(
+        index='Cliente_Cuenta',
+        columns='Estado',
+        values='Nombre',
+        aggfunc='sum',
+        fill_value=0
+    ).reset_index()
+    return completar_top_por_estado(top_clients, top_n)
+
+
+def completar_top_por_estado(top_clients, top_n):
+    """Total y top N de la tabla cliente x estado (ordenada por cliente)."""
+    top_clients = top_clients.copy()
+    if 'Activada' not in top_clients.columns:
+        top_clients['Activada'] = 0
+    if 'Desactivada' not in top_clients.columns:
+        top_clients['Desactivada'] = 0
+
+    top_clients['Total'] = top_clients['Activada'] + top_clients['Desactivada']
+    return top_clients.sort_values(['Total'], ascending=[False], kind='stable').head(top_n)
+
+
+def vista_cliente(df_cliente):
+    """Todo lo que muestra la búsqueda de un cliente, a partir de sus registros.
+
+    Devuelve un diccionario con los conteos por estado, las métricas y, si hay
+    costos integrados, el detalle de unidades (con el costo efectivo: el costo
+    mensual de las activas, 0 en las desactivadas) y la facturación por plataforma.
+    """
+    activa = df_cliente['Estado'] == 'Activada'
+    vista = {
+        'estados': df_cliente['Estado'].value_counts(),
+        'total_unidades': len(df_cliente),
+        'unidades_activas': int(activa.sum()),
+    }
+
+    if 'Costo_Mensual' in df_cliente.columns:
+        vista['facturacion'] = df_cliente.loc[activa, 'Costo_Mensual'].sum()
+        vista['costo_promedio'] = df_cliente.loc[activa, 'Costo_Mensual'].mean()
+
+        detalle = df_cliente[['Estado', 'Origen', 'Ciclo_Facturacion', 'Costo_Mensual']].copy()
+        detalle['Costo_Mensual'] = detalle['Costo_Mensual'].fillna(0)
+        detalle['Costo_Efectivo'] = detalle['Costo_Mensual'].where(activa, 0)
+        vista['detalle'] = detalle
+
+        resumen_plataforma = df_cliente[activa].groupby('Origen').agg({
+            'Estado': 'count',
+            'Costo_Mensual': 'sum'
+        }).reset_index()
+        resumen_plataforma.columns = ['Plataforma', 'Unidades Activas', 'Facturación Mensual']
+        vista['resumen_plataforma'] = resumen_plataforma
+
+    return vista
+
+
+# =====================================
+# Pipeline Completo
+# =====================================
+
+def calcular_agregados(df_validos, motor=None):
+    """Calcula todas las agregaciones de las pestañas del dashboard.
+
+    Devuelve un diccionario nombre -> DataFrame. Las tablas por plataforma se
+    concatenan con una columna 'Plataforma' para poder exportarlas juntas.
+    `motor` es un motor de motores.py (por defecto, pandas).
+    """
+    if motor is None:
+        import motores  # motores importa este módulo
+        motor = motores.MotorPandas()
+
+    agregados = {
+        'resumen_plataformas': motor.resumen_plataformas(df_validos),
+        'top_clientes': motor.top_clientes_por_estado(df_validos, 20),
+        'desactivaciones_por_mes': motor.desactivaciones_por_mes(df_validos),
+    }
+
+    tiene_costos = 'Costo_Mensual' in df_validos.columns
+    if tiene_costos:
+        agregados['costos_por_cliente'] = motor.costos_por_cliente(df_validos)
+
+    por_plataforma = {
+        'metricas_plataforma': [],
+        'top_clientes_plataforma': [],
+        'top_activos_plataforma': [],
+        'distribucion_tamano': [],
+        'desactivaciones_por_mes_plataforma': [],
+    }
+    if tiene_costos:
+        por_plataforma['costos_por_cliente_plataforma'] = []
+
+    for plataforma in sorted(df_validos['Origen'].dropna().unique()):
+        df_plat = df_validos[df_validos['Origen'] == plataforma]
+        tablas = {
+            'metricas_plataforma': pd.DataFrame([motor.metricas_plataforma(df_plat)]),
+            'top_clientes_plataforma': motor.top_clientes_plataforma(df_plat),
+            'top_activos_plataforma': motor.top_activos_plataforma(df_plat),
+            'distribucion_tamano': distribucion_por_tamano(df_plat),
+            'desactivaciones_por_mes_plataforma': motor.desactivaciones_por_mes(df_plat),
+        }
+        if tiene_costos:
+            tablas['costos_por_cliente_plataforma'] = motor.costos_por_cliente(df_plat)
+        for nombre, tabla in tablas.items():
+            por_plataforma[nombre].append(tabla.assign(Plataforma=plataforma))
+
+    for nombre, tablas in por_plataforma.items():
+        if tablas:
+            agregados[nombre] = pd.concat(tablas, ignore_index=True)
+
+    return agregados
+
+
+def cargar_validos(db_path, df_costos=None, tiempos=None, esquema=None, presupuesto_mb=None, fecha_referencia=None):
+    """Carga, valida e integra costos de un archivo SQLite (sin calcular agregados).
+
+    Devuelve (tabla, total_registros, df_validos, diagnostico). Lanza ValueError
+    si los datos no son analizables o no caben en el presupuesto de memoria
+    (ver planificar_carga). Si se pasa `tiempos`, registra en él la duración en
+    segundos de cada etapa. `fecha_referencia` se pasa a integrar_costos.
+    """
+    if tiempos is None:
+        tiempos = {}
+
+    inicio = time.perf_counter()
+    # Solo lectura: no crear un archivo vacío si la ruta no existe
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        tablas = obtener_tablas(conn)
+        if not tablas:
+            raise ValueError("No se encontraron tablas en la base de datos.")
+        tabla = seleccionar_tabla(tablas)
+        plan = planificar_carga(conn, tabla, df_costos, esquema, presupuesto_mb)
+        tiempos['plan'] = time.perf_counter() - inicio
+
+        if plan.estrategia != 'memoria':
+            # Lectura, validación y costos van juntos, bloque por bloque
+            inicio = time.perf_counter()
+            total_registros, df_validos, diagnostico = cargar_por_bloques(conn, tabla, plan, df_costos, esquema, fecha_referencia)
+            tiempos[f'carga_{plan.estrategia}'] = time.perf_counter() - inicio
+            if total_registros == 0:
+                raise ValueError("La tabla seleccionada no contiene registros.")
+            if df_validos.empty:
+                raise ValueError("No hay registros válidos para mostrar.")
+            return tabla, total_registros, df_validos, diagnostico
+
+        inicio = time.perf_counter()
+        df = leer_tabla(conn, tabla, esquema)
+    finally:
+        conn.close()
+    tiempos['carga'] = time.perf_counter() - inicio
+
+    if df.empty:
+        raise ValueError("La tabla seleccionada no contiene registros.")
+
+    inicio = time.perf_counter()
+    df_validos, diagnostico = validar_registros(df, esquema)
+    total_registros = len(df)
+    del df
+    tiempos['validacion'] = time.perf_counter() - inicio
+    if df_validos.empty:
+        raise ValueError("No hay registros válidos para mostrar.")
+
+    if df_costos is not None:
+        inicio = time.perf_counter()
+        df_validos = integrar_costos(df_validos, df_costos, fecha_referencia)
+        tiempos['costos'] = time.perf_counter() - inicio
+
+    return tabla, total_registros, df_validos, diagnostico
+
+
+def ejecutar_pipeline(db_path, df_costos=None, tiempos=None, esquema=None, motor=None):
+    """Ejecuta el mismo flujo que la 'Lógica Principal' del dashboard sobre un archivo SQLite.
+
+    Devuelve un diccionario con la tabla usada, los conteos de validación,
+    df_validos y los agregados. Lanza ValueError si los datos no son analizables.
+    Si se pasa `tiempos`, registra en él la duración en segundos de cada etapa.
+    """
+    if tiempos is None:
+        tiempos = {}
+
+    tabla, total_registros, df_validos, diagnostico = cargar_validos(db_path, df_costos, tiempos, esquema)
+
+    inicio = time.perf_counter()
+    agregados = calcular_agregados(df_validos, motor)
+    agregados['rechazos'] = diagnostico.reporte()
+    if not diagnostico.vacio:
+        agregados['muestra_rechazos'] = diagnostico.muestra_ordenada().reset_index()
+    tiempos['agregados'] = time.perf_counter() - inicio
+
+    return {
+        'tabla': tabla,
+        'total_registros': total_registros,
+        'registros_validos': len(df_validos),
+        'df_validos': df_validos,
+        'agregados': agregados,
+    }
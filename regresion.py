@@ -0,0 +1,444 @@
+"""Pruebas de regresión de resultados y de rendimiento.
+
+Ejecuta cada etapa del análisis (lectura, validación, costos y agregaciones)
+sobre datos sintéticos fijos y compara:
+  - los resultados con las salidas de referencia guardadas en
+    regresion/referencia.json (deben coincidir exactamente, salvo redondeo
+    de punto flotante);
+  - el tiempo y la memoria máxima de cada etapa con los de referencia; una
+    etapa falla si es más lenta (o usa más memoria) que la referencia más el
+    umbral permitido;
+  - los caminos alternativos con el principal: el cálculo paralelo por
+    plataforma con el serial, y los resúmenes de la comparación entre
+    periodos con los totales calculados directamente.
+
+Uso:
+    python regresion.py                      # verificar
+    python regresion.py --umbral 0.3         # tolerar hasta 30% más de tiempo
+    python regresion.py --actualizar         # regenerar la referencia
+    python regresion.py --motor duckdb       # mismos resultados con otro motor
+
+La referencia de tiempos depende de la máquina: al cambiar de servidor, o
+tras un cambio que altere los resultados a propósito, se regenera con
+--actualizar y se revisa el diff del JSON.
+"""
+import argparse
+import json
+import math
+import statistics
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import aproximado
+import categorias
+import comparacion
+import motores
+import paralelo
+import procesamiento
+
+RUTA_REFERENCIA = Path(__file__).with_name('regresion') / 'referencia.json'
+
+FILAS = 50_000
+SEMILLA = 20240630
+# Fecha fija para el costo vigente de las unidades activas (por defecto sería hoy)
+FECHA_REFERENCIA = pd.Timestamp('2024-06-30')
+
+UMBRAL_TIEMPO = 0.5
+UMBRAL_MEMORIA = 0.25
+# Holgura mínima para que las etapas muy rápidas no fallen por ruido
+HOLGURA_SEGUNDOS = 0.05
+REPETICIONES = 5
+# Procesos del pool con el que se verifica el cálculo paralelo
+PROCESOS_PARALELO = 2
+TOLERANCIA = 1e-9
+
+
+# =====================================
+# Datos Sintéticos
+# =====================================
+
+def generar_unidades(filas=FILAS, semilla=SEMILLA):
+    """Tabla de unidades como vendría de SQLite (todo texto), con casos inválidos."""
+    rng = np.random.default_rng(semilla)
+    clientes = np.array([f"C{i:04d}" for i in range(400)] + ['0', ''], dtype=object)
+    # Pocos clientes grandes y muchos pequeños, para cubrir todas las categorías de tamaño
+    pesos = np.concatenate([1 / np.arange(1, 401) ** 0.8, [0.01, 0.005]])
+    cliente = rng.choice(clientes, filas, p=pesos / pesos.sum())
+
+    dias = rng.integers(0, 3 * 365, filas)
+    fechas = (pd.Timestamp('2021-07-01') + pd.to_timedelta(dias, unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    estado = rng.random(filas)
+    fechas = np.where(estado < 0.55, '', fechas)
+    fechas = np.where((estado >= 0.55) & (estado < 0.57), '0', fechas)
+    fechas = np.where((estado >= 0.57) & (estado < 0.575), 'sin fecha', fechas)
+
+    nombres = np.array([f"U{i:06d}" for i in range(filas)], dtype=object)
+    nombres[rng.random(filas) < 0.003] = ''
+
+    origen = rng.choice(np.array(['Gurtam', 'Wialon', 'Traccar', 'Otro'], dtype=object), filas, p=[0.4, 0.3, 0.2, 0.1])
+    origen[rng.random(filas) < 0.002] = ''
+
+    return pd.DataFrame({
+        'Cliente_Cuenta': cliente,
+        'Nombre': nombres,
+        'Fecha_de_Desactivacion': fechas,
+        'Origen': origen,
+    })
+
+
+def generar_costos(semilla=SEMILLA):
+    """Hojas de costos (con historial, monedas y filas inválidas) y de tipos de cambio."""
+    rng = np.random.default_rng(semilla + 1)
+    filas = []
+    for i in range(380):
+        cuenta = f"C{i:04d}"
+        tipo = ['Mensual', 'Mensual', 'Anual', 'Semestral', 'Raro'][i % 5]
+        moneda = 'MXN' if i % 7 == 0 else 'USD'
+        base = float(rng.integers(5, 60)) * (18 if moneda == 'MXN' else 1)
+        filas.append({'Cuenta': cuenta, 'Costo': f"${base:,.2f}", 'Tipo': tipo, 'Vigente_Desde': '', 'Moneda': moneda})
+        if i % 3 == 0:
+            filas.append({'Cuenta': cuenta, 'Costo': base * 1.1, 'Tipo': tipo, 'Vigente_Desde': '2023-01-01', 'Moneda': moneda})
+    filas += [
+        {'Cuenta': 'C0390', 'Costo': -5, 'Tipo': 'Mensual', 'Vigente_Desde': '', 'Moneda': 'USD'},
+        {'Cuenta': 'C0391', 'Costo': 'abc', 'Tipo': 'Mensual', 'Vigente_Desde': '', 'Moneda': 'USD'},
+        {'Cuenta': '', 'Costo': 10, 'Tipo': 'Mensual', 'Vigente_Desde': '', 'Moneda': 'USD'},
+        {'Cuenta': 'C0392', 'Costo': 10, 'Tipo': 'Mensual', 'Vigente_Desde': '', 'Moneda': 'EUR'},
+    ]
+    tipos_cambio = pd.DataFrame({
+        'Moneda': ['MXN', 'MXN'],
+        'Tasa': [0.05, 0.058],
+        'Vigente_Desde': ['2020-01-01', '2023-01-01'],
+    })
+    return pd.DataFrame(filas), tipos_cambio
+
+
+# =====================================
+# Etapas
+# =====================================
+
+def snapshots(df):
+    """Dos periodos derivados de `df`: el anterior sin las primeras unidades y
+    con otro estado en algunas, el actual sin las últimas."""
+    anterior = df.iloc[300:].copy()
+    cambiar = np.arange(len(anterior)) % 7 == 0
+    anterior.loc[cambiar, 'Estado'] = np.where(anterior.loc[cambiar, 'Estado'] == 'Activada', 'Desactivada', 'Activada')
+    return anterior, df.iloc[:-500]
+
+
+def etapas(ruta_db, costos_crudos, tipos_cambio, motor, executor):
+    """Lista ordenada de (nombre, función(resultados) -> resultado)."""
+    def lectura(r):
+        conn = sqlite3.connect(ruta_db)
+        try:
+            return procesamiento.leer_tabla(conn, 'main')
+        finally:
+            conn.close()
+
+    def por_plataforma(funcion):
+        def calcular(r):
+            df = r['costos']
+            return {plataforma: funcion(df[df['Origen'] == plataforma]) for plataforma in sorted(df['Origen'].dropna().unique())}
+        return calcular
+
+    def comparar(r):
+        anterior, actual = snapshots(r['costos'])
+        return comparacion.comparar_par(comparacion.resumen_snapshot(anterior), comparacion.resumen_snapshot(actual))
+
+    return [
+        ('lectura', lectura),
+        ('validacion', lambda r: procesamiento.validar_registros(r['lectura'])),
+        ('limpieza_costos', lambda r: procesamiento.limpiar_costos(costos_crudos, None, tipos_cambio)),
+        ('costos', lambda r: procesamiento.integrar_costos(
+            r['validacion'][0], r['limpieza_costos'][0], fecha_referencia=FECHA_REFERENCIA
+        )),
+        ('resumen_plataformas', lambda r: motor.resumen_plataformas(r['costos'])),
+        ('costos_por_cliente', lambda r: motor.costos_por_cliente(r['costos'])),
+        ('desactivaciones_por_mes', lambda r: motor.desactivaciones_por_mes(r['costos'])),
+        ('top_clientes_por_estado', lambda r: motor.top_clientes_por_estado(r['costos'], 20)),
+        ('metricas_plataforma', por_plataforma(motor.metricas_plataforma)),
+        ('top_clientes_plataforma', por_plataforma(motor.top_clientes_plataforma)),
+        ('top_activos_plataforma', por_plataforma(motor.top_activos_plataforma)),
+        ('distribucion_por_tamano', por_plataforma(procesamiento.distribucion_por_tamano)),
+        ('conteos_por_cliente', lambda r: categorias.conteos_por_cliente(r['costos'])),
+        ('distribucion_tamano', lambda r: categorias.distribucion_tamano(r['conteos_por_cliente'])),
+        ('histograma_costo', lambda r: categorias.histograma_costo(r['conteos_por_cliente'])),
+        ('resumen_aproximado', lambda r: aproximado.resumen_aproximado(r['costos'], fraccion=0.2, minimo=500)),
+        ('comparacion', comparar),
+        ('paralelo', lambda r: paralelo.analizar_plataformas(r['costos'], executor)),
+    ]
+
+
+def salida_comparable(nombre, resultado):
+    """Reduce el resultado de una etapa a lo que se compara con la referencia."""
+    if nombre == 'lectura':
+        return {'filas': len(resultado), 'columnas': list(resultado.columns)}
+    if nombre == 'validacion':
+        df_validos, diagnostico = resultado
+        return {
+            'validos': len(df_validos),
+            'estados': df_validos['Estado'].value_counts().sort_index(),
+            'rechazos': diagnostico.reporte().sort_values('Motivo').reset_index(drop=True),
+        }
+    if nombre == 'limpieza_costos':
+        df_costos, rechazados = resultado
+        return {
+            'costos': df_costos[['Cuenta', 'Costo', 'Tipo', 'Vigente_Desde', 'Moneda']],
+            'rechazos': rechazados['Motivo'].value_counts().sort_index(),
+        }
+    if nombre == 'costos':
+        # Totales por plataforma y ciclo: cubren cada costo mensual y pérdida sin guardar todas las filas
+        return resultado.groupby(['Origen', 'Ciclo_Facturacion']).agg(
+            Unidades=('Estado', 'size'),
+            Costo_Mensual=('Costo_Mensual', 'sum'),
+            Perdida_Por_Desactivacion=('Perdida_Por_Desactivacion', 'sum'),
+            Sin_Costo=('Costo_Mensual', lambda x: int(x.isna().sum())),
+        ).reset_index()
+    if nombre == 'conteos_por_cliente':
+        # Tabla intermedia: sus clasificaciones se comparan en distribucion_tamano e histograma_costo
+        return resultado.groupby('Origen').agg(
+            Clientes=('Cliente_Cuenta', 'size'),
+            Total_Unidades=('Total_Unidades', 'sum'),
+            Costo_Impactado=('Costo_Impactado', 'sum'),
+        ).reset_index()
+    if nombre == 'paralelo':
+        return {f"{analisis}/{plataforma}": valor for (analisis, plataforma), valor in sorted(resultado.items())}
+    return resultado
+
+
+# =====================================
+# Paridad entre Caminos
+# =====================================
+
+def _paridad_paralelo(resultado, mediciones):
+    """Cada análisis paralelo debe coincidir con el mismo análisis serial."""
+    df = mediciones['costos'][0]
+    problemas = []
+    for (analisis, plataforma), valor in sorted(resultado.items()):
+        serial = getattr(procesamiento, analisis)(df[df['Origen'] == plataforma])
+        problemas += diferencias(serializar(serial), serializar(valor), f"paralelo/{analisis}/{plataforma}")
+    return problemas
+
+
+def _paridad_comparacion(resultado, mediciones):
+    """Los resúmenes de cada periodo deben cuadrar con los totales directos."""
+    problemas = []
+    anterior, actual = snapshots(mediciones['costos'][0])
+    for periodo, df in (('anterior', anterior), ('actual', actual)):
+        activa = df['Estado'] == 'Activada'
+        directo = pd.DataFrame({
+            'Origen': df['Origen'],
+            'Total_Unidades': 1,
+            'Unidades_Activas': activa,
+            'MRR': df['Costo_Mensual'].fillna(0).where(activa, 0.0),
+        }).groupby('Origen').sum().reset_index()
+        resumen = comparacion.resumen_snapshot(df)['plataformas']
+        problemas += diferencias(serializar(directo), serializar(resumen), f"comparacion/{periodo}")
+
+    # Cada unidad que cambia, aparece o se retira suma su activación o desactivación al neto
+    neto = int(resultado['movimiento']['Neto'].sum())
+    esperado = int((actual['Estado'] == 'Activada').sum() - (anterior['Estado'] == 'Activada').sum())
+    if neto != esperado:
+        problemas.append(f"comparacion/movimiento: neto {neto}, esperado {esperado} (diferencia de unidades activas)")
+    return problemas
+
+
+PARIDADES = {
+    'paralelo': _paridad_paralelo,
+    'comparacion': _paridad_comparacion,
+}
+
+
+def serializar(valor):
+    """Convierte un resultado a estructuras JSON (DataFrames en orientación 'split')."""
+    if isinstance(valor, pd.DataFrame):
+        return json.loads(valor.to_json(orient='split', index=False, date_format='iso', double_precision=15))
+    if isinstance(valor, pd.Series):
+        return serializar(valor.rename_axis('indice').reset_index())
+    if isinstance(valor, dict):
+        return {str(clave): serializar(v) for clave, v in valor.items()}
+    if isinstance(valor, (np.integer, np.floating)):
+        return valor.item()
+    return valor
+
+
+def diferencias(esperado, obtenido, ruta=''):
+    """Lista de diferencias entre dos estructuras serializadas (flotantes con tolerancia)."""
+    if isinstance(esperado, float) or isinstance(obtenido, float):
+        if esperado is None or obtenido is None:
+            return [] if esperado is obtenido else [f"{ruta}: esperado {esperado}, obtenido {obtenido}"]
+        if math.isclose(esperado, obtenido, rel_tol=TOLERANCIA, abs_tol=TOLERANCIA):
+            return []
+        return [f"{ruta}: esperado {esperado}, obtenido {obtenido}"]
+    if isinstance(esperado, dict) and isinstance(obtenido, dict):
+        if set(esperado) != set(obtenido):
+            return [f"{ruta}: claves esperadas {sorted(esperado)}, obtenidas {sorted(obtenido)}"]
+        return [d for clave in esperado for d in diferencias(esperado[clave], obtenido[clave], f"{ruta}/{clave}")]
+    if isinstance(esperado, list) and isinstance(obtenido, list):
+        if len(esperado) != len(obtenido):
+            return [f"{ruta}: {len(esperado)} elementos esperados, {len(obtenido)} obtenidos"]
+        return [d for i, (e, o) in enumerate(zip(esperado, obtenido)) for d in diferencias(e, o, f"{ruta}[{i}]")]
+    return [] if esperado == obtenido else [f"{ruta}: esperado {esperado!r}, obtenido {obtenido!r}"]
+
+
+# =====================================
+# Medición
+# =====================================
+
+def medir(lista_etapas, repeticiones):
+    """Ejecuta las etapas en orden. Devuelve {nombre: (resultado, segundos, pico_mb)}.
+
+    El tiempo es la mediana de `repeticiones` ejecuciones (una ejecución
+    aislada lenta o rápida no la mueve); la memoria se mide en una ejecución
+    aparte con tracemalloc, que hace más lento el código medido.
+    """
+    resultados = {}
+    mediciones = {}
+    for nombre, funcion in lista_etapas:
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion(resultados)
+            tiempos.append(time.perf_counter() - inicio)
+
+        tracemalloc.start()
+        try:
+            funcion(resultados)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        resultados[nombre] = resultado
+        mediciones[nombre] = (resultado, statistics.median(tiempos), pico / 1024 / 1024)
+    return mediciones
+
+
+def ejecutar(repeticiones, motor):
+    """Genera los datos sintéticos, ejecuta las etapas y devuelve las mediciones."""
+    unidades = generar_unidades()
+    costos_crudos, tipos_cambio = generar_costos()
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_db = Path(directorio) / 'regresion.db'
+        conn = sqlite3.connect(ruta_db)
+        try:
+            unidades.to_sql('main', conn, index=False)
+        finally:
+            conn.close()
+        executor = paralelo.crear_pool(PROCESOS_PARALELO)
+        try:
+            return medir(etapas(ruta_db, costos_crudos, tipos_cambio, motor, executor), repeticiones)
+        finally:
+            executor.shutdown()
+
+
+# =====================================
+# Ejecución
+# =====================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Verifica que las etapas del análisis den los mismos resultados y no sean más lentas que la referencia."
+    )
+    parser.add_argument("--actualizar", action="store_true", help="Regenera la referencia con los resultados y tiempos actuales")
+    parser.add_argument(
+        "--umbral",
+        type=float,
+        default=UMBRAL_TIEMPO,
+        help=f"Aumento de tiempo tolerado por etapa (por defecto: {UMBRAL_TIEMPO:.0%})"
+    )
+    parser.add_argument(
+        "--umbral-memoria",
+        type=float,
+        default=UMBRAL_MEMORIA,
+        help=f"Aumento de memoria máxima tolerado por etapa (por defecto: {UMBRAL_MEMORIA:.0%})"
+    )
+    parser.add_argument(
+        "--repeticiones",
+        type=int,
+        default=REPETICIONES,
+        help=f"Ejecuciones por etapa para medir el tiempo, se usa la mediana (por defecto: {REPETICIONES})"
+    )
+    parser.add_argument(
+        "--motor",
+        choices=motores.MOTORES,
+        default='pandas',
+        help="Motor de las agregaciones; la referencia se genera con pandas (por defecto: pandas)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        motor = motores.obtener_motor(args.motor)
+    except ValueError as e:
+        print(f"❌ {str(e)}", file=sys.stderr)
+        return 1
+    if args.actualizar and motor.nombre != 'pandas':
+        print("❌ La referencia se genera con el motor pandas", file=sys.stderr)
+        return 1
+
+    mediciones = ejecutar(max(1, args.repeticiones), motor)
+
+    if args.actualizar:
+        referencia = {
+            'filas': FILAS,
+            'semilla': SEMILLA,
+            'etapas': {
+                nombre: {
+                    'segundos': round(segundos, 4),
+                    'pico_mb': round(pico_mb, 2),
+                    'salida': serializar(salida_comparable(nombre, resultado)),
+                }
+                for nombre, (resultado, segundos, pico_mb) in mediciones.items()
+            },
+        }
+        RUTA_REFERENCIA.parent.mkdir(parents=True, exist_ok=True)
+        with open(RUTA_REFERENCIA, 'w', encoding='utf-8') as f:
+            json.dump(referencia, f, ensure_ascii=False, indent=1)
+            f.write('\n')
+        print(f"📝 Referencia actualizada: {RUTA_REFERENCIA} ({len(mediciones)} etapas)")
+        return 0
+
+    if not RUTA_REFERENCIA.exists():
+        print(f"❌ No existe la referencia {RUTA_REFERENCIA}; genérela con --actualizar", file=sys.stderr)
+        return 1
+    with open(RUTA_REFERENCIA, encoding='utf-8') as f:
+        referencia = json.load(f)
+
+    fallas = 0
+    for nombre, (resultado, segundos, pico_mb) in mediciones.items():
+        esperado = referencia['etapas'].get(nombre)
+        if esperado is None:
+            print(f"⚠️ {nombre}: sin referencia (ejecute --actualizar)")
+            continue
+
+        problemas = diferencias(esperado['salida'], serializar(salida_comparable(nombre, resultado)), nombre)
+        if nombre in PARIDADES:
+            problemas += PARIDADES[nombre](resultado, mediciones)
+        presupuesto = max(esperado['segundos'] * (1 + args.umbral), esperado['segundos'] + HOLGURA_SEGUNDOS)
+        if segundos > presupuesto:
+            problemas.append(f"{segundos:.3f}s supera el presupuesto de {presupuesto:.3f}s (referencia {esperado['segundos']:.3f}s)")
+        presupuesto_mb = max(esperado['pico_mb'] * (1 + args.umbral_memoria), esperado['pico_mb'] + 1)
+        if pico_mb > presupuesto_mb:
+            problemas.append(f"{pico_mb:.1f} MB supera el presupuesto de {presupuesto_mb:.1f} MB (referencia {esperado['pico_mb']:.1f} MB)")
+
+        if problemas:
+            fallas += 1
+            print(f"❌ {nombre}: {segundos:.3f}s, {pico_mb:.1f} MB")
+            for problema in problemas[:10]:
+                print(f"   - {problema}")
+            if len(problemas) > 10:
+                print(f"   ... y {len(problemas) - 10} diferencias más")
+        else:
+            print(f"✅ {nombre}: {segundos:.3f}s (presupuesto {presupuesto:.3f}s), {pico_mb:.1f} MB")
+
+    print(f"📊 {len(mediciones) - fallas}/{len(mediciones)} etapas sin regresiones")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Reporte por lotes sin navegador.
+
+Ejecuta el mismo pipeline que el dashboard (selección de tabla, validación,
+integración de costos y agregaciones de todas las pestañas) sobre uno o varios
+archivos SQLite y escribe, por cada uno, un HTML estático y las tablas en Parquet.
+
+Uso:
+    python reporte.py fleet_a.db fleet_b.db --costos costos.xlsx --salida reportes
+"""
+import argparse
+import hashlib
+import html
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import motores
+import procesamiento
+from esquema import cargar_esquemas
+
+
+# =====================================
+# Construcción del Reporte
+# =====================================
+
+def _figuras(agregados):
+    """Gráficos principales del reporte (equivalentes a los del dashboard)."""
+    # Solo los procesos que generan reportes necesitan plotly
+    import plotly.express as px
+
+    figuras = []
+
+    df_resumen = agregados['resumen_plataformas']
+    df_resumen = df_resumen[df_resumen['Plataforma'] != 'TOTAL']
+    fig_barras = px.bar(
+        df_resumen,
+        x='Plataforma',
+        y=['Unidades Activas', 'Unidades Desactivadas'],
+        title='Distribución de Unidades por Plataforma',
+        labels={'value': 'Número de Unidades', 'variable': 'Estado'},
+        color_discrete_map={
+            'Unidades Activas': '#00CC96',
+            'Unidades Desactivadas': '#EF553B'
+        }
+    )
+    fig_barras.update_layout(barmode='stack')
+    figuras.append(fig_barras)
+
+    desactivaciones = agregados['desactivaciones_por_mes']
+    if not desactivaciones.empty:
+        fig_tendencia = px.line(
+            desactivaciones,
+            x='Mes',
+            y='Cantidad',
+            title='Tendencia de Desactivaciones por Mes',
+            labels={'Cantidad': 'Cantidad de Desactivaciones', 'Mes': 'Mes'},
+            markers=True
+        )
+        fig_tendencia.update_layout(xaxis_tickangle=-45)
+        figuras.append(fig_tendencia)
+
+    if 'costos_por_cliente' in agregados:
+        fig_costos = px.bar(
+            agregados['costos_por_cliente'].head(20),
+            x='Cliente_Cuenta',
+            y='Costo_Total_Impactado',
+            title='Top 20 Clientes por Costo Total Impactado',
+            labels={'Costo_Total_Impactado': 'Costo Total Impactado (USD)', 'Cliente_Cuenta': 'Cliente'},
+            color='Costo_Total_Impactado',
+            color_continuous_scale='Viridis'
+        )
+        fig_costos.update_layout(xaxis_tickangle=-45)
+        figuras.append(fig_costos)
+
+    return figuras
+
+
+def _escribir_html(ruta, nombre, resultado):
+    """Escribe el HTML estático con métricas, gráficos y tablas agregadas."""
+    total = resultado['total_registros']
+    validos = resultado['registros_validos']
+    partes = [
+        "<!DOCTYPE html>",
+        "<html lang='es'><head><meta charset='utf-8'>",
+        f"<title>Dashboard de Clientes y Unidades - {html.escape(nombre)}</title>",
+        "</head><body>",
+        f"<h1>📊 Dashboard de Clientes y Unidades - {html.escape(nombre)}</h1>",
+        f"<p>Tabla analizada: <b>{html.escape(resultado['tabla'])}</b></p>",
+        "<h2>🔍 Validación de Registros</h2>",
+        "<ul>",
+        f"<li>📊 Total Registros: <b>{total:,}</b></li>",
+        f"<li>✅ Registros Válidos: <b>{validos:,}</b></li>",
+        f"<li>❌ Registros Inválidos: <b>{total - validos:,}</b></li>",
+        "</ul>",
+    ]
+
+    for i, fig in enumerate(_figuras(resultado['agregados'])):
+        # plotly.js se incluye una sola vez (desde CDN) con el primer gráfico
+        partes.append(fig.to_html(full_html=False, include_plotlyjs='cdn' if i == 0 else False))
+
+    for nombre_tabla, tabla in resultado['agregados'].items():
+        partes.append(f"<h2>{html.escape(nombre_tabla)}</h2>")
+        partes.append(tabla.to_html(index=False, float_format=lambda x: f"{x:,.2f}"))
+
+    partes.append("</body></html>")
+    ruta.write_text("\n".join(partes), encoding="utf-8")
+
+
+def directorio_reporte(db_path, salida):
+    """Directorio del reporte de `db_path`: su nombre más un hash corto de su ruta.
+
+    Dos bases con el mismo nombre en carpetas distintas no se pisan, y volver
+    a generar el reporte de una base reemplaza el anterior.
+    """
+    db_path = Path(db_path)
+    huella = hashlib.sha1(str(db_path.resolve()).encode("utf-8")).hexdigest()[:8]
+    return Path(salida) / f"{db_path.stem}_{huella}"
+
+
+def generar_reporte(db_path, salida, df_costos=None, esquema=None, motor='pandas'):
+    """Procesa un archivo SQLite y escribe su reporte. Devuelve los tiempos por etapa."""
+    db_path = Path(db_path)
+    tiempos = {}
+    inicio_total = time.perf_counter()
+
+    resultado = procesamiento.ejecutar_pipeline(
+        db_path, df_costos, tiempos=tiempos, esquema=esquema, motor=motores.obtener_motor(motor)
+    )
+
+    inicio = time.perf_counter()
+    directorio = directorio_reporte(db_path, salida)
+    directorio.mkdir(parents=True, exist_ok=True)
+    for nombre_tabla, tabla in resultado['agregados'].items():
+        tabla.to_parquet(directorio / f"{nombre_tabla}.parquet", index=False)
+    _escribir_html(directorio / "index.html", db_path.name, resultado)
+    tiempos['exportacion'] = time.perf_counter() - inicio
+
+    tiempos['total'] = time.perf_counter() - inicio_total
+    return tiempos
+
+
+def _formatear_tiempos(tiempos):
+    return ", ".join(f"{etapa}={segundos:.2f}s" for etapa, segundos in tiempos.items())
+
+
+# =====================================
+# Línea de Comandos
+# =====================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Genera el dashboard como reporte estático (HTML + Parquet) sin navegador."
+    )
+    parser.add_argument("bases", nargs="+", help="Archivos SQLite a procesar")
+    parser.add_argument("--costos", help="Archivo Excel de costos y ciclos de facturación")
+    parser.add_argument("--salida", default="reportes", help="Directorio de salida (por defecto: reportes)")
+    parser.add_argument(
+        "--procesos",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Número de procesos en paralelo (por defecto: núcleos disponibles)"
+    )
+    parser.add_argument("--esquema", help="JSON con el mapeo de columnas y reglas de limpieza (ver esquema.py)")
+    parser.add_argument(
+        "--motor",
+        choices=motores.MOTORES,
+        default=os.environ.get("LUC_MOTOR", "pandas"),
+        help="Motor de las agregaciones (por defecto: LUC_MOTOR o pandas)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        motores.obtener_motor(args.motor)
+    except ValueError as e:
+        print(f"❌ {str(e)}", file=sys.stderr)
+        return 1
+
+    esquema_unidades, esquema_costos = None, None
+    if args.esquema:
+        try:
+            esquema_unidades, esquema_costos = cargar_esquemas(args.esquema)
+        except Exception as e:
+            print(f"❌ Error al cargar el esquema: {str(e)}", file=sys.stderr)
+            return 1
+
+    # El archivo de costos se lee una sola vez y se comparte con todos los procesos
+    df_costos = None
+    if args.costos:
+        try:
+            df_costos, costos_rechazados = procesamiento.leer_costos(args.costos, esquema_costos)
+        except Exception as e:
+            print(f"❌ Error al cargar el archivo de costos: {str(e)}", file=sys.stderr)
+            return 1
+        if not costos_rechazados.empty:
+            print(f"⚠️ {len(costos_rechazados)} filas del archivo de costos rechazadas:")
+            for motivo, cantidad in costos_rechazados['Motivo'].value_counts().items():
+                print(f"   - {motivo}: {cantidad}")
+
+    errores = 0
+    inicio = time.perf_counter()
+    procesos = max(1, min(args.procesos, len(args.bases)))
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        futuros = {
+            executor.submit(generar_reporte, base, args.salida, df_costos, esquema_unidades, args.motor): base
+            for base in args.bases
+        }
+        for futuro in as_completed(futuros):
+            base = futuros[futuro]
+            try:
+                tiempos = futuro.result()
+            except Exception as e:
+                errores += 1
+                print(f"❌ {base}: {str(e)}", file=sys.stderr)
+            else:
+                print(f"✅ {base} → {directorio_reporte(base, args.salida)}: {_formatear_tiempos(tiempos)}")
+
+    print(f"📊 {len(args.bases) - errores}/{len(args.bases)} reportes generados en {time.perf_counter() - inicio:.2f}s")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
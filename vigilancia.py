@@ -0,0 +1,360 @@
+"""Vigilancia de un directorio de exportaciones SQLite, con alertas.
+
+Revisa periódicamente un directorio donde se depositan las bases de la flota
+(p. ej. una por hora). Cada archivo nuevo o modificado (detectado por fecha de
+modificación y confirmado por hash de contenido) se reduce a su resumen de
+snapshot, que se guarda en el mismo directorio de trabajo que usa el modo
+"Comparar periodos" del dashboard; los archivos que no cambiaron no se vuelven
+a leer. Cada snapshot nuevo se compara con el anterior y se emiten alertas si:
+  - las desactivaciones por hora de una plataforma superan un límite;
+  - la facturación mensual (MRR) de una plataforma, o el total, cae más de
+    un porcentaje.
+
+Las alertas se imprimen, se agregan a un archivo JSON Lines y, si se indica
+--webhook, se envían por POST como JSON.
+
+Uso:
+    python vigilancia.py /datos/flota --costos costos.xlsx --max-desactivaciones-hora 50 --caida-mrr 5
+    python vigilancia.py /datos/flota --una-vez      # una sola revisión (p. ej. desde cron)
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import pandas as pd
+
+import comparacion
+import procesamiento
+from esquema import cargar_esquemas
+
+PATRON = '*.db'
+INTERVALO_SEGUNDOS = 60
+# Un archivo modificado hace menos de esto puede estar copiándose todavía
+ESPERA_ESTABLE_SEGUNDOS = 10
+MAX_DESACTIVACIONES_HORA = 100
+CAIDA_MRR_PORCENTAJE = 10.0
+
+
+def directorio_trabajo():
+    """Mismo directorio de trabajo que el dashboard (LUC_DIR_TRABAJO)."""
+    return Path(os.environ.get("LUC_DIR_TRABAJO", Path(tempfile.gettempdir()) / "luc_app" / "trabajo"))
+
+
+def claves_archivo(ruta_db, contenido_costos=b""):
+    """(hash, clave) de la base en una sola lectura.
+
+    `hash` identifica el contenido de la base (para detectar cambios) y
+    `clave` el de la base junto con el archivo de costos: es la misma que
+    calcula el dashboard para los archivos subidos, así que los resúmenes
+    guardados aquí se reutilizan al comparar periodos.
+    """
+    h = hashlib.sha256()
+    with open(ruta_db, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    h.update(b"\0")
+    contenido = h.hexdigest()
+    h.update(contenido_costos)
+    return contenido, h.hexdigest()
+
+
+# =====================================
+# Alertas
+# =====================================
+
+def evaluar_alertas(anterior, actual, horas, max_desactivaciones_hora, caida_mrr):
+    """Alertas entre dos resúmenes de snapshot consecutivos separados por `horas`."""
+    diferencias = comparacion.comparar_par(anterior, actual)
+    alertas = []
+
+    for _, fila in diferencias['movimiento'].iterrows():
+        por_hora = fila['Desactivaciones'] / horas
+        if por_hora > max_desactivaciones_hora:
+            alertas.append({
+                'tipo': 'desactivaciones',
+                'plataforma': fila['Origen'],
+                'valor': round(float(por_hora), 2),
+                'limite': max_desactivaciones_hora,
+                'mensaje': f"{fila['Origen']}: {por_hora:,.1f} desactivaciones/hora (límite {max_desactivaciones_hora:,g})",
+            })
+
+    mrr = diferencias['mrr_plataformas'][['Origen', 'MRR_Anterior', 'MRR_Actual']]
+    total = {'Origen': 'TOTAL', 'MRR_Anterior': mrr['MRR_Anterior'].sum(), 'MRR_Actual': mrr['MRR_Actual'].sum()}
+    for fila in mrr.to_dict('records') + [total]:
+        if fila['MRR_Anterior'] <= 0:
+            continue
+        caida = (fila['MRR_Anterior'] - fila['MRR_Actual']) / fila['MRR_Anterior'] * 100
+        if caida > caida_mrr:
+            alertas.append({
+                'tipo': 'caida_mrr',
+                'plataforma': fila['Origen'],
+                'valor': round(float(caida), 2),
+                'limite': caida_mrr,
+                'mensaje': (
+                    f"{fila['Origen']}: MRR cayó {caida:.1f}% "
+                    f"(${fila['MRR_Anterior']:,.2f} → ${fila['MRR_Actual']:,.2f}, límite {caida_mrr:g}%)"
+                ),
+            })
+    return alertas
+
+
+def notificar(alertas, ruta_alertas, webhook=None):
+    """Imprime las alertas, las agrega al archivo JSON Lines y las envía al webhook."""
+    ruta_alertas.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta_alertas, 'a', encoding='utf-8') as f:
+        for alerta in alertas:
+            print(f"🚨 {alerta['snapshot']}: {alerta['mensaje']}")
+            f.write(json.dumps(alerta, ensure_ascii=False) + "\n")
+
+    if webhook and alertas:
+        solicitud = urllib.request.Request(
+            webhook,
+            data=json.dumps({'alertas': alertas}, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            urllib.request.urlopen(solicitud, timeout=10).close()
+        except OSError as e:
+            print(f"❌ No se pudo enviar las alertas al webhook: {str(e)}", file=sys.stderr)
+
+
+# =====================================
+# Vigilancia
+# =====================================
+
+class Vigilante:
+    """Estado de los archivos vistos y resúmenes procesados de un directorio.
+
+    El estado (fecha de modificación, tamaño, hash y clave del resumen de cada
+    archivo) se guarda en JSON para que un reinicio no vuelva a procesar ni a
+    alertar lo ya visto.
+    """
+
+    def __init__(self, directorio, ruta_estado, ruta_costos=None, esquemas=(None, None)):
+        self.directorio = Path(directorio)
+        self.ruta_estado = Path(ruta_estado)
+        self.ruta_costos = Path(ruta_costos) if ruta_costos else None
+        self.esquema_unidades, self.esquema_costos = esquemas
+        self._df_costos = None
+        self._firma_costos = None
+        self._contenido_costos = b""
+        self._hash_costos = None
+        self.archivos = {}
+        if self.ruta_estado.exists():
+            with open(self.ruta_estado, encoding='utf-8') as f:
+                self.archivos = json.load(f)
+
+    def _guardar_estado(self):
+        self.ruta_estado.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta_estado.with_suffix('.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.archivos, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self.ruta_estado)
+
+    def _leer_contenido_costos(self):
+        """Contenido del archivo de costos (vacío si no hay); se vuelve a leer solo si cambió."""
+        if self.ruta_costos is None:
+            return b""
+        estado = self.ruta_costos.stat()
+        firma = (estado.st_mtime_ns, estado.st_size)
+        if firma != self._firma_costos:
+            self._contenido_costos = self.ruta_costos.read_bytes()
+            self._hash_costos = hashlib.sha256(self._contenido_costos).hexdigest()
+            self._df_costos = None
+            self._firma_costos = firma
+        return self._contenido_costos
+
+    def _costos(self):
+        """Costos limpios; se vuelven a leer solo si el archivo cambió."""
+        if self.ruta_costos is None:
+            return None
+        contenido = self._leer_contenido_costos()
+        if self._df_costos is None:
+            self._df_costos, rechazados = procesamiento.leer_costos(io.BytesIO(contenido), self.esquema_costos)
+            if not rechazados.empty:
+                print(f"⚠️ {len(rechazados)} filas del archivo de costos rechazadas")
+        return self._df_costos
+
+    def _clave(self, nombre):
+        """Clave del resumen de un archivo ya visto: la guardada en el estado, salvo
+        que haya cambiado el archivo de costos (entonces se vuelve a calcular)."""
+        info = self.archivos[nombre]
+        if info.get('clave') is None or info.get('costos') != self._hash_costos:
+            info['hash'], info['clave'] = claves_archivo(self.directorio / nombre, self._leer_contenido_costos())
+            info['costos'] = self._hash_costos
+        return info['clave']
+
+    def _resumen(self, ruta, clave):
+        """Resumen del snapshot con clave `clave` guardado en el directorio de trabajo (lo calcula si falta)."""
+        # Las unidades activas toman el costo vigente a la fecha del snapshot
+        # (la de su nombre o, si no tiene, la de modificación del archivo)
+        fecha = comparacion.fecha_snapshot(ruta.name)
+        if fecha is None:
+            fecha = pd.Timestamp.fromtimestamp(ruta.stat().st_mtime).normalize()
+        directorio = directorio_trabajo() / "snapshots" / f"{clave}_{fecha:%Y%m%d}"
+        resumen = comparacion.leer_resumen(directorio)
+        if resumen is None:
+            resumen = comparacion.resumen_desde_db(
+                ruta, self._costos(), esquema=self.esquema_unidades, fecha_referencia=fecha
+            )
+            comparacion.guardar_resumen(resumen, directorio)
+        return resumen
+
+    def cambios(self, ahora=None):
+        """Archivos nuevos, modificados o con error (y ya estables), en orden de nombre.
+
+        Devuelve pares (ruta, estado) sin guardar el estado: revisar lo guarda
+        recién cuando el archivo se procesó. Solo se calcula el hash de los
+        archivos con otra fecha de modificación o tamaño (en la misma lectura que
+        la clave de su resumen); si el contenido es el mismo (p. ej. copiado de
+        nuevo) no cuenta como cambio.
+        """
+        ahora = time.time() if ahora is None else ahora
+        contenido_costos = self._leer_contenido_costos()
+        cambiados = []
+        for ruta in sorted(self.directorio.glob(PATRON)):
+            estado = ruta.stat()
+            if ahora - estado.st_mtime < ESPERA_ESTABLE_SEGUNDOS:
+                continue
+            anterior = self.archivos.get(ruta.name)
+            firma = {'mtime_ns': estado.st_mtime_ns, 'tamano': estado.st_size, 'mtime': estado.st_mtime}
+            # Los archivos que fallaron se reintentan en cada revisión
+            sin_error = anterior is not None and not anterior.get('error')
+            if sin_error and anterior['mtime_ns'] == firma['mtime_ns'] and anterior['tamano'] == firma['tamano']:
+                continue
+
+            contenido, clave = claves_archivo(ruta, contenido_costos)
+            claves = {'hash': contenido, 'clave': clave, 'costos': self._hash_costos}
+            if sin_error and anterior['hash'] == contenido:
+                anterior.update(firma, **claves)
+                continue
+            cambiados.append((ruta, {**firma, **claves, 'error': None}))
+        return cambiados
+
+    def revisar(self, max_desactivaciones_hora, caida_mrr):
+        """Una revisión del directorio. Devuelve las alertas de los snapshots nuevos."""
+        alertas = []
+        for ruta, info in self.cambios():
+            inicio = time.perf_counter()
+            try:
+                actual = self._resumen(ruta, info['clave'])
+            except Exception as e:
+                # Un archivo corrupto o a medio copiar no detiene la revisión;
+                # queda registrado con su error y no sirve de referencia
+                self.archivos[ruta.name] = {**info, 'error': str(e)}
+                print(f"❌ {ruta.name}: {str(e)}", file=sys.stderr)
+                continue
+            self.archivos[ruta.name] = info
+            print(f"✅ {ruta.name}: procesado en {time.perf_counter() - inicio:.2f}s")
+
+            # Se compara con el snapshot válido inmediatamente anterior por nombre
+            anteriores = [
+                nombre for nombre, otro in self.archivos.items()
+                if nombre < ruta.name and not otro.get('error') and (self.directorio / nombre).exists()
+            ]
+            if not anteriores:
+                continue
+            nombre_anterior = max(anteriores)
+            info_anterior = self.archivos[nombre_anterior]
+            try:
+                anterior = self._resumen(self.directorio / nombre_anterior, self._clave(nombre_anterior))
+            except Exception as e:
+                print(f"❌ {nombre_anterior}: {str(e)}", file=sys.stderr)
+                continue
+            # Con fechas de modificación inconsistentes se asume una hora entre snapshots
+            horas = (info['mtime'] - info_anterior['mtime']) / 3600
+            horas = horas if horas > 0 else 1.0
+
+            for alerta in evaluar_alertas(anterior, actual, horas, max_desactivaciones_hora, caida_mrr):
+                alerta.update({'snapshot': ruta.name, 'anterior': nombre_anterior, 'fecha': time.strftime('%Y-%m-%dT%H:%M:%S')})
+                alertas.append(alerta)
+
+        self._guardar_estado()
+        return alertas
+
+
+# =====================================
+# Línea de Comandos
+# =====================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Vigila un directorio de bases SQLite, procesa las nuevas y emite alertas."
+    )
+    parser.add_argument("directorio", help="Directorio donde se depositan las bases (*.db)")
+    parser.add_argument("--costos", help="Archivo Excel de costos y ciclos de facturación")
+    parser.add_argument("--esquema", help="JSON con el mapeo de columnas y reglas de limpieza (ver esquema.py)")
+    parser.add_argument(
+        "--intervalo",
+        type=float,
+        default=INTERVALO_SEGUNDOS,
+        help=f"Segundos entre revisiones (por defecto: {INTERVALO_SEGUNDOS})"
+    )
+    parser.add_argument("--una-vez", action="store_true", help="Hace una sola revisión y termina")
+    parser.add_argument(
+        "--max-desactivaciones-hora",
+        type=float,
+        default=MAX_DESACTIVACIONES_HORA,
+        help=f"Desactivaciones por hora y plataforma que disparan una alerta (por defecto: {MAX_DESACTIVACIONES_HORA})"
+    )
+    parser.add_argument(
+        "--caida-mrr",
+        type=float,
+        default=CAIDA_MRR_PORCENTAJE,
+        help=f"Caída porcentual del MRR que dispara una alerta (por defecto: {CAIDA_MRR_PORCENTAJE:g})"
+    )
+    parser.add_argument("--webhook", help="URL a la que se envían las alertas (POST con JSON)")
+    parser.add_argument(
+        "--estado",
+        help="Archivo JSON con los archivos ya vistos (por defecto: en el directorio de trabajo)"
+    )
+    args = parser.parse_args(argv)
+
+    directorio = Path(args.directorio)
+    if not directorio.is_dir():
+        print(f"❌ No existe el directorio {directorio}", file=sys.stderr)
+        return 1
+
+    esquemas = (None, None)
+    if args.esquema:
+        try:
+            esquemas = cargar_esquemas(args.esquema)
+        except Exception as e:
+            print(f"❌ Error al cargar el esquema: {str(e)}", file=sys.stderr)
+            return 1
+
+    # Un archivo de estado por directorio vigilado
+    base = directorio_trabajo() / "vigilancia" / hashlib.sha256(str(directorio.resolve()).encode()).hexdigest()[:16]
+    ruta_estado = Path(args.estado) if args.estado else base.with_suffix('.json')
+    ruta_alertas = base.with_suffix('.alertas.jsonl')
+    vigilante = Vigilante(directorio, ruta_estado, args.costos, esquemas)
+    print(f"👀 Vigilando {directorio} (alertas en {ruta_alertas})")
+
+    while True:
+        try:
+            alertas = vigilante.revisar(args.max_desactivaciones_hora, args.caida_mrr)
+        except Exception as e:
+            # Un error de lectura (p. ej. del archivo de costos) no detiene la vigilancia
+            print(f"❌ Error al revisar {directorio}: {str(e)}", file=sys.stderr)
+            if args.una_vez:
+                return 1
+        else:
+            notificar(alertas, ruta_alertas, args.webhook)
+        if args.una_vez:
+            return 0
+        try:
+            time.sleep(args.intervalo)
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())